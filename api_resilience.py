@@ -0,0 +1,418 @@
+# filename: api_resilience.py
+
+import collections
+import functools
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import requests
+
+# 错误分类
+RETRIABLE = "retriable"  # 超时、连接失败、服务端错误：退避后重试
+RATE_LIMITED = "rate_limited"  # 访问频率超限：等待更长时间后重试
+PERMANENT = "permanent"  # 权限、token、参数错误：重试也不会成功，直接抛出
+
+# Tushare 以 Exception(msg) 返回业务错误，按消息内容分类
+PERMANENT_MESSAGES = ("权限", "token", "参数", "不存在", "积分")
+RATE_LIMIT_MESSAGES = ("每分钟", "每小时", "频率", "最多访问")
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_logger = None
+
+
+def _get_logger():
+    # 与 tushare_transport 相同：dc 初始化时即创建客户端，日志在首次使用时再初始化
+    global _logger
+    if _logger is None:
+        from stock_utils import setup_logger
+        _logger = setup_logger("api_resilience")
+    return _logger
+
+
+class DeadlineExceeded(TimeoutError):
+    """单次调用超过截止时间"""
+
+
+class CircuitOpenError(RuntimeError):
+    """接口熔断中，请求未发出"""
+
+
+def classify_error(exc):
+    """
+    将接口异常分为可重试、频率超限、永久错误三类
+
+    :return: RETRIABLE / RATE_LIMITED / PERMANENT
+    """
+    if isinstance(exc, (DeadlineExceeded, TimeoutError, ConnectionError, requests.ConnectionError,
+                        requests.Timeout)):
+        return RETRIABLE
+    if isinstance(exc, requests.HTTPError):
+        status = exc.response.status_code if exc.response is not None else 500
+        if status == 429:
+            return RATE_LIMITED
+        return RETRIABLE if status >= 500 else PERMANENT
+    if isinstance(exc, (ValueError, TypeError, KeyError, AttributeError, CircuitOpenError)):
+        return PERMANENT
+    message = str(exc)
+    if any(word in message for word in RATE_LIMIT_MESSAGES):
+        return RATE_LIMITED
+    if any(word in message for word in PERMANENT_MESSAGES):
+        return PERMANENT
+    return RETRIABLE
+
+
+class RetryBudget(object):
+    """
+    重试预算：最近 window 秒内的重试次数不超过请求数的 ratio（另有 min_retries 的保底额度）
+
+    接口整体故障时避免所有线程同时重试，把负载放大数倍。
+    """
+
+    def __init__(self, ratio=0.2, min_retries=10, window=10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self.clock = clock
+        self._requests = collections.deque()
+        self._retries = collections.deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        for events in (self._requests, self._retries):
+            while events and events[0] < now - self.window:
+                events.popleft()
+
+    def record_request(self):
+        with self._lock:
+            now = self.clock()
+            self._trim(now)
+            self._requests.append(now)
+
+    def try_retry(self):
+        """有剩余额度时记录一次重试并返回 True"""
+        with self._lock:
+            now = self.clock()
+            self._trim(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class CircuitBreaker(object):
+    """
+    单个接口的熔断器
+
+    连续失败 failure_threshold 次后打开，reset_timeout 秒内的请求直接拒绝；
+    到期后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                _get_logger().info(f"接口 {self.name} 探测成功，熔断关闭")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    _get_logger().warning(f"接口 {self.name} 连续失败 {self.failures} 次，熔断 {self.reset_timeout}s")
+                self.state = OPEN
+                self.opened_at = self.clock()
+                self._probing = False
+
+
+class LatencyTracker(object):
+    """最近 size 次成功调用的耗时，用于计算对冲请求的触发阈值"""
+
+    def __init__(self, size=200):
+        self._samples = collections.deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, q):
+        with self._lock:
+            if not self._samples:
+                return None
+            return float(np.percentile(np.fromiter(self._samples, dtype=float), q))
+
+
+class ResilientProApi(object):
+    """
+    Tushare 客户端的容错封装，接口与 ts.pro_api() 返回的对象一致（pro.daily(...) / pro.query(...)）
+
+    - 截止时间：每次调用最多等待 deadline 秒，卡住的请求不会拖住整个阶段
+    - 错误分类：超时/连接/服务端错误退避重试，频率超限等待更久，权限/参数错误直接抛出
+    - 重试预算：全局重试次数受最近请求数比例限制
+    - 熔断：每个接口独立的熔断器，连续失败后短时间内直接拒绝
+    - 对冲请求（hedge=True）：调用耗时超过该接口历史耗时的 hedge_percentile 分位时，再发一个相同请求，取先返回的结果
+    """
+
+    def __init__(self, client, deadline=30.0, max_attempts=3, backoff_base=0.5, backoff_max=8.0,
+                 rate_limit_backoff=15.0, retry_budget_ratio=0.2, retry_budget_min=10, failure_threshold=5,
+                 reset_timeout=30.0, hedge=False, hedge_percentile=95, hedge_min_samples=20, max_workers=32,
+                 sleep=time.sleep, clock=time.monotonic):
+        """
+        :param client: 实际发出请求的客户端（PooledProApi、ts.pro_api() 或 tushare_stub.FakeProApi）
+        :param deadline: 单次调用的截止时间（秒，含对冲请求）。超时后调用方不再等待，但已发出的请求无法取消，
+            会继续占用底层客户端的并发名额及 token 配额，直到底层超时；因此 deadline 应不小于底层客户端的
+            connect_timeout + read_timeout（create_resilient_api 会按 http 配置自动调整），使孤儿请求不会比调用方活得更久
+        :param max_attempts: 最多尝试次数（含首次）
+        :param backoff_base: 指数退避的初始等待（秒），实际等待为 [0, base * 2^n] 内的随机值
+        :param backoff_max: 退避等待上限（秒）
+        :param rate_limit_backoff: 频率超限后的等待（秒）
+        :param retry_budget_ratio: 重试次数占最近请求数的比例上限
+        :param retry_budget_min: 保底重试次数
+        :param failure_threshold: 连续失败多少次后熔断
+        :param reset_timeout: 熔断持续时间（秒）
+        :param hedge: 是否启用对冲请求
+        :param hedge_percentile: 触发对冲的耗时分位数
+        :param hedge_min_samples: 接口至少有多少次成功调用后才启用对冲
+        :param max_workers: 执行请求的线程数
+        """
+        self.client = client
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limit_backoff = rate_limit_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.sleep = sleep
+        self.clock = clock
+        self.budget = RetryBudget(retry_budget_ratio, retry_budget_min, clock=clock)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tushare-call")
+        self._breakers = {}
+        self._latencies = {}
+        self._counters = collections.defaultdict(collections.Counter)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.query, name)
+
+    def _breaker(self, api_name):
+        with self._lock:
+            if api_name not in self._breakers:
+                self._breakers[api_name] = CircuitBreaker(api_name, self.failure_threshold, self.reset_timeout,
+                                                          clock=self.clock)
+                self._latencies[api_name] = LatencyTracker()
+            return self._breakers[api_name]
+
+    def _count(self, api_name, key, n=1):
+        with self._lock:
+            self._counters[api_name][key] += n
+
+    def _backoff(self, kind, attempt):
+        if kind == RATE_LIMITED:
+            return self.rate_limit_backoff
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def query(self, api_name, fields="", **kwargs):
+        breaker = self._breaker(api_name)
+        self.budget.record_request()
+        self._count(api_name, "calls")
+        last_error = None
+        for attempt in range(self.max_attempts):
+            if attempt:
+                if not self.budget.try_retry():
+                    _get_logger().warning(f"接口 {api_name} 重试预算已用完，不再重试")
+                    break
+                self._count(api_name, "retries")
+            if not breaker.allow():
+                self._count(api_name, "rejected")
+                raise CircuitOpenError(f"接口 {api_name} 熔断中，{self.reset_timeout}s 后再试") from last_error
+
+            try:
+                result = self._call(api_name, fields, kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == PERMANENT:
+                    # 请求本身有误，与接口是否可用无关，不计入熔断
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                self._count(api_name, "errors")
+                last_error = e
+                if attempt + 1 < self.max_attempts:
+                    delay = self._backoff(kind, attempt)
+                    _get_logger().warning(f"接口 {api_name} 第 {attempt + 1} 次调用失败（{kind}）：{e}，"
+                                          f"{delay:.2f}s 后重试")
+                    self.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+        raise last_error
+
+    def _timed(self, api_name, fields, kwargs):
+        start = time.perf_counter()
+        result = self.client.query(api_name, fields=fields, **kwargs)
+        return result, time.perf_counter() - start
+
+    def _call(self, api_name, fields, kwargs):
+        """发出请求并等待结果，超过截止时间抛出 DeadlineExceeded；需要时发出对冲请求"""
+        tracker = self._latencies[api_name]
+        hedge_after = None
+        if self.hedge and len(tracker) >= self.hedge_min_samples:
+            hedge_after = tracker.percentile(self.hedge_percentile)
+
+        start = self.clock()
+        primary = self._executor.submit(self._timed, api_name, fields, kwargs)
+        pending = {primary}
+        hedged = None
+        while True:
+            elapsed = self.clock() - start
+            if elapsed >= self.deadline:
+                for future in pending:
+                    future.cancel()
+                self._count(api_name, "deadline_exceeded")
+                raise DeadlineExceeded(f"接口 {api_name} 超过 {self.deadline}s 未返回")
+            timeout = self.deadline - elapsed
+            if hedge_after is not None and hedged is None:
+                timeout = min(timeout, max(hedge_after - elapsed, 0))
+
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    result, seconds = future.result()
+                    tracker.record(seconds)
+                    if future is hedged:
+                        self._count(api_name, "hedge_wins")
+                    return result
+                if not pending:
+                    raise future.exception()
+
+            if hedge_after is not None and hedged is None and pending and \
+                    self.clock() - start >= hedge_after:
+                hedged = self._executor.submit(self._timed, api_name, fields, kwargs)
+                pending.add(hedged)
+                self._count(api_name, "hedges")
+
+    def latency_percentiles(self, api_name, percentiles=(50, 95, 99)):
+        tracker = self._latencies.get(api_name)
+        return {f"p{q}": tracker.percentile(q) if tracker else None for q in percentiles}
+
+    def stats(self):
+        """各接口的调用次数、重试、失败、熔断拒绝、对冲次数、熔断状态及耗时分位数"""
+        with self._lock:
+            names = sorted(self._counters)
+        result = {}
+        for name in names:
+            item = dict(self._counters[name])
+            item["state"] = self._breakers[name].state
+            item.update(self.latency_percentiles(name))
+            result[name] = item
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        # 客户端的 __getattr__ 会把任意属性当作接口名，只调用类上定义的 close
+        if callable(getattr(type(self.client), "close", None)):
+            self.client.close()
+
+
+def create_resilient_api(client, resilience_config=None, http_config=None):
+    """
+    按 config.yaml 中 resilience 配置封装客户端
+
+    :param resilience_config: enabled 为 false 时直接返回原客户端
+    :param http_config: http 配置；deadline 小于 connect_timeout + read_timeout 时调大到该值，
+        否则超时放弃的请求仍在底层客户端中运行，重试又发出新请求，并发及配额占用会翻倍
+    """
+    resilience_config = dict(resilience_config or {})
+    if not resilience_config.pop("enabled", True):
+        return client
+    http_config = http_config or {}
+    transport_timeout = http_config.get("connect_timeout", 5) + http_config.get("read_timeout", 30)
+    deadline = resilience_config.get("deadline", 30.0)
+    if deadline < transport_timeout:
+        _get_logger().warning(f"resilience.deadline={deadline}s 小于 http 超时 {transport_timeout}s，"
+                              f"已调整为 {transport_timeout}s")
+        resilience_config["deadline"] = transport_timeout
+    return ResilientProApi(client, **resilience_config)
+
+
+def measure_latency(client, api_name, params_list, workers=8):
+    """
+    用多线程按 params_list 依次调用接口，统计每次调用的耗时分位数（秒）
+
+    :return: {'p50', 'p95', 'p99', 'max', 'errors'}
+    """
+    def call(params):
+        start = time.perf_counter()
+        try:
+            client.query(api_name, **params)
+            return time.perf_counter() - start, False
+        except Exception:
+            return time.perf_counter() - start, True
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(call, params_list))
+    seconds = np.array([item[0] for item in results])
+    return {"p50": float(np.percentile(seconds, 50)), "p95": float(np.percentile(seconds, 95)),
+            "p99": float(np.percentile(seconds, 99)), "max": float(seconds.max()),
+            "errors": sum(item[1] for item in results)}
+
+
+if __name__ == "__main__":
+    from tushare_stub import FakeProApi, make_sample_market
+
+    # 2% 的请求额外耗时 1s，模拟公网接口的长尾
+    fake = FakeProApi(make_sample_market(n_stocks=300))
+    fake.inject_latency(base=0.01, slow_ratio=0.02, slow_delay=1.0, seed=0)
+    trade_dates = sorted(fake.tables["daily"]["trade_date"].astype(str).unique())
+    params_list = [{"trade_date": d} for d in trade_dates] * 10
+
+    baseline = measure_latency(fake, "daily", params_list)
+    _get_logger().info(f"直接调用：{baseline}")
+
+    resilient = ResilientProApi(fake, deadline=5, hedge=True, hedge_percentile=95)
+    measure_latency(resilient, "daily", params_list[:50])  # 积累耗时样本
+    hedged = measure_latency(resilient, "daily", params_list)
+    _get_logger().info(f"对冲请求：{hedged}")
+    _get_logger().info(resilient.stats())
+    resilient.close()
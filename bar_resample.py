@@ -0,0 +1,184 @@
+# filename: bar_resample.py
+
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger, get_trade_cal
+from write_behind import cached_exists, read_cached_csv
+
+logger = setup_logger()
+
+# 周线/月线字段顺序与 config.yaml 中 weekly / monthly 接口一致
+BAR_FIELDS = ['ts_code', 'trade_date', 'close', 'open', 'high', 'low', 'pre_close', 'change', 'pct_chg', 'vol',
+              'amount']
+
+FREQ_API = {'W': 'weekly', 'M': 'monthly'}
+
+
+def _period_key(dates, freq):
+    """计算日期所属的周期键：周为 ISO 年+周，月为 YYYYMM"""
+    dates = pd.Series(dates, dtype=str)
+    if freq == 'W':
+        iso = pd.to_datetime(dates, format='%Y%m%d').dt.isocalendar()
+        return (iso['year'] * 100 + iso['week']).astype(int).to_numpy()
+    if freq == 'M':
+        return dates.str[:6].astype(int).to_numpy()
+    raise ValueError(f"不支持的周期: {freq}，仅支持 'W' 或 'M'")
+
+
+def get_open_dates(start_date, end_date):
+    """获取区间内的全部交易日（按本地缓存的交易日历）"""
+    years = range(int(start_date[:4]), int(end_date[:4]) + 1)
+    cal = pd.concat([get_trade_cal(year) for year in years], ignore_index=True)
+    cal = cal[(cal['is_open'] == 1) & (cal['cal_date'] >= start_date) & (cal['cal_date'] <= end_date)]
+    return sorted(cal['cal_date'].astype(str).unique())
+
+
+def get_period_trade_dates(trade_date, freq='W'):
+    """
+    获取 trade_date 所在周/月的全部交易日
+
+    :param trade_date: 交易日期（YYYYMMDD）
+    :param freq: 'W' 周，'M' 月
+    :return: 该周期内的交易日列表（升序）
+    """
+    date = datetime.datetime.strptime(trade_date, '%Y%m%d').date()
+    if freq == 'W':
+        start = date - datetime.timedelta(days=date.weekday())
+        end = start + datetime.timedelta(days=6)
+    else:
+        start = date.replace(day=1)
+        end = (start + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+
+    open_dates = get_open_dates(start.strftime('%Y%m%d'), end.strftime('%Y%m%d'))
+    key = _period_key([trade_date], freq)[0]
+    return [d for d, k in zip(open_dates, _period_key(open_dates, freq)) if k == key]
+
+
+def load_daily_bars(trade_dates):
+    """
+    读取本地缓存的日线数据，任一交易日缺失则返回 None
+
+    :param trade_dates: 交易日列表
+    :return: 拼接后的日线 DataFrame 或 None
+    """
+    frames = []
+    for trade_date in trade_dates:
+        file_path = os.path.join(dc.csv_dir, f"tushare_daily_{trade_date}.csv")
+        if not cached_exists(file_path):
+            logger.debug(f"本地日线数据缺失：{file_path}")
+            return None
+        frames.append(read_cached_csv(file_path, dtype={'trade_date': str}))
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True)
+
+
+def resample_daily_bars(daily_df, freq='W', period_end_dates=None):
+    """
+    将日线数据合成为周线/月线
+
+    open 取周期内首个交易日开盘价，close 取最后一个交易日收盘价，high/low 取极值，
+    vol/amount 求和；pre_close 取周期内首个交易日的昨收价（除权价），
+    change 与 pct_chg 由 close 和 pre_close 计算。
+
+    :param daily_df: 日线数据（可包含多个周期）
+    :param freq: 'W' 周，'M' 月
+    :param period_end_dates: {周期键: 周期最后交易日}，默认取数据中每个周期的最大交易日
+    :return: 字段与 pro.weekly / pro.monthly 一致的 DataFrame
+    """
+    df = daily_df.sort_values(['ts_code', 'trade_date'], kind='mergesort')
+    period = _period_key(df['trade_date'].to_numpy(), freq)
+
+    bars = df.groupby([period, df['ts_code'].to_numpy()], sort=False).agg(
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        pre_close=('pre_close', 'first'),
+        vol=('vol', 'sum'),
+        amount=('amount', 'sum'),
+        last_date=('trade_date', 'last'),
+    )
+    bars.index.names = ['period', 'ts_code']
+    bars = bars.reset_index()
+
+    # 周期的 trade_date 统一为该周期（按交易日历）的最后一个交易日
+    if period_end_dates is None:
+        period_end_dates = bars.groupby('period')['last_date'].max().to_dict()
+    bars['trade_date'] = bars['period'].map(period_end_dates)
+
+    bars['change'] = bars['close'] - bars['pre_close']
+    bars['pct_chg'] = np.round(bars['change'] / bars['pre_close'] * 100, 4)
+    return bars[BAR_FIELDS]
+
+
+def build_period_bars(trade_date, freq='W'):
+    """
+    使用本地日线数据合成 trade_date 所在周期的周线/月线
+
+    :param trade_date: 周期最后一个交易日
+    :param freq: 'W' 周，'M' 月
+    :return: 合成后的 DataFrame；trade_date 不是周期最后一个交易日时返回空表（与 pro.weekly / pro.monthly 一致，
+        不能用 trade_date 之后的日线合成）；周期内任一交易日的日线未缓存则返回 None
+    """
+    period_dates = get_period_trade_dates(trade_date, freq)
+    if not period_dates:
+        return None
+    if period_dates[-1] != str(trade_date):
+        logger.info(f"{trade_date} 不是所在周期的最后一个交易日（{period_dates[-1]}），没有 {FREQ_API[freq]} 数据")
+        return pd.DataFrame(columns=BAR_FIELDS)
+
+    daily_df = load_daily_bars(period_dates)
+    if daily_df is None:
+        return None
+
+    key = _period_key([period_dates[-1]], freq)[0]
+    bars = resample_daily_bars(daily_df, freq, period_end_dates={key: period_dates[-1]})
+    logger.info(f"{FREQ_API[freq]} {period_dates[-1]} 已由本地 {len(period_dates)} 个交易日的日线合成，"
+                f"股票数: {len(bars)}")
+    return bars
+
+
+def validate_against_api(trade_date, freq='W', sample=50, tolerance=0.01):
+    """
+    抽样比对本地合成的周线/月线与 pro.weekly / pro.monthly 的差异
+
+    :param trade_date: 周期最后一个交易日
+    :param freq: 'W' 周，'M' 月
+    :param sample: 抽样股票数量
+    :param tolerance: 允许的相对误差
+    :return: 每个字段的最大相对误差及超出容差的股票数 DataFrame；无法比对时返回 None
+    """
+    local_bars = build_period_bars(trade_date, freq)
+    if local_bars is None:
+        logger.warning(f"{trade_date} 所在周期的本地日线不完整，无法校验")
+        return None
+
+    api_bars = getattr(dc.pro, FREQ_API[freq])(trade_date=trade_date)
+    ts_codes = local_bars['ts_code'].sample(n=min(sample, len(local_bars)), random_state=0)
+    merged = pd.merge(local_bars[local_bars['ts_code'].isin(ts_codes)], api_bars, on='ts_code',
+                      suffixes=('_local', '_api'))
+
+    rows = []
+    for field in ['open', 'high', 'low', 'close', 'pre_close', 'pct_chg', 'vol', 'amount']:
+        local = merged[f'{field}_local'].astype(float)
+        api = merged[f'{field}_api'].astype(float)
+        rel_err = (local - api).abs() / api.abs().clip(lower=1e-9)
+        rows.append({'field': field, 'max_rel_err': rel_err.max(), 'mismatch': int((rel_err > tolerance).sum())})
+
+    report = pd.DataFrame(rows)
+    logger.info(f"{FREQ_API[freq]} {trade_date} 抽样 {len(merged)} 只股票校验结果：\n{report}")
+    return report
+
+
+if __name__ == '__main__':
+    from stock_utils import get_last_trade_date
+
+    last_trade_date = get_last_trade_date()
+    validate_against_api(last_trade_date, freq='W')
+    validate_against_api(last_trade_date, freq='M')
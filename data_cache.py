@@ -4,7 +4,6 @@ import os
 import threading
 
 import pandas as pd
-import tushare as ts
 import yaml
 
 
@@ -30,6 +29,11 @@ class Singleton(object):
         self.log_dir = self._config['paths']['log_dir']
         self.filter_dir = self._config['paths']['filter_dir']
 
+        logging_config = self._config.get('logging', {})
+        self.log_level = logging_config.get('level', 'INFO')  # 日志级别
+        self.log_summary_mode = logging_config.get('summary_mode', False)  # DataFrame 日志是否输出紧凑摘要
+        self.log_summary_max_rows = logging_config.get('summary_max_rows', 5)  # 摘要模式下输出的行数
+
         self.token = self._config["tushare"]["token"]
         if not self.token:
             try:
@@ -48,13 +52,27 @@ class Singleton(object):
         self.period_year = self._config["period_or_end_date"]["year"]  # 用于生成报告期(每个季度最后一天的日期
         self.period_quarter = self._config["period_or_end_date"]["quarter"]  # 用于生成报告期(每个季度最后一天的日期
 
+        self.filter_config = self._config.get("filter", {})  # 股票基础信息过滤条件
+        self.daemon_config = self._config.get("daemon", {})  # 常驻筛选服务配置
+        self.pagination_config = self._config.get("pagination", {})  # 大结果集分页配置
+        self.http_config = self._config.get("http", {})  # Tushare HTTP 传输配置
+        self.resilience_config = self._config.get("resilience", {})  # 接口调用容错配置
+        self.write_behind_config = self._config.get("write_behind", {})  # 缓存文件后台写入配置
+
         # 确保目录存在
         os.makedirs(self.csv_dir, exist_ok=True)
         os.makedirs(self.log_dir, exist_ok=True)
         os.makedirs(self.filter_dir, exist_ok=True)
 
-        # 初始化 Tushare API
-        self.pro = ts.pro_api(self.token)
+        # 初始化 Tushare API（默认使用连接池客户端，http.transport 为 default 时使用 tushare 自带客户端）
+        # 配置了 tushare.tokens 时每个 token 一个客户端，组成按配额及权限调度的 token 池；
+        # 外层为截止时间、重试、熔断及对冲请求的容错封装（resilience.enabled 为 false 时不封装）
+        from api_resilience import create_resilient_api  # 以下模块均不依赖 dc，可在初始化时导入
+        from token_pool import create_token_pool
+        from tushare_transport import create_pro_api
+        client = create_token_pool(self.token, self._config["tushare"],
+                                   lambda token: create_pro_api(token, self.http_config))
+        self.pro = create_resilient_api(client, self.resilience_config, self.http_config)
 
         # 构建 中文 -> 英文 字段映射
         self.zh_to_en = {}
@@ -105,11 +123,20 @@ class Singleton(object):
         tushare_api = api_info["tushare_api"]
         fields = list(api_info["fields"].keys())
 
-        df = self.pro.query(tushare_api, **params, fields=",".join(fields))
+        df = self.query_all(tushare_api, fields=",".join(fields), **params)
         return df
 
+    def query_all(self, api_name, fields="", **params):
+        """ 调用 Tushare API，超过单次行数上限时自动分页获取完整结果 """
+        from query_pager import query_all
+        return query_all(api_name, fields=fields, **params)
+
     def get_data(self, zh_name, date, params=None):
         """ 通过中文指标名获取数据（优先本地缓存，否则调用 API） """
+        from negative_cache import get_negative_cache  # 以下模块依赖 dc，延迟导入避免循环引用
+        from tracing import span
+        from write_behind import cached_exists, read_cached_csv, save_csv
+
         if params is None:
             params = {}  # 如果没有传入params，初始化为空字典
         api_name, field_name = self.find_api_and_field(zh_name)
@@ -122,18 +149,28 @@ class Singleton(object):
         params[date_field] = date  # 设置日期参数
 
         file_path = os.path.join(self.csv_dir, f"tushare_{api_name}_{date}.csv")
-
-        # 1. 读取本地缓存
-        if os.path.exists(file_path):
-            df = pd.read_csv(file_path)
-            print(f"读取本地数据: {file_path}")
-        else:
-            # 2. 本地无数据，调用 Tushare API
-            print(f"调用 Tushare API: {api_name}")
-            df = self.fetch_data(api_name, params)
-            if not df.empty:
-                df.to_csv(file_path, index=False, encoding='utf-8_sig')
-                print(f"数据已存入: {file_path}")
+        negative_cache = get_negative_cache()
+
+        with span("get_data", api=api_name, date=date):
+            # 1. 读取本地缓存（含写入队列中尚未落盘的数据）
+            if cached_exists(file_path):
+                with span("load"):
+                    df = read_cached_csv(file_path)
+                print(f"读取本地数据: {file_path}")
+            elif negative_cache.is_empty(api_name, date):
+                # 已知为空（非交易日、尚未披露等），到期前不再调用 API
+                df = pd.DataFrame()
+            else:
+                # 2. 本地无数据，调用 Tushare API
+                print(f"调用 Tushare API: {api_name}")
+                with span("fetch"):
+                    df = self.fetch_data(api_name, params)
+                if not df.empty:
+                    with span("write"):
+                        save_csv(df, file_path, index=False, encoding='utf-8_sig')
+                    print(f"数据已存入: {file_path}")
+                else:
+                    negative_cache.mark_empty(api_name, date)
 
         return df[[field_name]] if field_name in df.columns else df
 
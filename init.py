@@ -2,41 +2,47 @@ import os
 import sys
 
 from data_cache import dc
+from rank_table import build_rank_tables
 from stock_utils import setup_logger, get_last_trade_date, get_last_n_trade_dates, fetch_daily, fetch_daily_basic, \
-    fetch_stock_basic, generate_quarter_list, fetch_fina_indicator_vip_by_quarter_str
+    load_stock_basic, generate_quarter_list, fetch_fina_indicator_vip_by_quarter_str
+from tracing import span, traced
+from write_behind import cached_exists
 
 logger = setup_logger()
 
 
 def check_and_fetch(file_prefix, fetch_function, trade_dates):
     """检查 csv 是否存在，如果不存在则调用 fetch_function 生成"""
-    for trade_date in trade_dates:
-        filename = f"{file_prefix}_{trade_date}.csv"
-        full_path = os.path.join(dc.csv_dir, filename)
-
-        # 校验文件是否存在且文件内容有效
-        if not os.path.exists(full_path) or not is_valid_csv(full_path):
-            logger.info(f"{full_path} 不存在或无效，正在获取数据...")
-            try:
-                fetch_function(trade_date)
-            except Exception as e:
-                logger.error(f"获取数据失败: {e}")
-        else:
-            logger.info(f"{full_path} 已存在，跳过.")
+    with span(file_prefix, dates=len(trade_dates)):
+        for trade_date in trade_dates:
+            filename = f"{file_prefix}_{trade_date}.csv"
+            full_path = os.path.join(dc.csv_dir, filename)
+
+            # 校验文件是否存在且文件内容有效
+            if not cached_exists(full_path) or not is_valid_csv(full_path):
+                logger.info(f"{full_path} 不存在或无效，正在获取数据...")
+                try:
+                    fetch_function(trade_date)
+                except Exception as e:
+                    logger.error(f"获取数据失败: {e}")
+            else:
+                logger.info(f"{full_path} 已存在，跳过.")
 
 
 def is_valid_csv(file_path):
-    """检查 CSV 文件是否有效"""
-    return os.path.getsize(file_path) > 0
+    """检查 CSV 文件是否有效（写入队列中尚未落盘的视为有效）"""
+    return not os.path.exists(file_path) or os.path.getsize(file_path) > 0
 
 
+@traced("init")
 def main():
     try:
         last_trade_date = get_last_trade_date()
         last_20_trade_dates = get_last_n_trade_dates(n=20)
 
-        # 检查并获取股票基础信息（只执行一次）
-        check_and_fetch("tushare_stock_basic", fetch_stock_basic, [last_trade_date])
+        # 检查并获取股票基础信息（快照存储，股票列表无变化时不获取整表）
+        with span("stock_basic", date=last_trade_date):
+            load_stock_basic(last_trade_date)
 
         # 检查并获取最近 20 天的日线数据
         check_and_fetch("tushare_daily", fetch_daily, last_20_trade_dates)
@@ -44,6 +50,11 @@ def main():
         # 检查并获取最近 20 天的每日指标数据
         check_and_fetch("tushare_daily_basic", fetch_daily_basic, last_20_trade_dates)
 
+        # 预计算最近 20 天日线、每日指标的全市场及行业内排名
+        with span("rank_table", dates=len(last_20_trade_dates)):
+            for trade_date in last_20_trade_dates:
+                build_rank_tables(trade_date, tables=("daily", "daily_basic"))
+
         # 检查并获取自2023以来财报数据
         quarter_list = generate_quarter_list(2023)
         check_and_fetch("fetch_fina_indicator_vip", fetch_fina_indicator_vip_by_quarter_str, quarter_list)
@@ -0,0 +1,226 @@
+# filename: market_sql.py
+
+import csv
+import os
+import re
+import threading
+from collections import defaultdict
+
+from data_cache import dc
+from stock_utils import setup_logger
+from write_behind import flush_writes
+
+logger = setup_logger()
+
+# 缓存文件名：tushare_{表名}_{日期或报告期}[_{报告期}].csv，例如
+#   data/tushare_daily_basic_20250321.csv
+#   data/tushare_fina_indicator_vip_20241231.csv
+#   result/tushare_stock_basic_filter3_20250321_20240930.csv
+# 按股票代码保存的文件（tushare_fina_indicator_vip_000001.SZ.csv）不匹配，不注册
+FILE_PATTERN = re.compile(r"^tushare_(?P<table>[a-z0-9_]+?)_(?P<date>\d{8}|\d{4})(?:_(?P<period>\d{8}))?\.csv$")
+
+# 分区列：取自文件名，按分区列过滤时只读取匹配的文件
+DATE_COLUMN = "_date"
+PERIOD_COLUMN = "_period"
+PARTITION_REGEX = r"_(\d{8}|\d{4})(?:_(\d{8}))?\.csv$"
+
+# 推断列类型时读取的最近文件数
+TYPE_SAMPLE_FILES = 3
+
+
+def _is_text_column(name):
+    """股票代码及日期列按字符串读取，与其他模块中 ts_code / trade_date 的比较方式一致"""
+    return name == "ts_code" or name.endswith("date")
+
+
+def _read_header(path):
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _quote(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class MarketSQL(object):
+    """
+    本地行情/财务缓存上的嵌入式 SQL 查询（DuckDB）
+
+    data/ 与 result/ 下每类缓存文件注册为一个视图（如 daily、daily_basic、fina_indicator_vip、
+    stock_basic_filter4），每个文件是一个分区，文件名中的日期为 _date 列（filter3 的报告期为 _period 列）：
+      - 按 _date / _period 过滤时，不匹配的文件不会被读取
+      - 只读取查询用到的列
+      - 由 DuckDB 多线程执行，不需要先读入 pandas
+    """
+
+    def __init__(self, dirs=None, threads=None):
+        """
+        :param dirs: 扫描的目录，默认 data/ 与 result/
+        :param threads: DuckDB 线程数，默认使用全部 CPU
+        """
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError("market_sql 需要 duckdb：pip install duckdb")
+
+        self.dirs = list(dirs or [dc.csv_dir, dc.filter_dir])
+        self._con = duckdb.connect(":memory:")
+        if threads:
+            self._con.execute(f"SET threads = {int(threads)}")
+        self._lock = threading.Lock()
+        self.partitions = {}  # 视图名 -> [(分区值, 报告期, 文件路径)]
+        self.refresh()
+
+    def _scan(self):
+        flush_writes()  # DuckDB 直接读取目录中的文件，先等写入队列落盘
+        partitions = defaultdict(list)
+        for directory in self.dirs:
+            if not os.path.isdir(directory):
+                continue
+            for name in os.listdir(directory):
+                match = FILE_PATTERN.match(name)
+                if match and os.path.getsize(os.path.join(directory, name)) > 0:
+                    partitions[match.group("table")].append(
+                        (match.group("date"), match.group("period"), os.path.join(directory, name)))
+        return {table: sorted(files) for table, files in partitions.items()}
+
+    def _infer_types(self, paths):
+        """
+        由若干文件（从新到旧）推断列类型，所有分区按同一类型读取
+
+        某个文件整列为空时该列被推断为 VARCHAR，以其他文件推断出的类型为准，避免整个视图的该列变为字符串；
+        表头不同的文件（如早于 sid 列的缓存）使用同一套类型。
+        """
+        types = {}
+        for path in paths:
+            rows = self._con.execute(f"DESCRIBE SELECT * FROM read_csv({_quote(path)})").fetchall()
+            for name, column_type, *_ in rows:
+                if _is_text_column(name):
+                    types[name] = "VARCHAR"
+                elif types.get(name, "VARCHAR") == "VARCHAR":
+                    types[name] = column_type
+                elif {types[name], column_type} == {"BIGINT", "DOUBLE"}:
+                    types[name] = "DOUBLE"  # 整数与小数混合时按小数读取
+        return types
+
+    def _view_sql(self, files):
+        """
+        表头相同的文件用一个 read_csv 读取（指定列类型，不再逐个文件推断），不同表头的文件按列名合并
+
+        分区列由 filename 计算，DuckDB 会在读取前按文件名过滤文件。
+        """
+        groups = defaultdict(list)
+        for _, period, path in files:
+            groups[tuple(_read_header(path))].append((period, path))
+
+        # 最近几个文件及每组表头最新的文件参与推断
+        samples = [path for _, _, path in files[::-1][:TYPE_SAMPLE_FILES]]
+        samples += [group[-1][1] for group in groups.values() if group[-1][1] not in samples]
+        types = self._infer_types(samples)
+
+        parts = []
+        for header, group in groups.items():
+            columns = ", ".join(f"{_quote(col)}: {_quote(types.get(col, 'VARCHAR'))}" for col in header)
+            paths = ", ".join(_quote(path) for _, path in group)
+            partition = f"regexp_extract(filename, '{PARTITION_REGEX}', 1) AS {DATE_COLUMN}"
+            if any(period is not None for period, _ in group):
+                partition += f", regexp_extract(filename, '{PARTITION_REGEX}', 2) AS {PERIOD_COLUMN}"
+            parts.append(f"SELECT {partition}, * EXCLUDE (filename) FROM read_csv([{paths}], header = true, "
+                         f"auto_detect = false, columns = {{{columns}}}, filename = true)")
+        return "\nUNION ALL BY NAME\n".join(parts)
+
+    def refresh(self):
+        """重新扫描缓存目录并重建视图（新增交易日数据后调用）"""
+        partitions = self._scan()
+        with self._lock:
+            for table, files in partitions.items():
+                self._con.execute(f'CREATE OR REPLACE VIEW "{table}" AS {self._view_sql(files)}')
+            self.partitions = partitions
+        logger.info(f"已注册 {len(partitions)} 个视图：" +
+                    "，".join(f"{table}({len(files)})" for table, files in sorted(partitions.items())))
+        return {table: len(files) for table, files in partitions.items()}
+
+    def tables(self):
+        return sorted(self.partitions)
+
+    def dates(self, table, n=None):
+        """视图已有的分区日期（升序），n 为只取最近 n 个"""
+        dates = sorted({date for date, _, _ in self.partitions.get(table, [])})
+        return dates[-n:] if n else dates
+
+    def register_frame(self, name, df):
+        """将 DataFrame 复制为表（对所有游标可见），例如快照存储还原的 stock_basic"""
+        with self._lock:
+            self._con.register("_frame", df)
+            try:
+                self._con.execute(f'CREATE OR REPLACE TABLE "{name}" AS SELECT * FROM _frame')
+            finally:
+                self._con.unregister("_frame")
+
+    def register_stock_basic(self, trade_date, name="stock_basic"):
+        """注册某交易日的股票基础信息（由快照存储还原，不调用接口）"""
+        from snapshot_store import get_snapshot_store
+
+        df = get_snapshot_store("stock_basic").load(trade_date)
+        if df is None:
+            raise ValueError(f"快照存储中没有 {trade_date} 的股票基础信息")
+        df["ts_code"] = df["ts_code"].astype(str)
+        self.register_frame(name, df)
+        return len(df)
+
+    def query(self, sql, params=None):
+        """
+        执行 SQL 并返回 DataFrame（只有结果集会转换为 pandas）
+
+        :param sql: SQL，参数用 ? 占位
+        :param params: 参数列表
+        """
+        with self._lock:
+            cursor = self._con.cursor()  # 每次查询单独的游标，可在多个线程中同时查询
+        try:
+            return cursor.execute(sql, params or []).df()
+        finally:
+            cursor.close()
+
+    def explain(self, sql, params=None):
+        """查看执行计划，确认只读取了需要的分区和列"""
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            return "\n".join(row[-1] for row in cursor.execute(f"EXPLAIN {sql}", params or []).fetchall())
+        finally:
+            cursor.close()
+
+    def close(self):
+        self._con.close()
+
+
+# 示例：最近 N 个交易日中至少 M 天换手率超过阈值的股票
+TURNOVER_DAYS_SQL = f"""
+SELECT ts_code, count(*) AS days, max(turnover_rate) AS max_turnover_rate
+FROM daily_basic
+WHERE {DATE_COLUMN} >= ? AND turnover_rate > ?
+GROUP BY ts_code
+HAVING count(*) >= ?
+ORDER BY days DESC, max_turnover_rate DESC
+"""
+
+# 示例：filter2（流通市值）在全部历史交易日上一次完成
+CIRC_MV_HISTORY_SQL = f"""
+SELECT b.{DATE_COLUMN} AS trade_date, b.ts_code, b.circ_mv
+FROM daily_basic b
+JOIN stock_basic s USING (ts_code)
+WHERE b.{DATE_COLUMN} BETWEEN ? AND ? AND b.circ_mv <= ?
+ORDER BY trade_date, b.circ_mv DESC
+"""
+
+
+if __name__ == "__main__":
+    from stock_utils import get_last_trade_date
+
+    sql = MarketSQL()
+    logger.info(sql.query(TURNOVER_DAYS_SQL, [sql.dates("daily_basic", 10)[0], 5, 3]))
+
+    last_trade_date = get_last_trade_date()
+    sql.register_stock_basic(last_trade_date)
+    logger.info(sql.query(CIRC_MV_HISTORY_SQL, ["20250101", last_trade_date, dc.circ_mv]))
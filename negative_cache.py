@@ -0,0 +1,250 @@
+# filename: negative_cache.py
+
+import datetime
+import json
+import os
+import threading
+
+from data_cache import dc
+from stock_utils import setup_logger, get_trade_cal
+
+logger = setup_logger()
+
+# 行情数据当日最晚入库时间（Tushare 日线通常在 15:00 ~ 17:00 之间入库）
+DAILY_PUBLISH_TIME = datetime.time(17, 0)
+# 已过预期入库时间仍为空时的重试间隔
+RETRY_AFTER = datetime.timedelta(hours=1)
+# 当日入库时间之前为空时的重试间隔：实际多在 15:00 ~ 16:00 入库，不能一直等到 17:00
+SAME_DAY_RETRY_AFTER = datetime.timedelta(minutes=10)
+# 已过法定披露截止日仍为空的报告期，隔多久再查一次
+LATE_PERIOD_RETRY_AFTER = datetime.timedelta(days=7)
+
+# 报告期 -> (截止日期所在年份偏移, 截止月日)：一季报 4 月底、半年报 8 月底、三季报 10 月底、年报次年 4 月底
+PERIOD_DEADLINES = {
+    "0331": (0, "0430"),
+    "0630": (0, "0831"),
+    "0930": (0, "1031"),
+    "1231": (1, "0430"),
+}
+
+# 按报告期查询的接口（config.yaml 中 date_field 为 end_date 的接口也按报告期处理）；
+# fina_indicator_vip_history 为全部版本财务数据使用的独立缓存键
+PERIOD_APIS = {"fina_indicator_vip", "fina_indicator_vip_history", "fina_indicator", "income", "balancesheet",
+               "cashflow"}
+# 按交易日查询的接口
+TRADE_DATE_APIS = {"daily", "daily_basic", "weekly", "monthly"}
+
+
+def _date_kind(api_name):
+    api_info = dc._config.get("apis", {}).get(api_name, {})
+    if api_name in PERIOD_APIS or api_info.get("date_field") == "end_date":
+        return "period"
+    if api_name in TRADE_DATE_APIS or api_info.get("date_field") == "trade_date":
+        return "trade_date"
+    return None
+
+
+def is_trade_day(date_str):
+    """
+    按本地缓存的交易日历判断是否为交易日
+
+    :return: True / False；日历无法获取时返回 None
+    """
+    try:
+        cal = get_trade_cal(int(date_str[:4]))
+    except Exception as e:
+        logger.warning(f"获取 {date_str[:4]} 年交易日历失败：{e}")
+        return None
+    row = cal[cal["cal_date"].astype(str) == date_str]
+    if row.empty:
+        return None
+    return int(row["is_open"].iloc[0]) == 1
+
+
+def _next_publish(now):
+    """下一个行情入库时间：今天 17:00，已过则为明天 17:00"""
+    publish = datetime.datetime.combine(now.date(), DAILY_PUBLISH_TIME)
+    return publish if now < publish else publish + datetime.timedelta(days=1)
+
+
+def period_deadline(period):
+    """报告期法定披露截止日的次日 0 点，不是季末日期时返回 None"""
+    period = str(period)
+    if period[4:] not in PERIOD_DEADLINES:
+        return None
+    offset, deadline = PERIOD_DEADLINES[period[4:]]
+    return datetime.datetime.strptime(f"{int(period[:4]) + offset}{deadline}", "%Y%m%d") + datetime.timedelta(days=1)
+
+
+def period_refresh_due(period, fetched_at, now):
+    """
+    按报告期保存的数据是否需要重新获取
+
+    披露截止日前获取的数据可能缺少之后的公告，到下一个入库时间后重新获取；
+    截止日之后获取的一份视为完整，不再重新获取。
+    """
+    deadline = period_deadline(period)
+    if deadline is None or fetched_at >= deadline:
+        return False
+    return now >= _next_publish(fetched_at)
+
+
+def expected_publish_time(api_name, key, now):
+    """
+    空结果的失效时间
+
+    :param api_name: 接口名称
+    :param key: 交易日或报告期（YYYYMMDD）
+    :param now: 当前时间
+    :return: (失效时间, 原因)；失效时间为 None 表示永久（如非交易日）
+    """
+    key = str(key)
+    kind = _date_kind(api_name)
+    if kind == "trade_date":
+        open_day = is_trade_day(key)
+        if open_day is False:
+            return None, "非交易日"
+        day = datetime.datetime.strptime(key, "%Y%m%d").date()
+        publish = datetime.datetime.combine(day, DAILY_PUBLISH_TIME)
+        if now < publish:
+            if now.date() == day:
+                # 当日数据随时可能入库，短时间后即可重新请求
+                return min(publish, now + SAME_DAY_RETRY_AFTER), "当日数据尚未入库"
+            return publish, "数据尚未入库"
+        return now + RETRY_AFTER, "已过入库时间仍无数据"
+
+    if kind == "period" and key[4:] in PERIOD_DEADLINES:
+        period_end = datetime.datetime.strptime(key, "%Y%m%d")
+        if now < period_end + datetime.timedelta(days=1):
+            # 报告期尚未结束，最早在报告期结束后才会有披露
+            return period_end + datetime.timedelta(days=1), "报告期尚未结束"
+        deadline = period_deadline(key)
+        if now < deadline:
+            # 披露期内每天都可能有新公告，下一个入库时间再查
+            return _next_publish(now), "报告期尚未披露"
+        return now + LATE_PERIOD_RETRY_AFTER, "已过披露截止日仍无数据"
+
+    return now + RETRY_AFTER, "无数据"
+
+
+class NegativeCache(object):
+    """
+    接口空结果的缓存：记录已知为空的 (接口, 交易日/报告期)，到期前不再请求接口
+
+    - 非交易日等“永远为空”的记录永久有效
+    - 尚未入库/尚未披露的记录在预期入库时间失效
+    记录保存在 data/negative_cache.json，跨进程运行有效；clock 可注入便于测试。
+    """
+
+    def __init__(self, path=None, clock=None):
+        self.path = path or os.path.join(dc.csv_dir, "negative_cache.json")
+        self.clock = clock or datetime.datetime.now
+        self._lock = threading.Lock()
+        self._entries = self._read()
+
+    def _read(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+            except ValueError:
+                logger.warning(f"空结果缓存文件损坏，已忽略：{self.path}")
+        return {}
+
+    def _write(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def _key(api_name, key):
+        return f"{api_name}:{key}"
+
+    def get(self, api_name, key):
+        """未过期的空结果记录 {'expires', 'reason', 'created'}，没有时返回 None"""
+        cache_key = self._key(api_name, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            expires = entry.get("expires")
+            if expires is not None and self.clock() >= datetime.datetime.strptime(expires, "%Y%m%d%H%M%S"):
+                del self._entries[cache_key]
+                self._write()
+                return None
+            return entry
+
+    def is_empty(self, api_name, key):
+        """
+        (接口, 交易日/报告期) 是否已知为空
+
+        按交易日查询的接口遇到非交易日时直接记为永久为空，不必先请求一次接口。
+        """
+        entry = self.get(api_name, key)
+        if entry is None and _date_kind(api_name) == "trade_date" and is_trade_day(str(key)) is False:
+            self.mark(api_name, key, None, "非交易日")
+            entry = self.get(api_name, key)
+        if entry is not None:
+            logger.info(f"{api_name} {key} 已知无数据（{entry['reason']}），"
+                        f"{'永久有效' if entry['expires'] is None else '有效至 ' + entry['expires']}，跳过请求")
+            return True
+        return False
+
+    def mark(self, api_name, key, expires=None, reason=""):
+        """记录空结果，expires 为 None 表示永久"""
+        entry = {
+            "expires": expires.strftime("%Y%m%d%H%M%S") if expires is not None else None,
+            "reason": reason,
+            "created": self.clock().strftime("%Y%m%d%H%M%S"),
+        }
+        with self._lock:
+            self._entries[self._key(api_name, key)] = entry
+            self._write()
+        logger.info(f"{api_name} {key} 无数据（{reason}），"
+                    f"{'永久记录' if expires is None else '至 ' + entry['expires'] + ' 前不再请求'}")
+
+    def mark_empty(self, api_name, key):
+        """按交易日历及披露时间记录空结果"""
+        expires, reason = expected_publish_time(api_name, key, self.clock())
+        self.mark(api_name, key, expires, reason)
+
+    def discard(self, api_name, key):
+        """删除单条记录（例如已确认数据入库）"""
+        with self._lock:
+            if self._entries.pop(self._key(api_name, key), None) is not None:
+                self._write()
+
+    def clear(self, api_name=None):
+        """清除全部或某接口的记录"""
+        with self._lock:
+            if api_name is None:
+                self._entries = {}
+            else:
+                prefix = f"{api_name}:"
+                self._entries = {k: v for k, v in self._entries.items() if not k.startswith(prefix)}
+            self._write()
+
+
+_negative_cache = None
+_negative_cache_lock = threading.Lock()
+
+
+def get_negative_cache():
+    """获取进程内共享的空结果缓存"""
+    global _negative_cache
+    with _negative_cache_lock:
+        if _negative_cache is None:
+            _negative_cache = NegativeCache()
+        return _negative_cache
+
+
+if __name__ == "__main__":
+    cache = get_negative_cache()
+    for date in ["20250329", "20250331"]:
+        logger.info(f"daily {date}: {expected_publish_time('daily', date, datetime.datetime.now())}")
+    for period in ["20250331", "20251231"]:
+        logger.info(f"fina_indicator_vip {period}: "
+                    f"{expected_publish_time('fina_indicator_vip', period, datetime.datetime.now())}")
+    for name, item in sorted(cache._entries.items()):
+        logger.info(f"{name}: {item}")
@@ -0,0 +1,222 @@
+# filename: panel_store.py
+
+import json
+import os
+import sys
+from multiprocessing import Pool, resource_tracker, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+from write_behind import cached_exists, read_cached_csv
+
+logger = setup_logger()
+
+# 默认加载的字段：{API 名称: 字段列表}，字段名在各 API 之间不能重复
+DEFAULT_FIELDS = {
+    "daily": ["open", "high", "low", "close", "pct_chg", "vol", "amount"],
+    "daily_basic": ["turnover_rate", "volume_ratio", "pe", "pb", "total_mv", "circ_mv"],
+}
+
+_worker_store = None  # 子进程中挂载的面板
+
+
+class PanelStore(object):
+    """
+    股票 × 日期 × 字段 的 float64 面板
+
+    数据按 (字段, 日期, 股票) 的 C 顺序连续存放：每个字段是一块连续内存，
+    某一日期的全市场截面 data[f, d, :] 也是连续的，截面筛选时无需跨步访问。
+    面板保存为 .npy 内存映射文件，多个进程以只读方式挂载时共享同一份物理内存（操作系统页缓存）。
+    """
+
+    def __init__(self, data, ts_codes, dates, fields, path=None, shm=None):
+        self.data = data
+        self.ts_codes = np.asarray(ts_codes)  # 已排序，位置即股票的整数编号
+        self.dates = list(dates)
+        self.fields = list(fields)
+        self.path = path
+        self._shm = shm
+        self._field_pos = {field: i for i, field in enumerate(self.fields)}
+        self._date_pos = {date: i for i, date in enumerate(self.dates)}
+
+    @staticmethod
+    def _paths(name):
+        base = os.path.join(dc.csv_dir, f"panel_{name}")
+        return f"{base}.npy", f"{base}.json"
+
+    @classmethod
+    def build(cls, name, trade_dates, fields=None):
+        """
+        由本地缓存的 tushare_{api}_{date}.csv 构建面板并写入内存映射文件
+
+        逐个文件读取并直接写入映射文件，不在内存中拼接整段历史。
+        :param name: 面板名称，文件保存为 data/panel_{name}.npy / .json
+        :param trade_dates: 交易日列表
+        :param fields: {API 名称: 字段列表}，默认 DEFAULT_FIELDS
+        :return: 以读写方式打开的 PanelStore
+        """
+        if fields is None:
+            fields = DEFAULT_FIELDS
+        field_list = [field for api_fields in fields.values() for field in api_fields]
+        if len(set(field_list)) != len(field_list):
+            raise ValueError(f"面板字段名重复: {field_list}")
+
+        dates = sorted(str(d) for d in trade_dates)
+
+        # 第一遍只读取 ts_code 列，确定股票全集及整数编号
+        codes = set()
+        for api_name in fields:
+            for date in dates:
+                file_path = os.path.join(dc.csv_dir, f"tushare_{api_name}_{date}.csv")
+                if cached_exists(file_path):
+                    codes.update(read_cached_csv(file_path, usecols=["ts_code"])["ts_code"])
+        ts_codes = np.array(sorted(codes))
+
+        data_path, meta_path = cls._paths(name)
+        shape = (len(field_list), len(dates), len(ts_codes))
+        data = np.lib.format.open_memmap(data_path, mode="w+", dtype=np.float64, shape=shape)
+        data[:] = np.nan
+
+        # 第二遍按文件写入对应的 (字段, 日期) 截面
+        for api_name, api_fields in fields.items():
+            field_pos = [field_list.index(field) for field in api_fields]
+            for date_pos, date in enumerate(dates):
+                file_path = os.path.join(dc.csv_dir, f"tushare_{api_name}_{date}.csv")
+                if not cached_exists(file_path):
+                    logger.warning(f"面板 {name} 缺少数据文件：{file_path}")
+                    continue
+                df = read_cached_csv(file_path, usecols=["ts_code"] + api_fields)
+                stock_pos = np.searchsorted(ts_codes, df["ts_code"].to_numpy())
+                for pos, field in zip(field_pos, api_fields):
+                    data[pos, date_pos, stock_pos] = pd.to_numeric(df[field], errors="coerce").to_numpy()
+
+        data.flush()
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"ts_codes": ts_codes.tolist(), "dates": dates, "fields": field_list}, f, ensure_ascii=False)
+
+        logger.info(f"面板 {name} 已写入 {data_path}：{len(field_list)} 个字段 × {len(dates)} 个交易日 × "
+                    f"{len(ts_codes)} 只股票，{data.nbytes / 1024 ** 2:.1f} MB")
+        return cls(data, ts_codes, dates, field_list, path=data_path)
+
+    @classmethod
+    def attach(cls, name):
+        """以只读内存映射方式挂载面板（零拷贝，多进程共享同一份物理内存）"""
+        data_path, meta_path = cls._paths(name)
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        data = np.load(data_path, mmap_mode="r")
+        return cls(data, meta["ts_codes"], meta["dates"], meta["fields"], path=data_path)
+
+    def share(self):
+        """
+        将面板复制到 multiprocessing.shared_memory，适用于不落盘的场景
+
+        :return: 共享内存名称，子进程通过 PanelStore.attach_shared(shm_name, meta) 挂载
+        """
+        shm = shared_memory.SharedMemory(create=True, size=self.data.nbytes)
+        shared = np.ndarray(self.data.shape, dtype=self.data.dtype, buffer=shm.buf)
+        shared[:] = self.data
+        self._shm = shm
+        return shm.name
+
+    def meta(self):
+        """子进程挂载共享内存所需的元数据"""
+        return {"ts_codes": self.ts_codes.tolist(), "dates": self.dates, "fields": self.fields,
+                "shape": list(self.data.shape)}
+
+    @classmethod
+    def attach_shared(cls, shm_name, meta):
+        """
+        挂载 share() 创建的共享内存面板（零拷贝）
+
+        挂载方不登记到 resource_tracker，否则其退出时会删除（或警告泄漏）仍由创建者使用的共享内存。
+        """
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=shm_name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=shm_name)
+            resource_tracker.unregister(shm._name, "shared_memory")
+        data = np.ndarray(tuple(meta["shape"]), dtype=np.float64, buffer=shm.buf)
+        return cls(data, meta["ts_codes"], meta["dates"], meta["fields"], shm=shm)
+
+    def close(self, unlink=False):
+        """释放共享内存句柄；unlink=True 时删除共享内存（仅创建者调用）"""
+        if self._shm is not None:
+            self._shm.close()
+            if unlink:
+                if sys.version_info < (3, 13):
+                    # 同一 resource_tracker 下的挂载方可能已注销该记录，重新登记后 unlink 才能正常注销
+                    resource_tracker.register(self._shm._name, "shared_memory")
+                self._shm.unlink()
+            self._shm = None
+
+    def code_index(self, ts_codes):
+        """将 ts_code 转换为面板中的整数编号，不存在的返回 -1"""
+        ts_codes = np.asarray(ts_codes)
+        pos = np.searchsorted(self.ts_codes, ts_codes)
+        pos = np.clip(pos, 0, len(self.ts_codes) - 1)
+        return np.where(self.ts_codes[pos] == ts_codes, pos, -1)
+
+    def field(self, field):
+        """取出单个字段的 (日期 × 股票) 视图，不复制数据"""
+        return self.data[self._field_pos[field]]
+
+    def cross_section(self, field, date):
+        """取出某一交易日全市场的字段截面（视图）"""
+        return self.data[self._field_pos[field], self._date_pos[str(date)]]
+
+    def frame(self, date, fields=None):
+        """将某一交易日的截面转换为 DataFrame（索引为 ts_code）"""
+        fields = fields or self.fields
+        date_pos = self._date_pos[str(date)]
+        return pd.DataFrame({field: self.data[self._field_pos[field], date_pos] for field in fields},
+                            index=pd.Index(self.ts_codes, name="ts_code"))
+
+
+def attach_in_worker(name, shm_name=None, meta=None):
+    """进程池 initializer：在子进程中挂载面板"""
+    global _worker_store
+    if shm_name is not None:
+        _worker_store = PanelStore.attach_shared(shm_name, meta)
+    else:
+        _worker_store = PanelStore.attach(name)
+
+
+def get_worker_store():
+    """获取当前子进程挂载的面板"""
+    return _worker_store
+
+
+def run_in_pool(name, func, tasks, processes=16):
+    """
+    使用进程池并行执行 func(task)，所有子进程共享同一份面板
+
+    :param name: 面板名称（需已 build）
+    :param func: 可 pickle 的函数，内部通过 get_worker_store() 访问面板
+    :param tasks: 任务参数列表
+    :param processes: 进程数
+    :return: 结果列表
+    """
+    with Pool(processes=processes, initializer=attach_in_worker, initargs=(name,)) as pool:
+        return pool.map(func, tasks)
+
+
+def _count_small_caps(task):
+    """示例任务：统计某交易日流通市值低于阈值的股票数量"""
+    date, circ_mv = task
+    values = get_worker_store().cross_section("circ_mv", date)
+    return date, int(np.count_nonzero(values <= circ_mv))
+
+
+if __name__ == "__main__":
+    from stock_utils import get_last_n_trade_dates
+
+    recent_dates = get_last_n_trade_dates(n=20)
+    PanelStore.build("recent", recent_dates)
+
+    results = run_in_pool("recent", _count_small_caps, [(date, dc.circ_mv) for date in recent_dates])
+    for trade_date, count in results:
+        logger.info(f"{trade_date} 流通市值 <= {dc.circ_mv} 的股票数量：{count}")
@@ -0,0 +1,164 @@
+# filename: param_sweep.py
+
+import itertools
+import time
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from quarter_panel import load_quarter_panel, panel_matrix
+from screen_rules import build_filter_rules, evaluate_rules, get_selection_thresholds
+from security_master import SID_COLUMN, merge_on_sid
+from stock_utils import setup_logger, get_last_trade_date, get_quarter_end_dates, load_csv, load_stock_basic, \
+    fetch_daily_basic, fetch_weekly
+
+logger = setup_logger()
+
+# 参数按筛选阶段排列：只有后面阶段参数不同的组合共享前面阶段的掩码
+SWEEP_PARAMS = ["circ_mv", "roe", "q_netprofit_yoy", "debt_to_assets", "top_volume", "top_pct_chg"]
+
+# 财务指标阈值的比较方式，与 build_selection_rules 一致
+FINA_OPS = {
+    "roe": np.greater_equal,
+    "q_netprofit_yoy": np.greater,
+    "debt_to_assets": np.less,
+}
+
+
+class SweepInputs(object):
+    """
+    参数扫描的输入数据：filter1 与周线交集中每只股票的各项指标，按位置对齐的 numpy 数组
+
+    fina 中每个指标为 (股票, 报告期) 矩阵，缺失的报告期视为不满足条件。
+    """
+
+    def __init__(self, trade_date, quarters, ts_codes, circ_mv, fina, amount, pct_chg):
+        self.trade_date = trade_date
+        self.quarters = list(quarters)
+        self.ts_codes = np.asarray(ts_codes)
+        self.circ_mv = circ_mv
+        self.fina = fina
+        self.amount = amount
+        self.pct_chg = pct_chg
+
+
+def load_sweep_inputs(trade_date, quarters=None):
+    """
+    一次性加载扫描所需的数据：股票基础信息（filter1 规则）、每日指标、财务面板及周线
+
+    :param trade_date: 交易日期
+    :param quarters: 报告期列表，默认 config.yaml 中指定的报告期
+    """
+    if quarters is None:
+        quarters = [get_quarter_end_dates(dc.period_year)[dc.period_quarter]]
+
+    stock_basic = load_stock_basic(trade_date)
+    filter1 = stock_basic[evaluate_rules(stock_basic, build_filter_rules(), report=False)]
+    daily_basic = load_csv("tushare_daily_basic", fetch_daily_basic, trade_date)
+    weekly = fetch_weekly(trade_date)
+
+    # 与 filter2 ~ filter4 相同的连接方式：每日指标左连接，周线内连接（按证券 ID 对齐）
+    base = merge_on_sid(filter1.filter(items=[SID_COLUMN, "ts_code"]),
+                        daily_basic.filter(items=[SID_COLUMN, "ts_code", "circ_mv"]), how="left")
+    base = merge_on_sid(base, weekly.filter(items=[SID_COLUMN, "ts_code", "amount", "pct_chg"]), how="inner") \
+        .drop_duplicates(subset="ts_code", keep="first")
+
+    panel = load_quarter_panel(quarters, fields=list(FINA_OPS))
+    fina = {}
+    for field in FINA_OPS:
+        matrix = panel_matrix(panel, field, end_dates=[str(q) for q in quarters])
+        fina[field] = matrix.reindex(index=base["ts_code"], columns=[str(q) for q in quarters]).to_numpy(dtype=float)
+
+    logger.info(f"参数扫描输入：{len(base)} 只股票，{len(quarters)} 个报告期")
+    return SweepInputs(trade_date, quarters, base["ts_code"].to_numpy(),
+                       pd.to_numeric(base["circ_mv"], errors="coerce").to_numpy(dtype=float), fina,
+                       pd.to_numeric(base["amount"], errors="coerce").to_numpy(dtype=float),
+                       pd.to_numeric(base["pct_chg"], errors="coerce").to_numpy(dtype=float))
+
+
+def expand_grid(grid):
+    """
+    展开参数网格，未指定的参数取 config.yaml 中的值
+
+    :param grid: {参数: 取值列表}，例如 {'roe': [4, 6, 8], 'top_volume': range(3, 11)}
+    :return: 参数字典列表，按 SWEEP_PARAMS 的阶段顺序排列
+    """
+    unknown = set(grid) - set(SWEEP_PARAMS)
+    if unknown:
+        raise ValueError(f"未知参数: {sorted(unknown)}")
+    defaults = get_selection_thresholds()
+    values = [list(grid.get(name, [defaults[name]])) for name in SWEEP_PARAMS]
+    return [dict(zip(SWEEP_PARAMS, combo)) for combo in itertools.product(*values)]
+
+
+def _top_order(values, alive):
+    """存活股票按指标降序的位置（并列时保持原顺序，与 nlargest(keep='first') 一致），忽略缺失值"""
+    idx = np.flatnonzero(alive & ~np.isnan(values))
+    return idx[np.argsort(-values[idx], kind="stable")]
+
+
+def run_sweep(inputs, grid):
+    """
+    在已加载的数据上计算参数网格的全部组合
+
+    每个阈值的掩码只计算一次；circ_mv 及三个财务阈值相同的组合共享 filter3 结果及排序，
+    不同的 top_volume / top_pct_chg 只是取排序结果的不同前缀。
+
+    :param inputs: load_sweep_inputs 返回的 SweepInputs
+    :param grid: {参数: 取值列表}
+    :return: DataFrame，每行一个参数组合，附带 filter2 / filter3 数量、最终数量 count 及入选股票 selected
+    """
+    start = time.perf_counter()
+    combos = expand_grid(grid)
+
+    mask_cache = {}
+
+    def mask(name, threshold):
+        key = (name, threshold)
+        if key not in mask_cache:
+            with np.errstate(invalid="ignore"):
+                if name == "circ_mv":
+                    mask_cache[key] = inputs.circ_mv <= threshold
+                else:
+                    values = inputs.fina[name]
+                    passed = FINA_OPS[name](values, threshold) & ~np.isnan(values)
+                    mask_cache[key] = passed.all(axis=1) if values.shape[1] else np.zeros(len(values), dtype=bool)
+        return mask_cache[key]
+
+    stage_cache = {}
+    rows = []
+    for params in combos:
+        key = tuple(params[name] for name in SWEEP_PARAMS[:4])
+        if key not in stage_cache:
+            alive2 = mask("circ_mv", params["circ_mv"])
+            alive3 = alive2 & mask("roe", params["roe"]) & mask("q_netprofit_yoy", params["q_netprofit_yoy"]) & \
+                mask("debt_to_assets", params["debt_to_assets"])
+            stage_cache[key] = (int(alive2.sum()), int(alive3.sum()),
+                                _top_order(inputs.amount, alive3), _top_order(inputs.pct_chg, alive3))
+        n2, n3, amount_order, pct_chg_order = stage_cache[key]
+
+        selected = np.union1d(amount_order[:int(params["top_volume"])], pct_chg_order[:int(params["top_pct_chg"])])
+        codes = tuple(sorted(inputs.ts_codes[selected]))
+        rows.append({**params, "filter2": n2, "filter3": n3, "count": len(codes), "selected": codes})
+
+    logger.info(f"参数扫描完成：{len(combos)} 个组合，{len(stage_cache)} 组共享的 filter3 结果，"
+                f"耗时 {time.perf_counter() - start:.3f}s")
+    return pd.DataFrame(rows, columns=SWEEP_PARAMS + ["filter2", "filter3", "count", "selected"])
+
+
+def sweep(trade_date, grid, quarters=None):
+    """加载一次数据并计算参数网格（不写结果文件）"""
+    return run_sweep(load_sweep_inputs(trade_date, quarters), grid)
+
+
+if __name__ == "__main__":
+    result = sweep(get_last_trade_date(), {
+        "circ_mv": [5000000, 10000000],
+        "roe": [2, 4, 6, 8, 10],
+        "q_netprofit_yoy": [0, 10, 20, 30, 50],
+        "debt_to_assets": [60, 70, 80, 90],
+        "top_volume": [3, 6],
+        "top_pct_chg": [3, 5],
+    })
+    logger.info(result.sort_values("count", ascending=False).head(20))
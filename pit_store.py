@@ -0,0 +1,126 @@
+# filename: pit_store.py
+
+import numpy as np
+import pandas as pd
+
+from screen_rules import build_selection_rules, evaluate_rules
+from stock_utils import setup_logger, generate_quarter_list, get_friday_trade_dates, \
+    fetch_fina_indicator_vip_history
+
+logger = setup_logger()
+
+# 记录的主键：同一股票同一报告期可有多个公告版本
+PIT_KEY = ["ts_code", "end_date", "ann_date"]
+
+
+class FinaPitStore(object):
+    """
+    财务指标的时点（point-in-time）存储
+
+    每条记录以 (ts_code, end_date, ann_date) 为键：end_date 为报告期，ann_date 为该版本的公告日期。
+    as_of() 返回每个交易日当时已经公告的最新数据，避免回测中使用后来才披露或更正的数据（未来函数）。
+    """
+
+    def __init__(self, records=None):
+        self.records = None  # 全部版本，按 (ts_code, end_date, ann_date) 排序
+        self._latest = None  # 每次公告后“最新报告期”的视图，按 ann_date 排序，用于 merge_asof
+        if records is not None:
+            self.set_records(records)
+
+    def load(self, end_dates):
+        """
+        加载多个报告期的全部版本财务数据
+
+        :param end_dates: 报告期列表，例如 generate_quarter_list(2023)
+        :return: self
+        """
+        frames = []
+        for end_date in sorted(set(str(d).split(":")[-1] for d in end_dates)):
+            df = fetch_fina_indicator_vip_history(end_date)
+            if df is None or df.empty:
+                logger.warning(f"报告期 {end_date} 无财务数据")
+                continue
+            frames.append(df)
+        if not frames:
+            raise ValueError(f"未加载到任何财务数据: {end_dates}")
+        return self.set_records(pd.concat(frames, ignore_index=True))
+
+    def set_records(self, records):
+        """整理记录：日期转为 datetime64，同键重复时保留最新版本（update_flag=1）"""
+        df = records.dropna(subset=PIT_KEY).copy()
+        df["ts_code"] = df["ts_code"].astype(str)
+        for col in ("end_date", "ann_date"):
+            df[col] = pd.to_datetime(df[col].astype(str).str[:8], format="%Y%m%d")
+        if "update_flag" in df.columns:
+            df = df.sort_values("update_flag", kind="stable")
+        df = df.drop_duplicates(subset=PIT_KEY, keep="last")
+        self.records = df.sort_values(PIT_KEY).reset_index(drop=True)
+
+        # 按公告顺序，只有报告期不早于此前已公告的最大报告期时，才会改变“最新报告”
+        # （晚于新报告公告的旧报告期更正不影响最新视图）
+        ordered = self.records.sort_values(["ts_code", "ann_date", "end_date"])
+        latest_end = ordered.groupby("ts_code")["end_date"].cummax()
+        self._latest = ordered[ordered["end_date"].to_numpy() == latest_end.to_numpy()] \
+            .sort_values("ann_date", kind="stable").reset_index(drop=True)
+
+        logger.info(f"时点财务数据：{self.records['ts_code'].nunique()} 只股票，"
+                    f"{self.records['end_date'].nunique()} 个报告期，{len(self.records)} 个版本")
+        return self
+
+    def as_of(self, trade_dates, end_date=None, ts_codes=None, include_same_day=True):
+        """
+        一次向量化连接，取出每个交易日、每只股票当时可见的财务数据
+
+        :param trade_dates: 交易日列表，例如一年中的所有周五
+        :param end_date: 指定报告期时返回该报告期当时可见的最新版本；默认返回当时可见的最新报告期
+        :param ts_codes: 股票范围，默认为存储中的全部股票
+        :param include_same_day: 交易日当天公告的数据是否可见（收盘后筛选时为 True）
+        :return: 每行一个 (trade_date, ts_code)，附带 end_date、ann_date 及各指标；当时尚无数据的组合不返回
+        """
+        if self.records is None:
+            raise ValueError("时点财务数据尚未加载")
+
+        if end_date is None:
+            right = self._latest
+        else:
+            end = pd.to_datetime(str(end_date).split(":")[-1], format="%Y%m%d")
+            right = self.records[self.records["end_date"] == end].sort_values("ann_date", kind="stable")
+
+        if ts_codes is None:
+            ts_codes = self.records["ts_code"].unique()
+        ts_codes = np.asarray(ts_codes, dtype=object)
+        dates = pd.to_datetime(sorted(set(str(d) for d in trade_dates)), format="%Y%m%d")
+
+        left = pd.DataFrame({
+            "trade_date": np.repeat(dates.to_numpy(), len(ts_codes)),
+            "ts_code": np.tile(ts_codes, len(dates)),
+        })
+        merged = pd.merge_asof(left, right, left_on="trade_date", right_on="ann_date", by="ts_code",
+                               allow_exact_matches=include_same_day, direction="backward")
+        merged = merged.dropna(subset=["ann_date"]).reset_index(drop=True)
+        for col in ("trade_date", "end_date", "ann_date"):
+            merged[col] = merged[col].dt.strftime("%Y%m%d")
+        return merged
+
+    def screen_as_of(self, trade_dates, thresholds=None, end_date=None, ts_codes=None):
+        """
+        按 config.yaml 中财务指标阈值对多个交易日同时筛选
+
+        :return: 通过筛选的 (trade_date, ts_code, end_date, ann_date, ...) 记录
+        """
+        known = self.as_of(trade_dates, end_date=end_date, ts_codes=ts_codes)
+        mask = evaluate_rules(known, build_selection_rules("fina_indicator", thresholds), report=False)
+        passed = known[mask]
+        logger.info(f"{known['trade_date'].nunique()} 个交易日时点筛选：{len(known)} 条可见记录，"
+                    f"通过 {len(passed)} 条")
+        return passed
+
+
+if __name__ == "__main__":
+    year = 2024
+    store = FinaPitStore().load(generate_quarter_list(year - 1))
+
+    # 一年中每个周五当时可见的最新财报，一次连接完成
+    fridays = [d for month in range(1, 13) for d in get_friday_trade_dates(year, month)]
+    result = store.screen_as_of(fridays)
+    logger.info(result.groupby("trade_date")["ts_code"].count())
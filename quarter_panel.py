@@ -0,0 +1,175 @@
+# filename: quarter_panel.py
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from screen_rules import get_selection_thresholds
+from stock_utils import setup_logger, generate_quarter_list, fetch_fina_indicator_vip_by_quarter_str
+
+logger = setup_logger()
+
+# 跨季度规则：
+#   how='all'    所有季度均满足
+#   how='any'    任一季度满足
+#   how='last'   最近 n 个季度均满足
+#   how='streak' 存在连续 n 个季度满足
+#   how='trend'  指标逐季不下降（op='>='）或不上升（op='<='），value 不使用
+QuarterRule = namedtuple("QuarterRule", ["field", "op", "value", "how", "n"], defaults=("all", None))
+
+OPS = {
+    ">": np.greater,
+    ">=": np.greater_equal,
+    "<": np.less,
+    "<=": np.less_equal,
+    "==": np.equal,
+    "!=": np.not_equal,
+}
+
+
+def get_recent_quarter_end_dates(n, start_year=None):
+    """获取最近 n 个已结束季度的报告期（升序）"""
+    if start_year is None:
+        start_year = dc.period_year - (n // 4 + 2)
+    return generate_quarter_list(start_year)[-n:]
+
+
+def load_quarter_panel(end_dates, fields=None):
+    """
+    将多个报告期的财务指标加载为一个 (ts_code × end_date) 面板
+
+    :param end_dates: 报告期列表，例如 ['20231231', '20240930']
+    :param fields: 需要保留的指标列，默认保留全部
+    :return: 以 (ts_code, end_date) 为索引、按索引排序的 DataFrame；没有数据的报告期不出现在索引中
+    """
+    end_dates = sorted(set(str(d) for d in end_dates))
+    frames = []
+    for end_date in end_dates:
+        df = fetch_fina_indicator_vip_by_quarter_str(end_date)
+        if df is None or df.empty:
+            logger.warning(f"报告期 {end_date} 无财务数据，面板中该季度为空")
+            continue
+        columns = ["ts_code"] + [col for col in (fields or df.columns) if col in df.columns and col != "ts_code"]
+        df = df[columns].copy()
+        df["end_date"] = end_date
+        frames.append(df)
+
+    if not frames:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=["ts_code", "end_date"]))
+
+    panel = pd.concat(frames, ignore_index=True)
+    # 同一股票同一报告期可能有多条公告，保留最后一条
+    panel = panel.drop_duplicates(subset=["ts_code", "end_date"], keep="last")
+    panel = panel.set_index(["ts_code", "end_date"]).sort_index()
+    logger.info(f"财务面板：{panel.index.get_level_values('ts_code').nunique()} 只股票 × "
+                f"{panel.index.get_level_values('end_date').nunique()} 个报告期")
+    return panel
+
+
+def panel_matrix(panel, field, end_dates):
+    """
+    取出单个指标的 (ts_code × end_date) 宽表，列按报告期升序
+
+    :param end_dates: 宽表的报告期列（通常为加载面板时请求的报告期），没有数据的报告期整列为 NaN
+    """
+    ts_codes = panel.index.get_level_values("ts_code").unique()
+    if field in panel.columns and len(panel):
+        matrix = pd.to_numeric(panel[field], errors="coerce").unstack("end_date")
+    else:
+        matrix = pd.DataFrame(index=ts_codes, dtype=float)
+    return matrix.reindex(columns=sorted(set(str(d) for d in end_dates)))
+
+
+def _longest_run(passed):
+    """按股票向量化计算最长连续满足的季度数"""
+    run = np.zeros(passed.shape[0], dtype=np.int32)
+    best = np.zeros(passed.shape[0], dtype=np.int32)
+    for column in range(passed.shape[1]):
+        run = (run + 1) * passed[:, column]
+        np.maximum(best, run, out=best)
+    return best
+
+
+def evaluate_quarter_rule(panel, rule, end_dates):
+    """
+    计算单条跨季度规则，返回以 ts_code 为索引的布尔 Series
+
+    缺失的季度（包括整个报告期都没有数据）视为不满足条件。
+
+    :param end_dates: 参与计算的报告期
+    """
+    matrix = panel_matrix(panel, rule.field, end_dates)
+    values = matrix.to_numpy(dtype=float)
+    op = OPS[rule.op]
+
+    if rule.how == "trend":
+        diffs = np.diff(values, axis=1)
+        passed = op(diffs, 0) & ~np.isnan(diffs)
+        result = passed.all(axis=1) & ~np.isnan(values).any(axis=1)
+        return pd.Series(result, index=matrix.index)
+
+    with np.errstate(invalid="ignore"):
+        passed = op(values, rule.value) & ~np.isnan(values)
+
+    if rule.how == "all":
+        result = passed.all(axis=1)
+    elif rule.how == "any":
+        result = passed.any(axis=1)
+    elif rule.how == "last":
+        n = rule.n or values.shape[1]
+        result = passed[:, -n:].all(axis=1) if n <= values.shape[1] else np.zeros(len(values), dtype=bool)
+    elif rule.how == "streak":
+        result = _longest_run(passed) >= (rule.n or values.shape[1])
+    else:
+        raise ValueError(f"不支持的规则类型: {rule.how}")
+    return pd.Series(result, index=matrix.index)
+
+
+def screen_quarter_panel(panel, rules, end_dates, report=True):
+    """
+    在财务面板上一次性计算所有跨季度规则
+
+    :param panel: load_quarter_panel 返回的面板
+    :param rules: QuarterRule 列表
+    :param end_dates: 参与计算的报告期（面板切片后 pandas 不保留 attrs，因此必须显式传入）
+    :param report: 是否记录每条规则的剔除数量
+    :return: 满足所有规则的 ts_code Index
+    """
+    ts_codes = panel.index.get_level_values("ts_code").unique().sort_values()
+    alive = pd.Series(True, index=ts_codes)
+    for rule in rules:
+        passed = evaluate_quarter_rule(panel, rule, end_dates).reindex(ts_codes, fill_value=False)
+        eliminated = int((alive & ~passed).sum())
+        alive &= passed
+        if report:
+            logger.info(f"{rule.field} {rule.op} {rule.value} ({rule.how}{'' if rule.n is None else f', n={rule.n}'})："
+                        f"剔除 {eliminated} 只，剩余 {int(alive.sum())} 只")
+    return ts_codes[alive.to_numpy()]
+
+
+def build_quarter_rules(thresholds=None):
+    """
+    根据 config.yaml 中 stock_selection 阈值生成“每个季度均满足”的规则
+
+    :param thresholds: 覆盖 config.yaml 的阈值，例如 {'roe': 6}
+    """
+    t = get_selection_thresholds(thresholds)
+    return [
+        QuarterRule("roe", ">=", t["roe"], "all"),
+        QuarterRule("q_netprofit_yoy", ">", t["q_netprofit_yoy"], "all"),
+        QuarterRule("debt_to_assets", "<", t["debt_to_assets"], "all"),
+    ]
+
+
+if __name__ == "__main__":
+    quarters = get_recent_quarter_end_dates(4)
+    quarter_panel = load_quarter_panel(quarters, fields=["roe", "q_netprofit_yoy", "debt_to_assets"])
+
+    # 最近4个季度 ROE 均 >= 4，且净利润同比增长连续3个季度为正
+    passing = screen_quarter_panel(quarter_panel, [
+        QuarterRule("roe", ">=", 4, "all"),
+        QuarterRule("q_netprofit_yoy", ">", 0, "last", 3),
+    ], quarters)
+    logger.info(f"满足条件的股票数量：{len(passing)}")
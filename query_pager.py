@@ -0,0 +1,151 @@
+# filename: query_pager.py
+
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+
+logger = setup_logger()
+
+# 接口 -> 已观察到的最大单页行数：服务器单次上限不低于此值，比它短的首页一定是完整结果
+_page_rows = {}
+# 接口 -> 已确认的服务器单次上限（低于配置的 limit）
+_server_limits = {}
+_page_rows_lock = threading.Lock()
+
+
+def get_row_limit(api_name):
+    """读取 config.yaml 中 pagination.limits 配置的接口单次最大返回行数"""
+    config = dc.pagination_config
+    limits = config.get("limits") or {}
+    return int(limits.get(api_name) or config.get("default_limit", 3000))
+
+
+def _query_page(api_name, fields, offset, limit, params):
+    return dc.pro.query(api_name, fields=fields, offset=offset, limit=limit, **params)
+
+
+def _observe_page(api_name, rows):
+    with _page_rows_lock:
+        if rows > _page_rows.get(api_name, 0):
+            _page_rows[api_name] = rows
+
+
+def _short_page_complete(api_name, rows):
+    """不满 limit 的首页是否一定完整：为空，或比该接口已返回过的整页更短"""
+    with _page_rows_lock:
+        return rows == 0 or rows < _page_rows.get(api_name, 0)
+
+
+def query_all(api_name, fields="", limit=None, max_workers=None, **params):
+    """
+    按 offset/limit 自动分页获取完整结果
+
+    第一页满 limit 行时每批并发请求 max_workers 页，直到出现不满页为止；各页按 offset 顺序只在最后拼接一次。
+    第一页不满 limit 行时可能是服务器的单次上限低于配置的 limit，除非比该接口返回过的整页更短，
+    否则按 offset 再请求一次确认；确有剩余数据时以首页行数为页长继续分页，并记住该上限。
+
+    :param api_name: Tushare 接口名称，例如 'fina_indicator_vip'
+    :param fields: 返回字段，逗号分隔
+    :param limit: 单页行数，默认取 config.yaml 中 pagination.limits
+    :param max_workers: 并发页数，默认取 pagination.max_workers
+    :param params: 接口参数
+    :return: 完整的 DataFrame
+    """
+    limit = limit or get_row_limit(api_name)
+    max_workers = max_workers or dc.pagination_config.get("max_workers", 4)
+    max_pages = dc.pagination_config.get("max_pages", 200)
+
+    with _page_rows_lock:
+        limit = min(limit, _server_limits.get(api_name, limit))
+
+    first = _query_page(api_name, fields, 0, limit, params)
+    if len(first) > limit:
+        logger.warning(f"{api_name} 返回 {len(first)} 行，超过 limit={limit}，接口可能不支持分页")
+        return first
+
+    pages = [first]
+    if len(first) < limit:
+        if _short_page_complete(api_name, len(first)):
+            return first
+        probe = _query_page(api_name, fields, len(first), limit, params)
+        if probe.empty:
+            _observe_page(api_name, len(first))
+            return first
+        if probe.equals(first):
+            logger.warning(f"{api_name} 忽略了 offset 参数，无法确认 {len(first)} 行是否为完整结果")
+            return first
+        logger.warning(f"{api_name} 单次最多返回 {len(first)} 行，低于 limit={limit}，请调整 pagination.limits 配置")
+        limit = len(first)
+        with _page_rows_lock:
+            _server_limits[api_name] = limit
+        pages.append(probe)
+    _observe_page(api_name, limit)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while len(pages[-1]) == limit:
+            if len(pages) >= max_pages:
+                raise RuntimeError(f"{api_name} 分页超过 {max_pages} 页，请检查参数或 pagination.max_pages 配置")
+            offsets = [(len(pages) + i) * limit for i in range(max_workers)]
+            batch = list(executor.map(lambda offset: _query_page(api_name, fields, offset, limit, params), offsets))
+            if len(pages) == 1 and batch[0].equals(first):
+                raise RuntimeError(f"{api_name} 忽略了 offset 参数，无法分页获取")
+            # 只保留到第一个不满页（其后的页为空）
+            for page in batch:
+                pages.append(page)
+                if len(page) < limit:
+                    break
+
+    df = pd.concat(pages, ignore_index=True)
+    logger.debug(f"{api_name} 分页获取 {len(pages)} 页，共 {len(df)} 行")
+    return df
+
+
+def split_codes(ts_codes, size=100):
+    """按股票代码分组，返回 [{'ts_code': 'a,b,...'}, ...]"""
+    ts_codes = list(ts_codes)
+    return [{"ts_code": ",".join(ts_codes[i:i + size])} for i in range(0, len(ts_codes), size)]
+
+
+def split_date_range(start_date, end_date, days=365):
+    """按日期区间分段，返回 [{'start_date': ..., 'end_date': ...}, ...]"""
+    start = datetime.datetime.strptime(str(start_date), "%Y%m%d").date()
+    end = datetime.datetime.strptime(str(end_date), "%Y%m%d").date()
+    chunks = []
+    while start <= end:
+        chunk_end = min(start + datetime.timedelta(days=days - 1), end)
+        chunks.append({"start_date": start.strftime("%Y%m%d"), "end_date": chunk_end.strftime("%Y%m%d")})
+        start = chunk_end + datetime.timedelta(days=1)
+    return chunks
+
+
+def query_chunked(api_name, chunks, fields="", max_workers=None, **params):
+    """
+    按股票分组或日期分段并发获取，每段内部再自动分页
+
+    :param chunks: split_codes / split_date_range 生成的参数列表，与 params 合并后逐段请求
+    :return: 按 chunks 顺序拼接的 DataFrame
+    """
+    max_workers = max_workers or dc.pagination_config.get("max_workers", 4)
+
+    def fetch(chunk):
+        # 段内顺序分页，并发度只由分段控制
+        return query_all(api_name, fields=fields, max_workers=1, **{**params, **chunk})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        frames = list(executor.map(fetch, chunks))
+    frames = [df for df in frames if df is not None and not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    logger.info(f"{api_name} 分 {len(chunks)} 段获取，共 {len(df)} 行")
+    return df
+
+
+if __name__ == "__main__":
+    logger.info(query_all("fina_indicator_vip", fields="ts_code,end_date,roe", period="20240930"))
+    logger.info(query_chunked("daily", split_date_range("20240101", "20240331", days=30), ts_code="000001.SZ"))
@@ -0,0 +1,256 @@
+# filename: rank_table.py
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger, load_stock_basic
+from write_behind import cached_exists, flush_writes, read_cached_csv
+
+logger = setup_logger()
+
+# 每张行情表预计算排名的指标
+RANK_METRICS = {
+    "daily": ["amount", "vol", "pct_chg"],
+    "daily_basic": ["circ_mv", "total_mv", "turnover_rate", "pe", "pb"],
+    "weekly": ["amount", "vol", "pct_chg"],
+}
+
+SCOPE_MARKET = "market"  # 全市场
+SCOPE_INDUSTRY = "industry"  # 行业内
+
+COLUMNS = ["metric", "scope", "group", "ts_code", "value", "rank", "pct"]
+
+
+def rank_table_path(table, trade_date):
+    return os.path.join(dc.csv_dir, f"rank_{table}_{trade_date}.csv")
+
+
+def _rank_block(frame, metric, scope, group):
+    """
+    一个分组（全市场或单个行业）的排名块，按指标降序排列
+
+    rank 为降序稠密排名（最大值为 1，并列同名次）；
+    pct 为百分位（0 ~ 100），即组内不大于该值的股票占比，最大值为 100。
+    并列时保持原始行顺序，与 nlargest(keep='first') 的取舍一致。
+    """
+    values = frame["value"].to_numpy()
+    order = np.argsort(-values, kind="stable")
+    sorted_values = values[order]
+    # 降序排列后，值变化处名次加一
+    dense = np.concatenate(([1], 1 + np.cumsum(sorted_values[1:] != sorted_values[:-1]))) if len(values) else []
+    # 不大于该值的个数 = 总数 - 严格大于该值的个数
+    greater = np.searchsorted(-sorted_values, -sorted_values, side="left")
+    return pd.DataFrame({
+        "metric": metric,
+        "scope": scope,
+        "group": group,
+        "ts_code": frame["ts_code"].to_numpy()[order],
+        "value": sorted_values,
+        "rank": np.asarray(dense, dtype=np.int32),
+        "pct": ((len(values) - greater) / max(len(values), 1) * 100).round(4),
+    }, columns=COLUMNS)
+
+
+def compute_rank_table(df, metrics, industry=None):
+    """
+    计算某交易日截面上各指标的全市场及行业内排名
+
+    :param df: 某交易日的行情数据，包含 ts_code 及指标列
+    :param metrics: 指标列表
+    :param industry: ts_code -> 行业 的 Series，为 None 时只计算全市场排名
+    :return: 排名表，按 (metric, scope, group, rank) 排列，每个分组是连续的一段
+    """
+    blocks = []
+    for metric in metrics:
+        if metric not in df.columns:
+            continue
+        frame = pd.DataFrame({"ts_code": df["ts_code"].astype(str).to_numpy(),
+                              "value": pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=float)})
+        frame = frame[~np.isnan(frame["value"].to_numpy())]
+        blocks.append(_rank_block(frame, metric, SCOPE_MARKET, ""))
+        if industry is not None:
+            frame["industry"] = frame["ts_code"].map(industry).fillna("").to_numpy()
+            for name, group in frame[frame["industry"] != ""].groupby("industry", sort=True):
+                blocks.append(_rank_block(group, metric, SCOPE_INDUSTRY, name))
+    if not blocks:
+        return pd.DataFrame(columns=COLUMNS)
+    return pd.concat(blocks, ignore_index=True)
+
+
+class RankTable(object):
+    """
+    某交易日某行情表的排名索引
+
+    排名在入库时预计算并保存为 data/rank_{表名}_{日期}.csv，每个 (指标, 范围, 行业) 是按指标降序排列的连续一段；
+    加载时只扫描一遍分组边界建立 (指标, 范围, 行业) -> 行区间 的索引，查询时：
+      - 前 K 名：直接取区间的前 K 行
+      - 百分位区间 / 数值区间：在有序区间上二分查找
+    均不需要排序。
+    """
+
+    def __init__(self, table, trade_date, data):
+        self.table = table
+        self.trade_date = str(trade_date)
+        self.data = data.reset_index(drop=True)
+        self._values = self.data["value"].to_numpy(dtype=float)
+        self._pcts = self.data["pct"].to_numpy(dtype=float)
+        self._index = self._build_index()
+
+    def _build_index(self):
+        keys = list(zip(self.data["metric"], self.data["scope"], self.data["group"].fillna("")))
+        index = {}
+        start = 0
+        for i in range(1, len(keys) + 1):
+            if i == len(keys) or keys[i] != keys[start]:
+                index[keys[start]] = (start, i)
+                start = i
+        return index
+
+    @classmethod
+    def build(cls, table, trade_date, metrics=None, save=True):
+        """由本地缓存的行情数据及当日股票基础信息（行业）计算排名表"""
+        trade_date = str(trade_date)
+        source = os.path.join(dc.csv_dir, f"tushare_{table}_{trade_date}.csv")
+        if not cached_exists(source):
+            raise FileNotFoundError(f"{table} {trade_date} 的本地数据不存在: {source}")
+        df = read_cached_csv(source, dtype={"ts_code": str})
+
+        stock_basic = load_stock_basic(trade_date)
+        industry = None
+        if stock_basic is not None and "industry" in stock_basic.columns:
+            industry = stock_basic.set_index(stock_basic["ts_code"].astype(str))["industry"]
+            industry = industry[~industry.index.duplicated(keep="last")]
+
+        data = compute_rank_table(df, metrics or RANK_METRICS.get(table, []), industry)
+        if save:
+            # 行情数据尚在写入队列时先等落盘，否则其修改时间晚于排名表，load() 会误判为需要重新计算
+            flush_writes(source)
+            path = rank_table_path(table, trade_date)
+            tmp_path = f"{path}.tmp"
+            data.to_csv(tmp_path, index=False, encoding="utf-8_sig")
+            os.replace(tmp_path, path)
+            logger.info(f"{table} {trade_date} 排名表已保存至 {path}，共 {len(data)} 行")
+        return cls(table, trade_date, data)
+
+    @classmethod
+    def load(cls, table, trade_date):
+        """读取已保存的排名表；不存在或早于行情数据时返回 None"""
+        path = rank_table_path(table, trade_date)
+        source = os.path.join(dc.csv_dir, f"tushare_{table}_{trade_date}.csv")
+        if not os.path.exists(path):
+            return None
+        flush_writes(source)  # 行情数据尚在写入队列时，等落盘后再比较修改时间
+        if os.path.exists(source) and os.path.getmtime(source) > os.path.getmtime(path):
+            logger.info(f"{table} {trade_date} 的行情数据已更新，排名表需要重新计算")
+            return None
+        data = pd.read_csv(path, dtype={"ts_code": str, "group": str}, keep_default_na=False,
+                           na_values={"value": [""], "pct": [""]})
+        return cls(table, trade_date, data)
+
+    def metrics(self):
+        return sorted({metric for metric, _, _ in self._index})
+
+    def industries(self, metric):
+        return sorted(group for m, scope, group in self._index if m == metric and scope == SCOPE_INDUSTRY)
+
+    def _block(self, metric, industry=None):
+        key = (metric, SCOPE_INDUSTRY, industry) if industry else (metric, SCOPE_MARKET, "")
+        if key not in self._index:
+            if not any(m == metric for m, _, _ in self._index):
+                raise KeyError(f"{self.table} 排名表中没有指标: {metric}")
+            return 0, 0
+        return self._index[key]
+
+    def _slice(self, start, end):
+        return self.data.iloc[start:end].reset_index(drop=True)
+
+    def top_k(self, metric, k, industry=None, ascending=False):
+        """
+        前 K 名（industry 指定时为行业内），ascending=True 时取最小的 K 个
+
+        :return: 列为 metric, scope, group, ts_code, value, rank, pct 的 DataFrame，按名次排列
+        """
+        start, end = self._block(metric, industry)
+        if ascending:
+            return self._slice(max(start, end - k), end).iloc[::-1].reset_index(drop=True)
+        return self._slice(start, min(end, start + k))
+
+    def percentile_range(self, metric, low=0.0, high=100.0, industry=None):
+        """百分位在 [low, high] 之间的股票（百分位越大指标越大）"""
+        start, end = self._block(metric, industry)
+        # 区间内按指标降序排列，百分位同样降序：对其相反数二分查找
+        pcts = -self._pcts[start:end]
+        left = np.searchsorted(pcts, -high, side="left")
+        right = np.searchsorted(pcts, -low, side="right")
+        return self._slice(start + left, start + right)
+
+    def value_range(self, metric, low=None, high=None, industry=None):
+        """指标值在 [low, high] 之间的股票，例如流通市值不超过阈值：value_range('circ_mv', high=dc.circ_mv)"""
+        start, end = self._block(metric, industry)
+        values = -self._values[start:end]
+        left = 0 if high is None else np.searchsorted(values, -high, side="left")
+        right = len(values) if low is None else np.searchsorted(values, -low, side="right")
+        return self._slice(start + left, start + right)
+
+    def lookup(self, metric, ts_codes, industry_scope=False):
+        """指定股票的名次及百分位"""
+        mask = (self.data["metric"] == metric) & \
+               (self.data["scope"] == (SCOPE_INDUSTRY if industry_scope else SCOPE_MARKET)) & \
+               self.data["ts_code"].isin([str(code) for code in ts_codes])
+        return self.data[mask].reset_index(drop=True)
+
+
+_rank_tables = {}  # (表名, 日期) -> RankTable
+_rank_tables_lock = threading.Lock()
+
+
+def get_rank_table(table, trade_date):
+    """
+    获取某交易日的排名表：进程内缓存 -> 已保存的文件 -> 由本地行情数据计算
+    """
+    key = (table, str(trade_date))
+    with _rank_tables_lock:
+        rank_table = _rank_tables.get(key)
+    if rank_table is None:
+        rank_table = RankTable.load(table, trade_date) or RankTable.build(table, trade_date)
+        with _rank_tables_lock:
+            _rank_tables[key] = rank_table
+    return rank_table
+
+
+def build_rank_tables(trade_date, tables=("daily", "daily_basic", "weekly")):
+    """
+    入库后预计算各表排名（本地没有数据的表跳过，例如非周末交易日的周线）
+
+    :return: 已生成的表名列表
+    """
+    built = []
+    for table in tables:
+        if not cached_exists(os.path.join(dc.csv_dir, f"tushare_{table}_{trade_date}.csv")):
+            continue
+        if RankTable.load(table, trade_date) is None:
+            rank_table = RankTable.build(table, trade_date)
+            with _rank_tables_lock:
+                _rank_tables[(table, str(trade_date))] = rank_table
+        built.append(table)
+    return built
+
+
+if __name__ == "__main__":
+    from stock_utils import get_last_trade_date
+
+    trade_date = get_last_trade_date()
+    build_rank_tables(trade_date)
+
+    daily = get_rank_table("daily", trade_date)
+    logger.info(f"成交额前 10 名：\n{daily.top_k('amount', 10)}")
+    for name in daily.industries("pct_chg")[:3]:
+        logger.info(f"{name} 涨幅前 3 名：\n{daily.top_k('pct_chg', 3, industry=name)}")
+
+    daily_basic = get_rank_table("daily_basic", trade_date)
+    logger.info(f"流通市值不超过 {dc.circ_mv}：{len(daily_basic.value_range('circ_mv', high=dc.circ_mv))} 只")
+    logger.info(f"换手率前 5% ：\n{daily_basic.percentile_range('turnover_rate', 95, 100)}")
@@ -0,0 +1,146 @@
+# filename: refresh_scheduler.py
+
+import datetime
+import os
+import time
+
+from bar_resample import get_period_trade_dates
+from data_cache import dc
+from negative_cache import get_negative_cache
+from rank_table import build_rank_tables
+from stock_utils import setup_logger, get_trade_cal, fetch_daily, fetch_daily_basic, load_stock_basic, \
+    fetch_weekly
+from write_behind import cached_exists
+
+logger = setup_logger()
+
+# 用于探测当日数据是否入库的样本股票（只取一行，开销极小）
+PROBE_TS_CODE = "000001.SZ"
+
+
+class RefreshScheduler(object):
+    """
+    收盘后刷新调度器
+
+    交易日 15:00 之后按 poll_interval 轮询，确认当日 daily / daily_basic 入库后：
+    1. 增量获取当日日线、每日指标、股票基础信息，周最后一个交易日再生成周线，并预计算当日排名表；
+    2. 依次预计算 filter1 ~ filter4 的结果，用户查询时直接读取。
+
+    clock / sleep 可注入，配合 tushare_stub.FakeProApi 即可离线测试。
+    """
+
+    def __init__(self, clock=None, sleep=None, poll_interval=300, start_time=datetime.time(15, 0),
+                 probe_ts_code=PROBE_TS_CODE, stages=None):
+        self.clock = clock or datetime.datetime.now
+        self.sleep = sleep or time.sleep
+        self.poll_interval = poll_interval
+        self.start_time = start_time
+        self.probe_ts_code = probe_ts_code
+        self.stages = stages  # 预计算的阶段函数列表，默认 filter1 ~ filter4
+        self.completed = set()  # 已完成刷新的交易日
+
+    def is_trade_day(self, date_str):
+        """根据本地缓存的交易日历判断是否为交易日"""
+        cal = get_trade_cal(int(date_str[:4]))
+        row = cal[cal["cal_date"].astype(str) == date_str]
+        return not row.empty and int(row["is_open"].iloc[0]) == 1
+
+    def data_available(self, trade_date):
+        """只查询一只样本股票，判断当日日线和每日指标是否已入库"""
+        for api_name in ("daily", "daily_basic"):
+            df = getattr(dc.pro, api_name)(trade_date=trade_date, ts_code=self.probe_ts_code)
+            if df is None or df.empty:
+                return False
+        return True
+
+    def ingest(self, trade_date):
+        """增量获取当日数据，周最后一个交易日补齐整周日线后生成周线"""
+        week_dates = get_period_trade_dates(trade_date, freq="W")
+        is_week_end = bool(week_dates) and week_dates[-1] == trade_date
+
+        daily_dates = week_dates if is_week_end else [trade_date]
+        for date in daily_dates:
+            if not cached_exists(os.path.join(dc.csv_dir, f"tushare_daily_{date}.csv")):
+                fetch_daily(date)
+        if not cached_exists(os.path.join(dc.csv_dir, f"tushare_daily_basic_{trade_date}.csv")):
+            fetch_daily_basic(trade_date)
+        load_stock_basic(trade_date)
+        if is_week_end:
+            fetch_weekly(trade_date)
+        build_rank_tables(trade_date)
+
+    def inputs_ready(self, trade_date):
+        """当日日线及每日指标是否已保存到本地，预计算依赖这两份数据"""
+        missing = [table for table in ("daily", "daily_basic")
+                   if not cached_exists(os.path.join(dc.csv_dir, f"tushare_{table}_{trade_date}.csv"))]
+        if missing:
+            logger.warning(f"{trade_date} 增量获取后仍缺少 {', '.join(missing)}，{self.poll_interval} 秒后重试")
+        return not missing
+
+    def _default_stages(self):
+        import tushare_test1
+        import tushare_test2
+        import tushare_test3
+        import tushare_test4
+        return [tushare_test1.main, tushare_test2.main, tushare_test3.main, tushare_test4.main]
+
+    def precompute(self, trade_date):
+        """依次预计算各筛选阶段，输入未变化的阶段由各阶段按指纹自行跳过"""
+        for stage in self.stages or self._default_stages():
+            name = f"{stage.__module__}.{stage.__name__}"
+            start = time.perf_counter()
+            stage(trade_date)
+            logger.info(f"{name} 预计算完成，耗时 {time.perf_counter() - start:.2f}s")
+
+    def run_once(self):
+        """
+        执行一次检查
+
+        :return: 本次是否完成了刷新
+        """
+        now = self.clock()
+        today = now.strftime("%Y%m%d")
+        if today in self.completed or now.time() < self.start_time or not self.is_trade_day(today):
+            return False
+
+        if not self.data_available(today):
+            logger.info(f"{today} 数据尚未入库，{self.poll_interval} 秒后重试")
+            return False
+
+        logger.info(f"{today} 数据已入库，开始增量获取及预计算")
+        # 入库前请求到的空结果已记入空结果缓存，探测确认入库后清除，否则 ingest 仍会跳过请求
+        negative_cache = get_negative_cache()
+        for api_name in ("daily", "daily_basic"):
+            negative_cache.discard(api_name, today)
+        self.ingest(today)
+        if not self.inputs_ready(today):
+            return False
+        self.precompute(today)
+        self.completed.add(today)
+        return True
+
+    def next_wait(self):
+        """距离下次检查的秒数：收盘前直接等到 start_time，之后按 poll_interval 轮询"""
+        now = self.clock()
+        start = datetime.datetime.combine(now.date(), self.start_time)
+        if now < start:
+            return (start - now).total_seconds()
+        return self.poll_interval
+
+    def run_forever(self, max_iterations=None):
+        """循环调度；max_iterations 用于测试时限定循环次数"""
+        iteration = 0
+        while max_iterations is None or iteration < max_iterations:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"刷新失败：{e}", exc_info=True)
+            self.sleep(self.next_wait())
+            iteration += 1
+
+
+if __name__ == "__main__":
+    try:
+        RefreshScheduler().run_forever()
+    except KeyboardInterrupt:
+        logger.error("检测到手动终止 (Ctrl + C)，程序已安全退出。")
@@ -0,0 +1,255 @@
+# filename: result_stream.py
+
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from data_cache import dc
+from security_master import SID_COLUMN, merge_on_sid
+from stock_utils import setup_logger
+
+logger = setup_logger()
+
+# 默认去重键：filter4 结果中的交易日期列及股票代码
+DEFAULT_KEY = ("trade_date_x", "ts_code")
+
+
+def iter_result_chunks(files, chunksize=50000, dedupe_on=None, dtype=None):
+    """
+    逐块读取多个结果 CSV，内存占用只与块大小（及去重键的数量）有关
+
+    :param files: CSV 文件路径列表，None 或不存在的文件会被跳过
+    :param chunksize: 每块行数
+    :param dedupe_on: 去重列，例如 ('trade_date_x', 'ts_code')；跨文件保留第一次出现的行
+    :param dtype: 传给 pd.read_csv 的类型，默认去重列按字符串读取
+    :return: DataFrame 块的生成器
+    """
+    if dedupe_on:
+        dedupe_on = list(dedupe_on)
+        dtype = {**{col: str for col in dedupe_on}, **(dtype or {})}
+    seen = set()
+
+    for file in files:
+        if not file or not os.path.exists(file):
+            logger.warning(f"结果文件不存在，跳过：{file}")
+            continue
+        for chunk in pd.read_csv(file, chunksize=chunksize, dtype=dtype):
+            if dedupe_on:
+                missing = [col for col in dedupe_on if col not in chunk.columns]
+                if missing:
+                    raise KeyError(f"{file} 缺少去重列: {missing}")
+                keys = pd.Series(list(zip(*(chunk[col] for col in dedupe_on))), index=chunk.index)
+                keep = ~keys.duplicated() & ~keys.map(seen.__contains__).astype(bool)
+                seen.update(keys[keep])
+                chunk = chunk[keep.to_numpy()]
+            if not chunk.empty:
+                yield chunk
+
+
+def iter_result_rows(files, chunksize=50000, dedupe_on=None, dtype=None):
+    """逐行读取多个结果 CSV，每行为 dict，供报表等下游逐行消费"""
+    for chunk in iter_result_chunks(files, chunksize=chunksize, dedupe_on=dedupe_on, dtype=dtype):
+        columns = list(chunk.columns)
+        for values in chunk.itertuples(index=False, name=None):
+            yield dict(zip(columns, values))
+
+
+class _CsvChunkWriter(object):
+    """逐块追加写入 CSV，只写一次表头"""
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = None
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            chunk.to_csv(self.path, index=False, encoding="utf-8_sig")
+        else:
+            chunk.reindex(columns=self.columns).to_csv(self.path, mode="a", index=False, header=False,
+                                                       encoding="utf-8")
+
+    def close(self):
+        pass
+
+
+def _widen_type(pa, left, right):
+    """同名列在两块中类型不同时，取能同时容纳两者的类型：空列取另一方，整数与浮点取浮点，其他取文本"""
+    if left == right or pa.types.is_null(right):
+        return left
+    if pa.types.is_null(left):
+        return right
+    if pa.types.is_integer(left) and pa.types.is_integer(right):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in (left, right)):
+        return pa.float64()
+    return pa.string()
+
+
+class _ParquetChunkWriter(object):
+    """
+    逐块写入 Parquet（列式存储），每块为一个 row group
+
+    各块的列类型可能不同：前面文件中全为整数的列在后面文件中出现小数，或全为空的列（pandas 读为 float64）
+    在后面文件中出现文本。Parquet 文件只能有一个表结构，因此每块先写入临时分块文件，关闭时按所有块
+    加宽列类型（整数→浮点、空列→实际类型、无法统一→文本）后依次写入目标文件。
+    """
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa, self._pq = pa, pq
+        self.path = path
+        self.columns = None
+        self.types = None
+        self._parts = []
+        self._parts_dir = None
+
+    def _to_table(self, chunk):
+        pa = self._pa
+        chunk = chunk.reindex(columns=self.columns)
+        arrays = []
+        for name in self.columns:
+            values = chunk[name]
+            if values.isna().all():
+                arrays.append(pa.nulls(len(values)))
+                continue
+            if pd.api.types.is_float_dtype(values) and values.hasnans:
+                # 整数列含缺失值时 pandas 读为 float64，按可空整数写入以保持整数类型
+                present = values.dropna()
+                if (present == present.round()).all() and present.abs().max() < 2 ** 53:
+                    values = values.astype("Int64")
+            try:
+                arrays.append(pa.array(values, from_pandas=True))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # 同一列混有数字和文本时按文本写入
+                arrays.append(pa.array(values.astype(str).where(values.notna(), None), from_pandas=True))
+        return pa.Table.from_arrays(arrays, names=self.columns)
+
+    def write(self, chunk):
+        if self.columns is None:
+            self.columns = list(chunk.columns)
+            self._parts_dir = tempfile.mkdtemp(prefix=".parts_", dir=os.path.dirname(os.path.abspath(self.path)))
+        table = self._to_table(chunk)
+        if self.types is None:
+            self.types = list(table.schema.types)
+        else:
+            self.types = [_widen_type(self._pa, left, right) for left, right in zip(self.types, table.schema.types)]
+        part = os.path.join(self._parts_dir, f"{len(self._parts):06d}.parquet")
+        self._pq.write_table(table, part)
+        self._parts.append(part)
+
+    def close(self):
+        if self.columns is None:
+            return
+        pa = self._pa
+        try:
+            # 所有块都为空的列按文本写入
+            schema = pa.schema([(name, pa.string() if pa.types.is_null(field_type) else field_type)
+                                for name, field_type in zip(self.columns, self.types)])
+            with self._pq.ParquetWriter(self.path, schema) as writer:
+                for part in self._parts:
+                    writer.write_table(self._pq.read_table(part).cast(schema))
+        finally:
+            shutil.rmtree(self._parts_dir, ignore_errors=True)
+
+
+def _open_writer(output_path):
+    """按扩展名选择输出格式：.parquet 需要 pyarrow，未安装时改为输出同名 CSV"""
+    if output_path.endswith(".parquet"):
+        try:
+            return _ParquetChunkWriter(output_path)
+        except ImportError:
+            csv_path = output_path[:-len(".parquet")] + ".csv"
+            logger.warning(f"未安装 pyarrow，改为输出 CSV：{csv_path}")
+            return _CsvChunkWriter(csv_path)
+    return _CsvChunkWriter(output_path)
+
+
+def _empty_frame(files, dedupe_on=None, dtype=None):
+    """取第一个存在的文件的表头，构造没有数据行的 DataFrame"""
+    if dedupe_on:
+        dtype = {**{col: str for col in dedupe_on}, **(dtype or {})}
+    for file in files:
+        if file and os.path.exists(file):
+            return pd.read_csv(file, nrows=0, dtype=dtype)
+    return pd.DataFrame()
+
+
+def stream_merge(files, output_path, chunksize=50000, dedupe_on=None, dtype=None):
+    """
+    流式合并多个结果 CSV：逐块读取、可选去重、逐块写出，不在内存中保留完整历史
+
+    :param files: CSV 文件路径列表
+    :param output_path: 输出路径，.parquet 为列式输出（需要 pyarrow），其他为 CSV
+    :param dedupe_on: 去重列，例如 DEFAULT_KEY
+    :return: (实际输出路径, 写出行数)；没有数据时同样输出只有表头的文件
+    """
+    writer = _open_writer(output_path)
+    rows = 0
+    try:
+        for chunk in iter_result_chunks(files, chunksize=chunksize, dedupe_on=dedupe_on, dtype=dtype):
+            writer.write(chunk)
+            rows += len(chunk)
+        if not rows:
+            writer.write(_empty_frame(files, dedupe_on, dtype))
+    finally:
+        writer.close()
+
+    if rows:
+        logger.info(f"已合并 {len(files)} 个文件，共 {rows} 行，保存至 {writer.path}")
+    else:
+        logger.warning("没有可合并的数据")
+    return writer.path, rows
+
+
+def stream_join(left_file, right_file, output_path, on="ts_code", chunksize=50000):
+    """
+    两个结果文件按 on 内连接：右侧文件（单期筛选结果）整体读入，左侧文件逐块连接并逐块写出
+
+    输出与 pd.merge(left, right, on=on, how='inner') 相同（重名列加 _x / _y 后缀）；
+    on 为 'sid' 时按证券 ID 对齐（sid 与 ts_code 均作为连接键）。
+
+    :return: (实际输出路径, 左侧行数, 右侧行数, 写出行数)
+    """
+    right = pd.read_csv(right_file)
+    writer = _open_writer(output_path)
+    left_rows = rows = 0
+    empty = None
+    try:
+        for chunk in pd.read_csv(left_file, chunksize=chunksize):
+            left_rows += len(chunk)
+            if on == SID_COLUMN:
+                merged = merge_on_sid(chunk, right, how="inner")
+            else:
+                merged = chunk.merge(right, on=on, how="inner")
+            if merged.empty:
+                empty = merged
+                continue
+            writer.write(merged)
+            rows += len(merged)
+        if not rows:
+            # 没有交集（或左侧文件没有数据行）时仍输出只有表头的文件
+            if empty is None:
+                header = pd.read_csv(left_file, nrows=0)
+                if on == SID_COLUMN:
+                    empty = merge_on_sid(header, right.iloc[0:0], how="inner")
+                else:
+                    empty = header.merge(right.iloc[0:0], on=on, how="inner")
+            writer.write(empty)
+    finally:
+        writer.close()
+    return writer.path, left_rows, len(right), rows
+
+
+if __name__ == "__main__":
+    import glob
+
+    result_files = sorted(glob.glob(os.path.join(dc.filter_dir, "tushare_stock_basic_filter4_2*.csv")))
+    history_path = os.path.join(dc.filter_dir, "tushare_stock_basic_filter4_history.parquet")
+    stream_merge(result_files, history_path, dedupe_on=DEFAULT_KEY)
+    for row in iter_result_rows(result_files, dedupe_on=DEFAULT_KEY):
+        logger.info(row)
+        break
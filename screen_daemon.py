@@ -0,0 +1,284 @@
+# filename: screen_daemon.py
+
+import datetime
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from data_cache import dc
+from quarter_panel import load_quarter_panel, screen_quarter_panel, build_quarter_rules
+from screen_rules import build_filter_rules, build_selection_rules, evaluate_rules, get_selection_thresholds
+from security_master import merge_on_sid
+from stock_utils import setup_logger, get_last_n_trade_dates, get_quarter_end_dates, generate_quarter_list, \
+    load_csv, load_stock_basic, fetch_daily, fetch_daily_basic, fetch_weekly
+from weekly_rank import rank_weekly_panel, format_rank_labels
+
+logger = setup_logger()
+
+# 筛选参数及其类型，HTTP 查询参数按此转换
+SCREEN_PARAMS = {
+    "circ_mv": float,
+    "roe": float,
+    "q_netprofit_yoy": float,
+    "debt_to_assets": float,
+    "top_volume": int,
+    "top_pct_chg": int,
+}
+
+RESULT_FIELDS = ['ts_code', 'name', 'trade_date', 'rank', 'area', 'industry', 'market', 'pe']
+
+
+class ScreenCache(object):
+    """
+    常驻内存的筛选数据：交易日、股票基础信息、日线/每日指标、周线及季度财务面板
+
+    refresh() 只加载新出现（或之前为空）的交易日，替换数据时持锁，筛选时读取快照，互不阻塞；
+    同一时间只有一个刷新在执行，并发调用直接返回。
+    """
+
+    def __init__(self, history_days=None):
+        self.history_days = history_days or dc.daemon_config.get("history_days", 20)
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self.trade_dates = []
+        self.stock_basic = None
+        self.filter1 = None
+        self.daily = {}
+        self.daily_basic = {}
+        self.weekly = {}
+        self.quarter_panel = None
+        self.loaded_at = None
+
+    @property
+    def trade_date(self):
+        return self.trade_dates[0] if self.trade_dates else None
+
+    def refresh(self):
+        """增量刷新：加载新的交易日数据，淘汰超出保留天数的旧数据"""
+        if not self._refresh_lock.acquire(blocking=False):
+            logger.info("已有刷新在执行，跳过本次刷新")
+            return False
+        try:
+            return self._refresh()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh(self):
+        trade_dates = get_last_n_trade_dates(n=self.history_days)
+        if not trade_dates:
+            logger.warning("未获取到交易日，跳过刷新")
+            return False
+        new_dates = [d for d in trade_dates if d not in self.daily_basic]
+        if trade_dates == self.trade_dates and not new_dates:
+            return False
+
+        start = time.perf_counter()
+        daily = {d: self.daily[d] for d in trade_dates if d in self.daily}
+        daily_basic = {d: self.daily_basic[d] for d in trade_dates if d in self.daily_basic}
+        for trade_date in new_dates:
+            daily_df = load_csv("tushare_daily", fetch_daily, trade_date)
+            daily_basic_df = load_csv("tushare_daily_basic", fetch_daily_basic, trade_date)
+            if daily_basic_df.empty:
+                # 不保留空数据，下次刷新时重新获取
+                logger.warning(f"{trade_date} 没有每日指标数据，下次刷新时重试")
+                continue
+            daily[trade_date], daily_basic[trade_date] = daily_df, daily_basic_df
+        loaded_dates = [d for d in new_dates if d in daily_basic]
+
+        stock_basic, filter1 = self.stock_basic, self.filter1
+        if trade_dates[0] != self.trade_date:
+            stock_basic = load_stock_basic(trade_dates[0])
+            filter1 = stock_basic[evaluate_rules(stock_basic, build_filter_rules(), report=False)]
+
+        quarter_panel = self.quarter_panel
+        if quarter_panel is None or loaded_dates:
+            quarters = generate_quarter_list(dc.period_year - 1)
+            quarter_panel = load_quarter_panel(quarters, fields=["roe", "q_netprofit_yoy", "debt_to_assets"])
+
+        with self._lock:
+            self.trade_dates = trade_dates
+            self.daily, self.daily_basic = daily, daily_basic
+            self.weekly = {d: df for d, df in self.weekly.items() if d in daily}
+            self.stock_basic, self.filter1 = stock_basic, filter1
+            self.quarter_panel = quarter_panel
+            self.loaded_at = datetime.datetime.now()
+
+        logger.info(f"缓存已刷新：最近交易日 {trade_dates[0]}，新增 {len(loaded_dates)} 个交易日，"
+                    f"耗时 {time.perf_counter() - start:.2f}s")
+        return True
+
+    def get_weekly(self, trade_date):
+        """周线数据按交易日缓存（fetch_weekly 优先由本地日线合成）；空数据不缓存，下次筛选时重新获取"""
+        weekly = self.weekly.get(trade_date)
+        if weekly is None:
+            weekly = fetch_weekly(trade_date)
+            if weekly is None or weekly.empty:
+                logger.warning(f"{trade_date} 没有周线数据，下次筛选时重试")
+                return weekly
+            with self._lock:
+                self.weekly[trade_date] = weekly
+        return weekly
+
+    def run_screen(self, params=None):
+        """
+        在常驻数据上执行 filter1 ~ filter4 的完整筛选
+
+        :param params: 覆盖 config.yaml 的参数，可包含 trade_date、quarters 及 SCREEN_PARAMS 中的阈值
+        :return: 可 JSON 序列化的结果字典
+        """
+        start = time.perf_counter()
+        params = dict(params or {})
+        with self._lock:
+            trade_date = params.pop("trade_date", None) or self.trade_date
+            filter1 = self.filter1
+            daily_basic = self.daily_basic.get(trade_date)
+            quarter_panel = self.quarter_panel
+        if daily_basic is None:
+            raise KeyError(f"交易日 {trade_date} 不在常驻数据中")
+
+        quarters = params.pop("quarters", None) or [get_quarter_end_dates(dc.period_year)[dc.period_quarter]]
+        thresholds = get_selection_thresholds(params)
+
+        # filter2：流通市值
+        merged = merge_on_sid(filter1, daily_basic, how="left")
+        filter2 = merged[evaluate_rules(merged, build_selection_rules("daily_basic", thresholds), report=False)]
+
+        # filter3：财务指标（所选报告期均满足）
+        panel = quarter_panel[quarter_panel.index.get_level_values("end_date").isin(quarters)]
+        passing = screen_quarter_panel(panel, build_quarter_rules(thresholds), quarters, report=False)
+        filter3 = filter2[filter2["ts_code"].isin(passing)]
+
+        # filter4：周成交额、周涨幅排名
+        weekly = self.get_weekly(trade_date)
+        merged = merge_on_sid(filter3, weekly, how="inner", suffixes=("", "_weekly"))
+        ranks = rank_weekly_panel(merged, top_n={"amount": thresholds["top_volume"],
+                                                 "pct_chg": thresholds["top_pct_chg"]},
+                                  week_col="trade_date_weekly")
+        ranks["rank"] = format_rank_labels(ranks)
+        result = ranks[["ts_code", "rank"]].merge(merged.drop(columns=["rank"], errors="ignore"), on="ts_code")
+        result = result.drop_duplicates(subset="ts_code", keep="first")[RESULT_FIELDS]
+
+        return {
+            "trade_date": trade_date,
+            "quarters": quarters,
+            "params": thresholds,
+            "counts": {"filter1": len(filter1), "filter2": len(filter2), "filter3": len(filter3),
+                       "filter4": len(result)},
+            "stocks": result.replace({np.nan: None}).to_dict("records"),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+
+
+def parse_screen_params(query):
+    """将 HTTP 查询参数转换为筛选参数"""
+    params = {}
+    for key, values in query.items():
+        value = values[-1]
+        if key in SCREEN_PARAMS:
+            params[key] = SCREEN_PARAMS[key](value)
+        elif key == "trade_date":
+            params[key] = value
+        elif key == "quarters":
+            params[key] = [q for q in value.split(",") if q]
+        else:
+            raise ValueError(f"未知参数: {key}")
+    return params
+
+
+class ScreenRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health                      服务状态
+    GET  /screen?roe=6&top_volume=10  按参数执行筛选
+    POST /refresh                     立即在后台刷新缓存
+    """
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        cache = self.server.cache
+        if url.path == "/health":
+            self._send_json(200, {"status": "ok", "trade_date": cache.trade_date, "loaded_at": cache.loaded_at})
+        elif url.path == "/screen":
+            try:
+                self._send_json(200, cache.run_screen(parse_screen_params(parse_qs(url.query))))
+            except (KeyError, ValueError) as e:
+                self._send_json(400, {"error": str(e)})
+            except Exception as e:
+                logger.error(f"筛选失败：{e}", exc_info=True)
+                self._send_json(500, {"error": str(e)})
+        else:
+            self._send_json(404, {"error": f"未知路径: {url.path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path == "/refresh":
+            threading.Thread(target=self.server.cache.refresh, daemon=True).start()
+            self._send_json(202, {"status": "refreshing"})
+        else:
+            self._send_json(404, {"error": f"未知路径: {self.path}"})
+
+    def log_message(self, fmt, *args):
+        logger.debug(f"{self.address_string()} - {fmt % args}")
+
+
+class ScreenServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, cache):
+        super().__init__(address, ScreenRequestHandler)
+        self.cache = cache
+
+
+def _refresh_loop(cache, interval, stop_event):
+    """后台定期检查新数据"""
+    while not stop_event.wait(interval):
+        try:
+            cache.refresh()
+        except Exception as e:
+            logger.error(f"后台刷新失败：{e}", exc_info=True)
+
+
+def serve(host=None, port=None, refresh_interval=None, cache=None):
+    """
+    启动常驻筛选服务（阻塞运行）
+
+    :param host: 监听地址，默认 config.yaml 中 daemon.host
+    :param port: 监听端口，默认 config.yaml 中 daemon.port
+    :param refresh_interval: 后台刷新间隔（秒）
+    :param cache: 预先加载的 ScreenCache，默认新建并预热
+    """
+    host = host or dc.daemon_config.get("host", "127.0.0.1")
+    port = port or dc.daemon_config.get("port", 8765)
+    refresh_interval = refresh_interval or dc.daemon_config.get("refresh_interval", 300)
+
+    if cache is None:
+        cache = ScreenCache()
+        cache.refresh()
+
+    stop_event = threading.Event()
+    threading.Thread(target=_refresh_loop, args=(cache, refresh_interval, stop_event), daemon=True).start()
+
+    server = ScreenServer((host, port), cache)
+    logger.info(f"常驻筛选服务已启动：http://{host}:{port}/screen")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.error("检测到手动终止 (Ctrl + C)，程序已安全退出。")
+    finally:
+        stop_event.set()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else None)
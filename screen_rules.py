@@ -0,0 +1,173 @@
+# filename: screen_rules.py
+
+import datetime
+from collections import namedtuple
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from data_cache import dc
+from stock_utils import setup_logger
+
+logger = setup_logger()
+
+# 单条筛选规则：expr 为 DataFrame.eval 表达式，结果为 True 的行保留
+# cost 为估算的计算成本，pass_rate 为估算的保留比例，两者共同决定规则的执行顺序
+Rule = namedtuple("Rule", ["name", "expr", "cost", "pass_rate", "description"])
+
+# 计算成本：数值比较 < 字符串等值/集合判断 < 字符串方法
+COST_NUMERIC = 1
+COST_ISIN = 2
+COST_STRING = 3
+
+
+def _condition_enabled(filter_config, name):
+    """读取 filter_conditions 中的 enabled 标志，未配置的条件视为启用"""
+    for condition in filter_config.get("filter_conditions") or []:
+        if condition.get("name") == name:
+            return bool(condition.get("enabled", True))
+    return True
+
+
+def build_filter_rules(filter_config=None, today=None):
+    """
+    根据 config.yaml 中 filter 配置生成股票基础信息的筛选规则
+
+    :param filter_config: filter 配置，默认取 dc.filter_config
+    :param today: 计算上市年限的基准日期，默认为今天
+    :return: Rule 列表（已按执行顺序排序）
+    """
+    if filter_config is None:
+        filter_config = dc.filter_config
+    if today is None:
+        today = datetime.date.today()
+
+    rules = []
+
+    if _condition_enabled(filter_config, "exclude_recent_listings"):
+        years = filter_config.get("years_to_exclude", 2)
+        cutoff = (today - relativedelta(years=years)).strftime("%Y%m%d")
+        rules.append(Rule("exclude_recent_listings", f'list_date.astype("str") < "{cutoff}"',
+                          COST_STRING, 0.9, f"排除近{years}年上市"))
+
+    if filter_config.get("exclude_st", True) and _condition_enabled(filter_config, "exclude_st_stocks"):
+        rules.append(Rule("exclude_st_stocks", '~name.str.contains("ST", na=False)',
+                          COST_STRING, 0.95, "排除ST股票"))
+
+    if filter_config.get("exclude_start_8_9", True) and _condition_enabled(filter_config, "exclude_start_8_9"):
+        # 4/8/9 开头为北交所及新三板股票
+        rules.append(Rule("exclude_start_8_9", '~ts_code.str[0].isin(["4", "8", "9"])',
+                          COST_STRING, 0.95, "排除4/8/9开头股票"))
+
+    market_type = filter_config.get("market_type")
+    if market_type and _condition_enabled(filter_config, "market_type_mainboard"):
+        # 主板涨跌幅约束为10%。创业板和科创板涨跌幅约束为20%。
+        rules.append(Rule("market_type_mainboard", f'market == "{market_type}"',
+                          COST_ISIN, 0.6, f"仅保留{market_type}股票"))
+
+    if filter_config.get("exclude_private_and_foreign", True) and \
+            _condition_enabled(filter_config, "exclude_private_foreign"):
+        rules.append(Rule("exclude_private_foreign", 'act_ent_type not in ["民营企业", "外资企业"]',
+                          COST_ISIN, 0.4, "排除民营和外资企业"))
+
+    return order_rules(rules)
+
+
+def get_selection_thresholds(overrides=None):
+    """获取 stock_selection 阈值，overrides 中的值覆盖 config.yaml 配置"""
+    thresholds = {
+        "circ_mv": dc.circ_mv,
+        "roe": dc.roe,
+        "q_netprofit_yoy": dc.q_netprofit_yoy,
+        "debt_to_assets": dc.debt_to_assets,
+        "top_volume": dc.top_volume,
+        "top_pct_chg": dc.top_pct_chg,
+    }
+    thresholds.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return thresholds
+
+
+def build_selection_rules(stage, thresholds=None):
+    """
+    根据 config.yaml 中 stock_selection 阈值生成筛选规则
+
+    :param stage: 'daily_basic'（每日指标筛选）或 'fina_indicator'（财务指标筛选）
+    :param thresholds: 覆盖 config.yaml 的阈值，例如 {'circ_mv': 5000000}
+    :return: Rule 列表（已按执行顺序排序）
+    """
+    t = get_selection_thresholds(thresholds)
+    if stage == "daily_basic":
+        rules = [
+            Rule("circ_mv", f"circ_mv <= {t['circ_mv']}", COST_NUMERIC, 0.95, "流通市值上限"),
+        ]
+    elif stage == "fina_indicator":
+        rules = [
+            Rule("roe", f"roe >= {t['roe']}", COST_NUMERIC, 0.5, "净资产收益率下限"),
+            Rule("q_netprofit_yoy", f"q_netprofit_yoy > {t['q_netprofit_yoy']}", COST_NUMERIC, 0.5,
+                 "单季度净利润同比增长率下限"),
+            Rule("debt_to_assets", f"debt_to_assets < {t['debt_to_assets']}", COST_NUMERIC, 0.9, "资产负债率上限"),
+        ]
+    else:
+        raise ValueError(f"未知的筛选阶段: {stage}")
+    return order_rules(rules)
+
+
+def order_rules(rules):
+    """
+    按 (1 - 保留比例) / 成本 降序排列规则，廉价且淘汰率高的规则优先
+
+    :param rules: Rule 列表
+    :return: 排序后的 Rule 列表
+    """
+    return sorted(rules, key=lambda rule: (1 - rule.pass_rate) / rule.cost, reverse=True)
+
+
+def _engine(rules):
+    """含字符串运算的表达式只能使用 python 引擎，纯数值表达式交给 pandas 默认引擎（numexpr）"""
+    return "python" if any(rule.cost > COST_NUMERIC for rule in rules) else None
+
+
+def compile_rules(rules):
+    """将规则编译为一个布尔表达式，可直接用于 DataFrame.eval / DataFrame.query"""
+    if not rules:
+        return "True"
+    return " & ".join(f"({rule.expr})" for rule in rules)
+
+
+def evaluate_rules(df, rules, report=True):
+    """
+    计算规则的布尔掩码：所有规则编译为一个表达式，在整个 DataFrame 上一次求值，不生成中间 DataFrame
+
+    :param df: 待筛选数据
+    :param rules: Rule 列表（通常已由 order_rules 排序，剔除数量按此顺序记录）
+    :param report: 是否记录每条规则的剔除数量（各规则在整表上的掩码按顺序累计与运算）
+    :return: 与 df 等长的布尔 ndarray
+    """
+    if not rules:
+        return np.ones(len(df), dtype=bool)
+    if df.empty:
+        return np.zeros(0, dtype=bool)
+
+    expr = compile_rules(rules)
+    logger.debug(f"筛选表达式：{expr}")
+    alive = np.asarray(df.eval(expr, engine=_engine(rules)), dtype=bool)
+    if report:
+        masks = np.vstack([np.asarray(df.eval(rule.expr, engine=_engine([rule])), dtype=bool) for rule in rules])
+        previous = len(df)
+        for rule, remaining in zip(rules, np.logical_and.accumulate(masks).sum(axis=1)):
+            logger.info(f"{rule.description}：剔除 {previous - int(remaining)} 条，剩余 {int(remaining)} 条")
+            previous = int(remaining)
+    return alive
+
+
+def apply_rules(df, rules, report=True):
+    """按规则筛选 DataFrame，仅在最后生成一次结果"""
+    return df[evaluate_rules(df, rules, report=report)]
+
+
+if __name__ == "__main__":
+    for item in build_filter_rules():
+        logger.info(item)
+    logger.info(compile_rules(build_filter_rules()))
+    logger.info(compile_rules(build_selection_rules("daily_basic")))
+    logger.info(compile_rules(build_selection_rules("fina_indicator")))
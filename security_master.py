@@ -0,0 +1,275 @@
+# filename: security_master.py
+
+import contextlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+
+logger = setup_logger()
+
+# 缓存表中证券 ID 的列名
+SID_COLUMN = "sid"
+# 合并时除 sid 外同样作为连接键的列（两表一致，不加后缀）
+KEY_COLUMNS = [SID_COLUMN, "ts_code"]
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """跨进程独占锁（锁文件为 path.lock），保证多个进程分配 sid 时不会重复"""
+    with open(f"{path}.lock", "a+b") as f:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class SecurityMaster(object):
+    """
+    证券主表：ts_code -> 稳定的 int32 证券 ID（sid）
+
+    保存在 data/security_master.csv，只追加不修改：首次出现的 ts_code 分配下一个 ID，退市股票的 ID 保留，
+    因此任意时期的缓存文件中同一股票的 sid 都相同，可直接按整数对齐或按位置取值。
+    多个进程共用同一文件：分配新 ID 时持有文件锁，并先读入其他进程追加的记录。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(dc.csv_dir, "security_master.csv")
+        self._lock = threading.Lock()
+        self._codes = []
+        self._reload()
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _reload(self):
+        """读入文件中尚未加载的记录（其他进程追加的 ID）"""
+        if os.path.exists(self.path):
+            df = pd.read_csv(self.path, dtype={"ts_code": str, SID_COLUMN: np.int32})
+            tail = df[df[SID_COLUMN] >= len(self._codes)].sort_values(SID_COLUMN)
+            self._codes.extend(tail["ts_code"].tolist())
+        self._index = pd.Index(self._codes)
+
+    def _append(self, new_codes):
+        """为新 ts_code 分配 ID 并追加写入（调用方持有锁）"""
+        with _file_lock(self.path):
+            self._reload()
+            new_codes = [code for code in new_codes if code not in self._index]
+            if not new_codes:
+                return
+            start = len(self._codes)
+            self._codes.extend(new_codes)
+            self._index = pd.Index(self._codes)
+            new_rows = pd.DataFrame({SID_COLUMN: np.arange(start, start + len(new_codes), dtype=np.int32),
+                                     "ts_code": new_codes})
+            header = not os.path.exists(self.path)
+            new_rows.to_csv(self.path, mode="a", header=header, index=False, encoding="utf-8")
+        logger.info(f"证券主表新增 {len(new_codes)} 只股票，共 {len(self._codes)} 只")
+
+    def ids(self, ts_codes, register=True):
+        """
+        ts_code -> sid（向量化）
+
+        :param register: 是否为未登记的 ts_code 分配新 ID；为 False 时未登记的返回 -1
+        :return: np.int32 数组
+        """
+        codes = pd.Index(pd.Series(ts_codes, dtype=object).astype(str))
+        with self._lock:
+            sids = self._index.get_indexer(codes)
+            if register and (sids < 0).any():
+                self._append(pd.unique(codes[sids < 0]).tolist())
+                sids = self._index.get_indexer(codes)
+        return sids.astype(np.int32)
+
+    def codes(self, sids):
+        """sid -> ts_code"""
+        with self._lock:
+            if len(sids) and int(np.max(sids)) >= len(self._codes):
+                self._reload()
+            return np.asarray(self._codes, dtype=object)[np.asarray(sids, dtype=np.int64)]
+
+    def symbol_set(self, ts_codes=None, sids=None):
+        """由 ts_code 或 sid 构建位图集合"""
+        if sids is None:
+            sids = self.ids(ts_codes)
+        return SymbolSet.from_ids(sids, len(self))
+
+
+class SymbolSet(object):
+    """
+    以 sid 为位置的位图集合（每只股票 1 bit），交集、并集、差集均为按字节的位运算
+
+    多年面板上逐日比较股票池时，比 Python set 的字符串哈希省内存也更快。
+    """
+
+    __slots__ = ("bits", "size")
+
+    def __init__(self, bits, size):
+        self.bits = bits
+        self.size = size
+
+    @classmethod
+    def from_ids(cls, sids, size=None):
+        sids = np.asarray(sids, dtype=np.int64)
+        sids = sids[sids >= 0]
+        size = max(size or 0, int(sids.max()) + 1 if len(sids) else 0)
+        mask = np.zeros(size, dtype=bool)
+        mask[sids] = True
+        return cls(np.packbits(mask, bitorder="little"), size)
+
+    def _aligned(self, other):
+        size = max(self.size, other.size)
+        n = (size + 7) // 8
+        return np.pad(self.bits, (0, n - len(self.bits))), np.pad(other.bits, (0, n - len(other.bits))), size
+
+    def __and__(self, other):
+        a, b, size = self._aligned(other)
+        return SymbolSet(a & b, size)
+
+    def __or__(self, other):
+        a, b, size = self._aligned(other)
+        return SymbolSet(a | b, size)
+
+    def __sub__(self, other):
+        a, b, size = self._aligned(other)
+        return SymbolSet(a & ~b, size)
+
+    def __len__(self):
+        return int(np.unpackbits(self.bits).sum())
+
+    def __bool__(self):
+        return bool(self.bits.any())
+
+    def contains(self, sids):
+        """逐个判断 sid 是否在集合中（向量化）"""
+        sids = np.asarray(sids, dtype=np.int64)
+        result = np.zeros(len(sids), dtype=bool)
+        valid = (sids >= 0) & (sids < self.size)
+        positions = sids[valid]
+        result[valid] = (self.bits[positions >> 3] >> (positions & 7)) & 1 == 1
+        return result
+
+    def ids(self):
+        return np.flatnonzero(np.unpackbits(self.bits, bitorder="little")[:self.size]).astype(np.int32)
+
+    def codes(self):
+        return get_security_master().codes(self.ids())
+
+
+_security_master = None
+_security_master_lock = threading.Lock()
+
+
+def get_security_master():
+    """获取进程内共享的证券主表"""
+    global _security_master
+    with _security_master_lock:
+        if _security_master is None:
+            _security_master = SecurityMaster()
+        return _security_master
+
+
+def attach_ids(df):
+    """
+    添加 sid 列（第一列）并按 sid 排序，缓存表写出前调用
+
+    已有 sid 列时只在未排序时排序。
+    """
+    if df is None or "ts_code" not in df.columns:
+        return df
+    if SID_COLUMN not in df.columns:
+        df = df.copy()
+        df.insert(0, SID_COLUMN, get_security_master().ids(df["ts_code"]))
+    if not df[SID_COLUMN].is_monotonic_increasing:
+        df = df.sort_values(SID_COLUMN, kind="stable")
+    if not isinstance(df.index, pd.RangeIndex) or df.index.start != 0 or df.index.step != 1:
+        df = df.reset_index(drop=True)
+    return df
+
+
+def symbol_set(df):
+    """DataFrame 中股票的位图集合（优先使用 sid 列）"""
+    if SID_COLUMN in df.columns:
+        return SymbolSet.from_ids(df[SID_COLUMN].to_numpy(), len(get_security_master()))
+    return get_security_master().symbol_set(df["ts_code"])
+
+
+def align_positions(right_sids, left_sids):
+    """
+    left_sids 中每个 sid 在 right_sids（升序）中的位置，不存在时为 -1
+
+    两表均按 sid 排序存储，连接只是一次二分查找，不需要构建字符串哈希表。
+    """
+    right_sids = np.asarray(right_sids)
+    left_sids = np.asarray(left_sids)
+    positions = np.searchsorted(right_sids, left_sids)
+    positions = np.minimum(positions, max(len(right_sids) - 1, 0))
+    found = len(right_sids) > 0
+    matched = right_sids[positions] == left_sids if found else np.zeros(len(left_sids), dtype=bool)
+    return np.where(matched, positions, -1)
+
+
+def merge_on_sid(left, right, how="left", suffixes=("_x", "_y")):
+    """
+    按 sid 连接两张表，结果与 pd.merge(left, right, on='ts_code', how=how) 一致（sid 与 ts_code 只保留一列）
+
+    右表的 sid 必须唯一（同一交易日/报告期的缓存表均满足）；不唯一时退回 pd.merge。
+
+    :param how: 'left' 或 'inner'，保持左表行顺序
+    """
+    if how not in ("left", "inner"):
+        raise ValueError(f"不支持的连接方式: {how}，可选 left / inner")
+    left, right = attach_ids(left), attach_ids(right)
+    right_sids = right[SID_COLUMN].to_numpy()
+    if len(right_sids) > 1 and not (right_sids[1:] != right_sids[:-1]).all():
+        return pd.merge(left, right.drop(columns="ts_code"), on=SID_COLUMN, how=how, suffixes=suffixes)
+
+    positions = align_positions(right_sids, left[SID_COLUMN].to_numpy())
+    found = positions >= 0
+    if how == "inner" and not found.all():
+        left = left[found]
+        positions = positions[found]
+        found = found[found]
+
+    right_columns = [col for col in right.columns if col not in KEY_COLUMNS]
+    overlap = set(left.columns) & set(right_columns)
+    columns = {(f"{col}{suffixes[0]}" if col in overlap else col): left[col].to_numpy() for col in left.columns}
+    for col in right_columns:
+        values = right[col]
+        if found.all():
+            values = values.to_numpy()[positions]
+        else:
+            # 左连接中右表没有的行为缺失值，与 pd.merge 的类型提升一致
+            values = values.reindex(positions).to_numpy()
+        columns[f"{col}{suffixes[1]}" if col in overlap else col] = values
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(positions)))
+
+
+if __name__ == "__main__":
+    from stock_utils import get_last_trade_date, load_stock_basic
+
+    trade_date = get_last_trade_date()
+    stock_basic = attach_ids(load_stock_basic(trade_date))
+    logger.info(f"证券主表共 {len(get_security_master())} 只股票")
+    logger.info(stock_basic.head())
+
+    daily_basic = attach_ids(pd.read_csv(os.path.join(dc.csv_dir, f"tushare_daily_basic_{trade_date}.csv")))
+    missing = symbol_set(stock_basic) - symbol_set(daily_basic)
+    logger.info(f"当日无每日指标的股票 {len(missing)} 只：{missing.codes()[:10]}")
+    logger.info(merge_on_sid(stock_basic, daily_basic).head())
@@ -0,0 +1,317 @@
+# filename: snapshot_store.py
+
+import glob
+import json
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+
+logger = setup_logger()
+
+# 差异记录的操作类型列
+OP_COLUMN = "_op"
+OP_ADD = "add"  # 新上市
+OP_DELETE = "delete"  # 退市
+OP_UPDATE = "update"  # 字段变化，例如更名为 ST
+
+# 记录类型
+KIND_BASE = "base"  # 整表快照
+KIND_DIFF = "diff"  # 相对上一个记录日期的差异
+KIND_SAME = "same"  # 与上一个记录日期相同，不保存文件
+
+
+class SnapshotStore(object):
+    """
+    缓慢变化表（如 stock_basic）的快照存储：一份基准快照加逐日差异
+
+    文件保存在 data/snapshot_{name}/ 下：
+      manifest.json     记录日期 -> base / diff / same
+      base_{date}.csv   整表快照
+      diff_{date}.csv   差异记录，_op 列为 add / delete / update
+    任意日期的数据由不晚于该日期的最近一份基准快照依次应用差异还原；
+    差异过大或差异链过长时重新保存基准快照，保证还原速度。
+    """
+
+    def __init__(self, name, key="ts_code", rebase_ratio=0.2, max_chain=60):
+        self.name = name
+        self.key = key
+        self.rebase_ratio = rebase_ratio  # 差异行数超过整表该比例时保存基准快照
+        self.max_chain = max_chain  # 两份基准快照之间最多的差异文件数
+        self.dir = os.path.join(dc.csv_dir, f"snapshot_{name}")
+        self._manifest_path = os.path.join(self.dir, "manifest.json")
+        self._lock = threading.RLock()
+        self._cache = (None, None)  # 最近一次还原的 (日期, DataFrame)
+        os.makedirs(self.dir, exist_ok=True)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"key": self.key, "dates": {}}
+
+    def _write_manifest(self):
+        tmp_path = f"{self._manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self._manifest_path)
+
+    def _path(self, kind, date):
+        return os.path.join(self.dir, f"{kind}_{date}.csv")
+
+    @property
+    def dates(self):
+        """已记录的日期（升序）"""
+        return sorted(self.manifest["dates"])
+
+    def latest_date(self):
+        dates = self.dates
+        return dates[-1] if dates else None
+
+    def earliest_date(self):
+        dates = self.dates
+        return dates[0] if dates else None
+
+    def _normalize(self, df):
+        """统一为字符串存储，缺失值记为空字符串，避免 CSV 往返后类型变化造成误判"""
+        df = df.astype(object).where(df.notna(), "").astype(str)
+        return df.drop_duplicates(subset=self.key, keep="last").set_index(self.key).sort_index()
+
+    @staticmethod
+    def _infer_types(df):
+        """还原为与 pd.read_csv 一致的类型：空字符串为 NaN，可转为数值的列转为数值"""
+        df = df.replace("", np.nan)
+        for col in df.columns:
+            try:
+                df[col] = pd.to_numeric(df[col])
+            except (ValueError, TypeError):
+                pass
+        return df
+
+    def _read(self, kind, date):
+        return pd.read_csv(self._path(kind, date), dtype=str, keep_default_na=False).set_index(self.key)
+
+    def _state(self, date):
+        """还原不晚于 date 的最近记录日期的数据（字符串形式，以 key 为索引）"""
+        dates = [d for d in self.dates if d <= date]
+        if not dates:
+            return None, None
+        target = dates[-1]
+
+        cached_date, cached_state = self._cache
+        if cached_date == target:
+            return target, cached_state
+
+        # 从缓存或最近的基准快照开始依次应用差异
+        kinds = self.manifest["dates"]
+        start = max(i for i, d in enumerate(dates) if kinds[d] == KIND_BASE)
+        if cached_date is not None and dates[start] <= cached_date < target:
+            start = dates.index(cached_date)
+            state = cached_state
+        else:
+            state = self._read(KIND_BASE, dates[start])
+
+        for d in dates[start + 1:]:
+            if kinds[d] == KIND_BASE:
+                state = self._read(KIND_BASE, d)
+            elif kinds[d] == KIND_DIFF:
+                state = self._apply_diff(state, self._read(KIND_DIFF, d))
+
+        self._cache = (target, state)
+        return target, state
+
+    @staticmethod
+    def _apply_diff(state, diff):
+        ops = diff.pop(OP_COLUMN)
+        upserts = diff[ops != OP_DELETE]
+        state = state.drop(index=diff.index, errors="ignore")
+        return pd.concat([state, upserts.reindex(columns=state.columns, fill_value="")]).sort_index()
+
+    def _diff(self, old, new):
+        """比较两份快照，返回差异记录（以 key 为索引，含 _op 列）"""
+        columns = old.columns.union(new.columns, sort=False)
+        old = old.reindex(columns=columns, fill_value="")
+        new = new.reindex(columns=columns, fill_value="")
+
+        added = new.index.difference(old.index)
+        deleted = old.index.difference(new.index)
+        common = new.index.intersection(old.index)
+        changed = common[(old.loc[common] != new.loc[common]).any(axis=1).to_numpy()]
+
+        parts = [
+            new.loc[added].assign(**{OP_COLUMN: OP_ADD}),
+            old.loc[deleted].assign(**{OP_COLUMN: OP_DELETE}),
+            new.loc[changed].assign(**{OP_COLUMN: OP_UPDATE}),
+        ]
+        return pd.concat(parts)
+
+    def save(self, date, df):
+        """
+        记录某日期的整表数据：与之前的数据相同时只记录日期，否则保存差异或基准快照
+
+        :param date: 日期，不能早于已记录的最新日期（同一日期重复保存时覆盖）；早于最早日期时用 seed()
+        :param df: 整表数据
+        :return: 记录类型 base / diff / same
+        :raises ValueError: date 早于已记录的最新日期（差异按日期顺序串联，不能插入中间）
+        """
+        date = str(date)
+        with self._lock:
+            latest = self.latest_date()
+            if latest is not None and date < latest:
+                raise ValueError(f"{self.name} 快照只能按日期顺序追加：{date} 早于 {latest}")
+            if date == latest:
+                self._remove(date)
+
+            new = self._normalize(df)
+            previous_date, old = self._state(date)
+
+            if old is None:
+                kind = KIND_BASE
+            else:
+                diff = self._diff(old, new)
+                chain = 0
+                for d in reversed(self.dates):
+                    if self.manifest["dates"][d] == KIND_BASE:
+                        break
+                    chain += self.manifest["dates"][d] == KIND_DIFF
+                if diff.empty:
+                    kind = KIND_SAME
+                elif len(diff) > self.rebase_ratio * max(len(new), 1) or chain >= self.max_chain:
+                    kind = KIND_BASE
+                else:
+                    kind = KIND_DIFF
+                    diff.reset_index().to_csv(self._path(KIND_DIFF, date), index=False, encoding="utf-8-sig")
+                    logger.info(f"{self.name} {date} 相对 {previous_date} 的差异：" +
+                                "，".join(f"{op} {n} 条" for op, n in diff[OP_COLUMN].value_counts().items()))
+
+            if kind == KIND_BASE:
+                new.reset_index().to_csv(self._path(KIND_BASE, date), index=False, encoding="utf-8-sig")
+                logger.info(f"{self.name} {date} 已保存基准快照，共 {len(new)} 条")
+
+            self.manifest["dates"][date] = kind
+            self.manifest["last_full"] = date  # 最近一次获取整表的日期
+            self._write_manifest()
+            self._cache = (date, new)
+            return kind
+
+    def seed(self, date, df):
+        """
+        在最早记录之前补充一份基准快照，用于回补历史日期
+
+        第一份记录总是基准快照，之后日期的还原从各自的基准快照开始，因此插在最前面不影响已有记录。
+
+        :raises ValueError: date 不早于已记录的最早日期
+        """
+        date = str(date)
+        with self._lock:
+            earliest = self.earliest_date()
+            if earliest is not None and date >= earliest:
+                raise ValueError(f"{self.name} 只能在最早记录 {earliest} 之前补充快照：{date}")
+            new = self._normalize(df)
+            new.reset_index().to_csv(self._path(KIND_BASE, date), index=False, encoding="utf-8-sig")
+            self.manifest["dates"][date] = KIND_BASE
+            self._write_manifest()
+            self._cache = (date, new)
+            logger.info(f"{self.name} {date} 已补充基准快照，共 {len(new)} 条")
+            return KIND_BASE
+
+    def mark_unchanged(self, date):
+        """记录某日期的数据与最新记录相同（无需获取整表）"""
+        date = str(date)
+        with self._lock:
+            latest = self.latest_date()
+            if latest is None:
+                raise ValueError(f"{self.name} 尚无快照，无法记录 {date}")
+            if date > latest:
+                self.manifest["dates"][date] = KIND_SAME
+                self._write_manifest()
+
+    def unchanged_count(self):
+        """最近一次获取整表之后，只做比对（mark_unchanged）的日期数"""
+        last_full = self.manifest.get("last_full") or ""
+        return sum(1 for d in self.dates if d > last_full)
+
+    def changed(self, probe, columns):
+        """
+        用少量字段判断数据是否有变化
+
+        :param probe: 只包含 columns 字段的最新数据，例如 ts_code,name,list_status
+        :return: 与最新记录相比是否有新增、删除或字段变化
+        """
+        with self._lock:
+            _, old = self._state(self.latest_date() or "")
+        if old is None:
+            return True
+        fields = [col for col in columns if col != self.key]
+        old = old.reindex(columns=fields, fill_value="")
+        new = self._normalize(probe[list(columns)])
+        return not old.equals(new.reindex(columns=fields, fill_value=""))
+
+    def load(self, date):
+        """
+        还原某日期的数据
+
+        :return: DataFrame（类型与读取 CSV 一致）；早于第一份快照时返回 None
+        """
+        with self._lock:
+            target, state = self._state(str(date))
+        if state is None:
+            logger.warning(f"{self.name} 没有早于或等于 {date} 的快照")
+            return None
+        if target != str(date):
+            logger.debug(f"{self.name} {date} 未记录，使用 {target} 的快照")
+        return self._infer_types(state.reset_index())
+
+    def _remove(self, date):
+        for kind in (KIND_BASE, KIND_DIFF):
+            if os.path.exists(self._path(kind, date)):
+                os.remove(self._path(kind, date))
+        self.manifest["dates"].pop(date, None)
+        self._cache = (None, None)
+
+    def import_files(self, pattern, remove=False):
+        """
+        将已有的按日期保存的整表 CSV（如 tushare_stock_basic_20250321.csv）导入快照存储
+
+        :param pattern: glob 模式，文件名中的 8 位数字作为日期
+        :param remove: 导入后是否删除原文件
+        """
+        files = []
+        for path in glob.glob(pattern):
+            match = re.search(r"(\d{8})\.csv$", path)
+            if match:
+                files.append((match.group(1), path))
+
+        latest = self.latest_date()
+        for date, path in sorted(files):
+            if latest is not None and date <= latest:
+                continue
+            self.save(date, pd.read_csv(path, dtype=str, keep_default_na=False))
+            if remove:
+                os.remove(path)
+        logger.info(f"{self.name} 已导入 {len(files)} 个文件")
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(name, key="ts_code"):
+    """获取进程内共享的快照存储"""
+    with _stores_lock:
+        if name not in _stores:
+            _stores[name] = SnapshotStore(name, key=key)
+        return _stores[name]
+
+
+if __name__ == "__main__":
+    store = get_snapshot_store("stock_basic")
+    store.import_files(os.path.join(dc.csv_dir, "tushare_stock_basic_*.csv"))
+    for item in store.dates[-5:]:
+        logger.info(f"{item}: {store.manifest['dates'][item]}, {len(store.load(item))} 条")
@@ -0,0 +1,178 @@
+# filename: stage_fingerprint.py
+
+import hashlib
+import inspect
+import json
+import os
+import threading
+
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+from write_behind import cached_exists, flush_writes
+
+logger = setup_logger()
+
+SIDECAR_SUFFIX = ".fp.json"
+
+_digest_cache = {}  # (路径, 大小, 修改时间) -> 内容哈希
+_digest_lock = threading.Lock()
+
+
+def file_digest(path):
+    """
+    文件内容的哈希；同一进程内文件大小和修改时间未变时直接复用
+
+    :return: 十六进制摘要，文件不存在时返回 None
+    """
+    flush_writes(path)  # 文件尚在写入队列时等待落盘
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _digest_lock:
+        if key in _digest_cache:
+            return _digest_cache[key]
+
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _digest_lock:
+        _digest_cache[key] = digest
+    return digest
+
+
+def frame_digest(df):
+    """DataFrame 的哈希（列名 + 逐行哈希），用于没有对应文件的输入，例如快照存储还原的 stock_basic"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(json.dumps([str(col) for col in df.columns]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def value_digest(value):
+    """配置值的哈希（按 JSON 序列化，字典键排序）"""
+    text = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def code_digest(*objects):
+    """函数或模块所在源文件的哈希，代码修改后指纹随之变化"""
+    files = sorted({inspect.getsourcefile(inspect.unwrap(obj)) for obj in objects})
+    return value_digest({os.path.basename(path): file_digest(path) for path in files})
+
+
+class StageFingerprint(object):
+    """
+    筛选阶段输出的指纹：输入文件/数据、相关配置及代码版本的哈希
+
+    指纹保存在输出文件旁的 {输出文件}.fp.json 中；只有输出存在且指纹一致时才跳过计算。
+
+    用法：
+        fp = StageFingerprint("filter2", output_path)
+        fp.add_file("filter1", filter1_path)
+        fp.add_config("circ_mv", dc.circ_mv)
+        fp.add_code(test2, apply_rules)
+        if fp.is_fresh():
+            return output_path
+        ...写出结果...
+        fp.save()
+    """
+
+    def __init__(self, stage, output_path):
+        self.stage = stage
+        self.output_path = output_path
+        self.sidecar_path = output_path + SIDECAR_SUFFIX
+        self.components = {}
+
+    def add_file(self, name, path):
+        digest = file_digest(path)
+        if digest is None:
+            raise FileNotFoundError(f"{self.stage} 的输入文件不存在: {path}")
+        self.components[f"file:{name}"] = digest
+        return self
+
+    def add_frame(self, name, df):
+        self.components[f"data:{name}"] = frame_digest(df)
+        return self
+
+    def add_input(self, name, path, df):
+        """
+        接口数据类输入：优先使用缓存文件的哈希；文件不存在时（如结果为空未保存）使用数据本身
+
+        首次从接口获取的 DataFrame 与之后读取 CSV 得到的类型不同，直接对数据取哈希会误判为有变化。
+        """
+        if cached_exists(path):
+            return self.add_file(name, path)
+        return self.add_frame(name, df)
+
+    def add_config(self, name, value):
+        self.components[f"config:{name}"] = value_digest(value)
+        return self
+
+    def add_code(self, *objects):
+        self.components["code"] = code_digest(*objects)
+        return self
+
+    @property
+    def digest(self):
+        return value_digest(self.components)
+
+    def _read_sidecar(self):
+        try:
+            with open(self.sidecar_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def is_fresh(self):
+        """输出存在且指纹未变化；否则记录变化的部分并返回 False"""
+        if not os.path.exists(self.output_path):
+            return False
+        previous = self._read_sidecar()
+        if previous is None:
+            logger.info(f"{self.stage} 输出没有指纹记录，重新计算：{self.output_path}")
+            return False
+        if previous.get("fingerprint") == self.digest:
+            logger.info(f"{self.stage} 输入、配置及代码均未变化，复用已有结果：{self.output_path}")
+            return True
+
+        old = previous.get("components", {})
+        changed = sorted(name for name in set(old) | set(self.components)
+                         if old.get(name) != self.components.get(name))
+        logger.info(f"{self.stage} 以下部分有变化，重新计算：{', '.join(changed)}")
+        return False
+
+    def save(self):
+        """输出写入完成后记录指纹"""
+        record = {"stage": self.stage, "fingerprint": self.digest, "components": self.components}
+        tmp_path = f"{self.sidecar_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.sidecar_path)
+
+    def invalidate(self):
+        """删除指纹记录，下次强制重新计算"""
+        if os.path.exists(self.sidecar_path):
+            os.remove(self.sidecar_path)
+
+
+def remove_stage_output(output_path):
+    """重新计算后没有结果时删除旧的输出及指纹，避免下游读到过期数据"""
+    StageFingerprint("", output_path).invalidate()
+    if os.path.exists(output_path):
+        os.remove(output_path)
+        logger.warning(f"已删除过期的筛选结果：{output_path}")
+
+
+if __name__ == "__main__":
+    import glob
+
+    for sidecar in sorted(glob.glob(os.path.join(dc.filter_dir, f"*{SIDECAR_SUFFIX}")))[-10:]:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            item = json.load(f)
+        logger.info(f"{item['stage']}: {item['fingerprint']} {sorted(item['components'])}")
@@ -1,53 +1,147 @@
 # filename: stock_utils.py
+import atexit
 import datetime
-import inspect
 import logging
+import logging.handlers
 import os
+import queue
+import sys
+import threading
 import time
 
 import pandas as pd
-from openpyxl import load_workbook
+from openpyxl import Workbook, load_workbook
 from openpyxl.utils import get_column_letter
-from tqdm import tqdm
 
 from data_cache import dc
+from write_behind import cached_exists, read_cached_csv, save_csv
+
+
+# 所有 logger 共用一个队列和一个后台写日志线程，调用线程只负责入队
+_log_queue = queue.SimpleQueue()
+_log_handlers = {}  # logger 名称 -> 实际输出的 handler 列表
+_log_lock = threading.Lock()
+_log_listener = None
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    入队时不格式化日志记录
+
+    标准 QueueHandler 会在调用线程中格式化消息；这里消息的格式化延迟到后台线程。
+    消息及参数中的 DataFrame / Series 不复制数据，入队时直接转为字符串，调用方之后原地修改数据不影响日志内容：
+    摘要模式下为一行摘要（行列数、列名及前几行），否则为 repr（按 pandas display 配置只渲染首尾若干行）。
+    没有 handler 输出该级别时不转换，记录在后台线程中被丢弃。
+    """
+
+    @staticmethod
+    def _render(value):
+        if isinstance(value, pd.DataFrame) and dc.log_summary_mode:
+            return summarize_frame(value, dc.log_summary_max_rows)
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return repr(value)
+        return value
+
+    def prepare(self, record):
+        args = record.args.values() if isinstance(record.args, dict) else record.args or ()
+        if not any(isinstance(value, (pd.DataFrame, pd.Series)) for value in (record.msg, *args)):
+            return record
+        if not any(record.levelno >= handler.level for handler in _log_handlers.get(record.name, ())):
+            return record
+        record = logging.makeLogRecord(record.__dict__)  # 不修改其他 handler 共享的记录
+        record.msg = self._render(record.msg)
+        if isinstance(record.args, dict):
+            record.args = {key: self._render(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(self._render(value) for value in record.args)
+        return record
+
+
+class _RoutingHandler(logging.Handler):
+    """后台线程中按 logger 名称把日志记录分发给对应的控制台/文件 handler"""
+
+    def handle(self, record):
+        for handler in _log_handlers.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+
+def summarize_frame(df, max_rows=5):
+    """将 DataFrame 压缩为一行摘要"""
+    head = df.head(max_rows).to_dict('records')
+    return f"DataFrame[{df.shape[0]}x{df.shape[1]}] columns={list(df.columns)} head={head}"
+
+
+def _ensure_log_listener():
+    """启动后台写日志线程（只启动一次），进程退出时自动刷新"""
+    global _log_listener
+    if _log_listener is None:
+        _log_listener = logging.handlers.QueueListener(_log_queue, _RoutingHandler())
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+
+
+def flush_logs():
+    """等待队列中的日志全部写出"""
+    global _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener.start()
 
 
 def setup_logger(name=None):
     """
     初始化日志配置，默认日志文件名与调用此函数的脚本文件同名。
 
+    日志记录只在调用线程中入队，格式化和写控制台/文件由后台线程完成。
     :param name: 指定日志文件名（不带扩展名），默认为调用此函数的脚本名
     :return: 返回配置好的 logger 实例
     """
     if name is None:
-        # 获取调用该函数的文件名
-        caller_file = inspect.stack()[1].filename
+        # 获取调用该函数的文件名（只取上一层栈帧，避免 inspect.stack() 读取整个调用栈的源码）
+        caller_file = sys._getframe(1).f_code.co_filename
         name = os.path.splitext(os.path.basename(caller_file))[0]
 
     log_file = os.path.join(dc.log_dir, f"{name}.log")
 
     logger = logging.getLogger(name)
-    if not logger.hasHandlers():  # 防止重复添加 handler
-        logger.setLevel(logging.INFO)
+    with _log_lock:
+        if not logger.hasHandlers():  # 防止重复添加 handler
+            logger.setLevel(dc.log_level)
+
+            # formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
+            formatter = logging.Formatter(
+                '[%(asctime)s] [%(module)s:%(funcName)s] [%(levelname)s]- %(message)s')
 
-        # formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-        formatter = logging.Formatter(
-            '[%(asctime)s] [%(module)s:%(funcName)s] [%(levelname)s]- %(message)s')
+            # 控制台日志
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(formatter)
 
-        # 控制台日志
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
+            # 文件日志
+            file_handler = logging.FileHandler(log_file, mode="a", encoding="utf-8")
+            file_handler.setFormatter(formatter)
 
-        # 文件日志
-        file_handler = logging.FileHandler(log_file, mode="a", encoding="utf-8")
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
+            _log_handlers[name] = [console_handler, file_handler]
+            logger.addHandler(_DeferredQueueHandler(_log_queue))
+            _ensure_log_listener()
 
     return logger
 
 
+def log_stage_summary(logger, stage, **metrics):
+    """
+    输出一行结构化的阶段摘要，例如：[filter1] trade_date=20250321 rows_in=5400 rows_out=3200
+
+    :param logger: logger 实例
+    :param stage: 阶段名称
+    :param metrics: 阶段指标
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(f"[{stage}] " + " ".join(f"{key}={value}" for key, value in metrics.items()), stacklevel=2)
+
+
 logger = setup_logger()
 
 
@@ -147,6 +241,74 @@ def auto_adjust_column_width(file_path):
     print(f"列宽已调整并保存到文件: {file_path}")
 
 
+def get_column_display_widths(df):
+    """
+    向量化计算 DataFrame 每列（含表头）的最大显示宽度，规则与 get_display_width 一致
+
+    :param df: DataFrame
+    :return: {列名: 最大显示宽度}
+    """
+    widths = {}
+    for column in df.columns:
+        values = df[column]
+        text = values.astype(str).where(values.notna(), '')
+        # 字符数 + 非ASCII字符数 = ASCII计1、其他字符计2
+        lengths = text.str.len() + text.str.count(r'[^\x00-\x7f]')
+        content_width = int(lengths.max()) if len(lengths) else 0
+        widths[column] = max(content_width, get_display_width(column))
+    return widths
+
+
+def write_excel_streaming(df, excel_path, sheet_name="Sheet1", max_width=50, chunk_size=10000):
+    """
+    以只写（流式）模式一次性写出 Excel，列宽在写入前由 DataFrame 计算
+
+    不在内存中保留工作簿对象模型，也不需要写完后重新加载调整列宽，适合十万行以上的导出。
+    :param df: 待导出的 DataFrame
+    :param excel_path: Excel 文件路径
+    :param sheet_name: 工作表名称
+    :param max_width: 最大列宽
+    :param chunk_size: 每批转换的行数
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title=sheet_name)
+
+    # 列宽必须在写入任何行之前设置
+    for col_idx, width in enumerate(get_column_display_widths(df).values(), start=1):
+        ws.column_dimensions[get_column_letter(col_idx)].width = min(width + 2, max_width)
+
+    ws.append([str(column) for column in df.columns])
+    for start in range(0, len(df), chunk_size):
+        # 分批将缺失值转换为 None，避免整表复制为 object 类型
+        chunk = df.iloc[start:start + chunk_size].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append(row)
+
+    wb.save(excel_path)
+    logger.info(f"已流式写入 {len(df)} 行数据到 Excel 文件: {excel_path}")
+
+
+def get_trade_cal(year):
+    """
+    获取指定年份的交易日历（优先读取本地缓存）
+
+    交易所会提前公布全年交易日历，因此按年缓存即可。
+    :param year: 年份，例如 2025
+    :return: 包含 cal_date、is_open 列的 DataFrame，cal_date 升序
+    """
+    file_path = os.path.join(dc.csv_dir, f"tushare_trade_cal_{year}.csv")
+    if cached_exists(file_path):
+        return read_cached_csv(file_path, dtype={"cal_date": str, "pretrade_date": str})
+
+    df = dc.pro.trade_cal(start_date=f"{year}0101", end_date=f"{year}1231")
+    df = df.sort_values("cal_date").reset_index(drop=True)
+    if not df.empty:
+        save_csv(df, file_path, index=False, encoding='utf-8_sig')
+        logger.info(f"交易日历已保存至 {file_path}")
+    return df
+
+
 def get_last_trade_date():
     """获取最近一个交易日"""
     try:
@@ -237,32 +399,94 @@ def get_last_n_trade_dates(n=20):
         return []
 
 
+# 判断股票列表是否变化时只获取的字段（上市、退市及更名）
+STOCK_BASIC_PROBE_FIELDS = ['ts_code', 'name', 'list_status']
+# 连续多少个交易日只做字段比对后强制获取一次整表（捕获行业等其他字段的变化）
+STOCK_BASIC_FULL_REFRESH_DAYS = 5
+
+
 def fetch_stock_basic(trade_date, is_save_csv=True):
-    """获取股票基础信息并保存为 CSV"""
-    df = dc.pro.stock_basic(exchange='', list_status='L')
+    """
+    获取股票基础信息
+
+    保存时写入快照存储（data/snapshot_stock_basic/，基准快照 + 逐日差异），不再每个交易日保存一份整表。
+    """
+    df = dc.query_all('stock_basic', exchange='', list_status='L')
     if is_save_csv:
-        filename = f"tushare_stock_basic_{trade_date}.csv"
-        df.to_csv(os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8_sig')
-        logger.info(f"股票基础信息已保存至 {filename}")
+        from snapshot_store import get_snapshot_store
+        kind = get_snapshot_store('stock_basic').save(trade_date, df)
+        logger.info(f"股票基础信息 {trade_date} 已写入快照存储（{kind}）")
     return df
 
 
+def load_stock_basic(trade_date):
+    """
+    读取指定交易日的股票基础信息
+
+    已记录（或早于最新记录）的交易日直接由快照还原，回测时即为当时的股票池；
+    新交易日先只获取 ts_code/name/list_status 比对，有变化时才获取整表；
+    早于第一份快照的交易日（回补历史）获取整表后补充为最早的基准快照。
+    返回结果带证券 ID（sid）列并按 sid 排序。
+    """
+    from snapshot_store import get_snapshot_store
+    store = get_snapshot_store('stock_basic')
+    trade_date = str(trade_date)
+    latest = store.latest_date()
+    if latest is not None and trade_date < store.earliest_date():
+        df = dc.query_all('stock_basic', exchange='', list_status='L')
+        store.seed(trade_date, df)
+        logger.info(f"股票基础信息 {trade_date} 早于最早快照，已获取整表补充")
+    elif latest is None or trade_date > latest:
+        if latest is None or store.unchanged_count() >= STOCK_BASIC_FULL_REFRESH_DAYS:
+            fetch_stock_basic(trade_date)
+        else:
+            probe = dc.query_all('stock_basic', exchange='', list_status='L',
+                                 fields=','.join(STOCK_BASIC_PROBE_FIELDS))
+            if store.changed(probe, STOCK_BASIC_PROBE_FIELDS):
+                fetch_stock_basic(trade_date)
+            else:
+                store.mark_unchanged(trade_date)
+                logger.info(f"股票基础信息 {trade_date} 与 {latest} 相同，无需获取整表")
+
+    from security_master import attach_ids
+    return attach_ids(store.load(trade_date))
+
+
+def query_trade_date(api_name, trade_date):
+    """
+    按交易日获取全市场数据；已知为空的日期（非交易日、尚未入库）不再请求接口
+
+    返回空结果时记入空结果缓存，到预期入库时间后才会再次请求。
+    """
+    from negative_cache import get_negative_cache  # 以下模块依赖 stock_utils，延迟导入避免循环引用
+    from security_master import attach_ids
+
+    cache = get_negative_cache()
+    if cache.is_empty(api_name, trade_date):
+        return pd.DataFrame()
+    df = dc.query_all(api_name, trade_date=trade_date)
+    if df.empty:
+        cache.mark_empty(api_name, trade_date)
+        return df
+    return attach_ids(df)
+
+
 def fetch_daily(trade_date, is_save_csv=True):
-    """获取日线行情数据并保存为 CSV"""
-    df = dc.pro.daily(trade_date=trade_date)
-    if is_save_csv:
+    """获取日线行情数据并保存为 CSV（空结果不保存，以免空文件被当作有效缓存）"""
+    df = query_trade_date('daily', trade_date)
+    if is_save_csv and not df.empty:
         filename = f"tushare_daily_{trade_date}.csv"
-        df.to_csv(os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8_sig')
+        save_csv(df, os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8_sig')
         logger.info(f"日线行情数据已保存至 {filename}")
     return df
 
 
 def fetch_daily_basic(trade_date, is_save_csv=True):
-    """获取每日指标数据并保存为 CSV"""
-    df = dc.pro.daily_basic(trade_date=trade_date)
-    if is_save_csv:
+    """获取每日指标数据并保存为 CSV（空结果不保存）"""
+    df = query_trade_date('daily_basic', trade_date)
+    if is_save_csv and not df.empty:
         filename = f"tushare_daily_basic_{trade_date}.csv"
-        df.to_csv(os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8_sig')
+        save_csv(df, os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8_sig')
         logger.info(f"每日指标数据已保存至 {filename}")
     return df
 
@@ -271,23 +495,61 @@ def fetch_weekly(trade_date, is_save_csv=True):
     """
     获取A股周线行情数据并保存为 CSV
     trade_date	str	N	交易日期 （每周最后一个交易日期，YYYYMMDD格式）
-    """
 
-    df = dc.pro.weekly(trade_date=trade_date)
-    if is_save_csv:
-        filename = f"tushare_weekly_{trade_date}.csv"
-        full_path = os.path.join(dc.csv_dir, filename)
-        df.to_csv(full_path, index=False, encoding='utf-8_sig')
+    优先读取本地周线缓存；其次由本地缓存的日线合成；都没有时才调用 API。
+    """
+    filename = f"tushare_weekly_{trade_date}.csv"
+    full_path = os.path.join(dc.csv_dir, filename)
+    if cached_exists(full_path):
+        return read_cached_csv(full_path, dtype={'trade_date': str})
+
+    from bar_resample import build_period_bars
+    from security_master import attach_ids
+    df = build_period_bars(trade_date, freq='W')
+    if df is None:
+        df = dc.query_all('weekly', trade_date=trade_date)
+    df = attach_ids(df)
+    if is_save_csv and not df.empty:
+        save_csv(df, full_path, index=False, encoding='utf-8_sig')
         logger.info(f"周线行情数据已保存至 {filename}")
     return df
 
 
+def fetch_monthly(trade_date, is_save_csv=True):
+    """
+    获取A股月线行情数据并保存为 CSV
+    trade_date	str	N	交易日期 （每月最后一个交易日期，YYYYMMDD格式）
+
+    优先读取本地月线缓存；其次由本地缓存的日线合成；都没有时才调用 API。
+    """
+    filename = f"tushare_monthly_{trade_date}.csv"
+    full_path = os.path.join(dc.csv_dir, filename)
+    if cached_exists(full_path):
+        return read_cached_csv(full_path, dtype={'trade_date': str})
+
+    from bar_resample import build_period_bars
+    from security_master import attach_ids
+    df = build_period_bars(trade_date, freq='M')
+    if df is None:
+        df = dc.query_all('monthly', trade_date=trade_date)
+    df = attach_ids(df)
+    if is_save_csv and not df.empty:
+        save_csv(df, full_path, index=False, encoding='utf-8_sig')
+        logger.info(f"月线行情数据已保存至 {filename}")
+    return df
+
+
 def fetch_stk_factor_pro_by_tscode(ts_code, start_date, end_date):
-    """获取指定日期范围内的股票因子数据"""
-    # 延时设置，避免超过访问频率限制
-    time.sleep(0.5)  # 每次请求间隔0.3秒
+    """
+    获取指定日期范围内的股票因子数据
+
+    日期范围按年分段并发请求、段内自动分页，长区间不会被单次返回行数上限截断；访问频率由 dc.pro 的 token 池及容错层控制。
+    """
+    from query_pager import query_chunked, split_date_range  # query_pager 依赖 stock_utils，延迟导入避免循环引用
 
-    df = dc.pro.stk_factor_pro(ts_code=ts_code, start_date=start_date, end_date=end_date)
+    df = query_chunked('stk_factor_pro', split_date_range(start_date, end_date), ts_code=ts_code)
+    if df.empty:
+        return df
     return df.sort_values('trade_date').dropna()
 
 
@@ -354,191 +616,227 @@ def get_recent_macd_death_cross(ts_code):
     return None
 
 
+# 单只股票财务数据保留的字段
+FINA_TSCODE_FIELDS = ['ts_code', 'ann_date', 'end_date', 'roe', 'fcff', 'grossprofit_margin', 'equity_yoy',
+                      'debt_to_assets', 'update_flag']
+
+# 报告期 -> (过期时间, (全市场财务指标, {ts_code: 行号数组}))，进程内缓存；披露截止日后获取的报告期不过期
+_fina_period_cache = {}
+_fina_period_lock = threading.Lock()
+# 未披露的报告期在进程内缓存的秒数，过期后重新检查本地 CSV 及空结果缓存（由后者决定何时再请求接口）
+FINA_PERIOD_MISS_TTL = 600
+# 披露截止日前获取的报告期在进程内缓存的秒数，过期后重新检查本地 CSV（由其获取时间决定何时重新请求接口）
+FINA_PERIOD_OPEN_TTL = 3600
+
+
+def _period_file_fetched_at(path):
+    """按报告期保存的文件的获取时间：已落盘取修改时间，仍在写入队列中视为刚获取"""
+    if os.path.exists(path):
+        return datetime.datetime.fromtimestamp(os.path.getmtime(path))
+    return datetime.datetime.now()
+
+
+def _period_file_complete(quarter_str, path):
+    """报告期文件是否获取于披露截止日之后，之后不会再有新公告"""
+    from negative_cache import period_deadline
+
+    deadline = period_deadline(quarter_str)
+    return deadline is None or _period_file_fetched_at(path) >= deadline
+
+
+def get_fina_indicator_vip_period(quarter_str):
+    """
+    获取某报告期全市场财务指标及 ts_code 行号索引
+
+    优先读取进程内缓存，其次读取本地 CSV，两者都没有时才按报告期整体请求一次接口。
+    尚未披露的报告期只缓存 FINA_PERIOD_MISS_TTL 秒，披露截止日前获取的报告期只缓存 FINA_PERIOD_OPEN_TTL 秒，
+    常驻进程能取到之后披露的公司。
+
+    :param quarter_str: 报告期，例如 '20240930'
+    :return: (DataFrame, {ts_code: 行号数组})，无数据时返回 (None, {})
+    """
+    quarter_str = str(quarter_str)
+    with _fina_period_lock:
+        entry = _fina_period_cache.get(quarter_str)
+    if entry is not None and (entry[0] is None or time.monotonic() < entry[0]):
+        return entry[1]
+
+    df = fetch_fina_indicator_vip_by_quarter_str(quarter_str)
+    expires = None
+    if df is None or df.empty:
+        # 尚未披露的报告期短时间缓存，避免逐只股票重复请求
+        cached = (None, {})
+        expires = time.monotonic() + FINA_PERIOD_MISS_TTL
+    else:
+        df = df.reset_index(drop=True)
+        # 从 CSV 读取时日期为整数，与接口返回保持一致
+        for col in ('ts_code', 'ann_date', 'end_date'):
+            if col in df.columns:
+                df[col] = df[col].astype(str)
+        cached = (df, df.groupby('ts_code', sort=False).indices)
+        full_path = os.path.join(dc.csv_dir, f"tushare_fina_indicator_vip_{quarter_str}.csv")
+        if not _period_file_complete(quarter_str, full_path):
+            expires = time.monotonic() + FINA_PERIOD_OPEN_TTL
+    with _fina_period_lock:
+        _fina_period_cache[quarter_str] = (expires, cached)
+    return cached
+
+
+def _select_fina_rows(ts_code, quarter_str):
+    """从报告期全市场数据中按索引取出单只股票的行，未披露时返回 None"""
+    df, index = get_fina_indicator_vip_period(quarter_str)
+    rows = index.get(ts_code)
+    if rows is None:
+        return None
+    return df.iloc[rows].reindex(columns=FINA_TSCODE_FIELDS)
+
+
 def fetch_fina_indicator_vip_by_tscode(ts_code, quarter_list, is_save_csv=True):
-    # 存储ts_code所有财务数据的列表
-    all_data = []
+    """
+    获取单只股票多个报告期的财务数据
+
+    数据取自按报告期缓存的全市场财务指标，只有本地缺失的报告期才请求接口（每个报告期一次）。
 
-    for item in tqdm(quarter_list, total=len(quarter_list), desc=f"获取股票 {ts_code} 财务数据"):
-        # 获取报告期的结束日期
-        quarter_end_date = item.split(":")[1]
-        logger.info(f"开始获取{ts_code} - {quarter_end_date} 的财务数据...")
-
-        # 重试3次
-        for _ in range(3):
-            try:
-                df = dc.pro.fina_indicator_vip(ts_code=ts_code, period=quarter_end_date,
-                                               fields='ts_code,'
-                                                      'ann_date,'
-                                                      'end_date,'
-                                                      'roe,'
-                                                      'fcff,'
-                                                      'grossprofit_margin,'
-                                                      'equity_yoy,'
-                                                      'debt_to_assets,'
-                                                      'update_flag',
-                                               update_flag='1')
-                if not df.empty:
-                    all_data.append(df)
-                    print(f"成功获取{ts_code} - {quarter_end_date} 的数据。")
-                    break
-                else:
-                    logger.warning(f"未获取到{ts_code} - {quarter_end_date} 的数据，继续重试...")
-
-            except Exception as e:
-                # 获取数据失败，重试
-                logger.error(f"{ts_code} - [fina_indicator_vip] 获取财务指标失败，重试中: {str(e)}")
-                time.sleep(5)
+    :param ts_code: 股票代码
+    :param quarter_list: 报告期列表，元素为 '20240930' 或 '2024Q3:20240930'
+    """
+    all_data = []
+    for item in quarter_list:
+        # 兼容 '2024Q3:20240930' 格式
+        quarter_end_date = str(item).split(":")[-1]
+        df = _select_fina_rows(ts_code, quarter_end_date)
+        if df is None:
+            logger.debug(f"{ts_code} - {quarter_end_date} 无财务数据")
+            continue
+        all_data.append(df)
 
     # 如果没有获取到任何数据，提前返回
     if not all_data:
-        print("未获取到任何数据，无法合并。")
+        logger.warning(f"{ts_code} 未获取到任何财务数据，无法合并。")
         return
 
-    # 在拼接前去除所有空列（全是NaN的列）
-    # all_data = [df.dropna(axis=1, how='all') for df in all_data]
-
     # 合并所有数据
     final_data = pd.concat(all_data, ignore_index=True)
 
     if is_save_csv:
         filename = f"tushare_fina_indicator_vip_{ts_code}.csv"
-        final_data.to_csv(os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8-sig')
+        save_csv(final_data, os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8-sig')
         logger.info(f"{ts_code} 的财务数据已保存至 {filename}")
 
-    logger.info(final_data)
+    logger.debug(final_data)
 
     return final_data
 
 
 def fetch_fina_indicator_vip_by_tscode_quarter_str(ts_code, quarter_str, is_save_csv=False):
-    # 存储ts_code所有财务数据的列表
-    all_data = []
-
-    # 重试3次
-    for _ in range(3):
-        try:
-            df = dc.pro.fina_indicator_vip(ts_code=ts_code, period=quarter_str,
-                                           fields='ts_code,'
-                                                  'ann_date,'
-                                                  'end_date,'
-                                                  'roe,'
-                                                  'fcff,'
-                                                  'grossprofit_margin,'
-                                                  'equity_yoy,'
-                                                  'debt_to_assets,'
-                                                  'update_flag',
-                                           update_flag='1')
-            if not df.empty:
-                all_data.append(df)
-                # logger.info(f"成功获取{ts_code} - {quarter_str} 的数据。")
-                break
-            else:
-                logger.warning(f"未获取到{ts_code} - {quarter_str} 的数据，继续重试...")
-
-        except Exception as e:
-            # 获取数据失败，重试
-            logger.error(f"{ts_code} - [fina_indicator_vip] 获取财务指标失败，重试中: {str(e)}")
-            time.sleep(5)
+    """获取单只股票单个报告期的财务数据，数据来源同 fetch_fina_indicator_vip_by_tscode"""
+    final_data = _select_fina_rows(ts_code, str(quarter_str).split(":")[-1])
 
     # 如果没有获取到任何数据，提前返回
-    if not all_data:
-        logger.warning("未获取到任何数据，无法合并。")
+    if final_data is None:
+        logger.warning(f"{ts_code} - {quarter_str} 未获取到任何数据。")
         return
 
-    # 在拼接前去除所有空列（全是NaN的列）
-    # all_data = [df.dropna(axis=1, how='all') for df in all_data]
-
-    # 合并所有数据
-    final_data = pd.concat(all_data, ignore_index=True)
+    final_data = final_data.reset_index(drop=True)
 
     if is_save_csv:
         filename = f"tushare_fina_indicator_vip_{ts_code}.csv"
-        final_data.to_csv(os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8-sig')
+        save_csv(final_data, os.path.join(dc.csv_dir, filename), index=False, encoding='utf-8-sig')
         logger.info(f"{ts_code} 的财务数据已保存至 {filename}")
 
-    # logger.info(final_data)
-
     return final_data
 
 
 def fetch_fina_indicator_vip_by_quarter_str(quarter_str, is_save_csv=True):
+    """
+    获取某报告期全市场财务指标（最新版本），按报告期缓存为 CSV
+
+    披露截止日前保存的文件可能缺少之后披露的公司，过了下一个入库时间后重新获取（失败时仍使用已有文件）。
+    """
+    from negative_cache import get_negative_cache, period_refresh_due
+
     filename = f"tushare_fina_indicator_vip_{quarter_str}.csv"
     full_path = os.path.join(dc.csv_dir, filename)
-    if os.path.exists(full_path):
-        # logger.info(f"{filename} 已经存在。")
-        df = pd.read_csv(full_path)
-        return df
+    cached = cached_exists(full_path)
+    if cached:
+        if not period_refresh_due(quarter_str, _period_file_fetched_at(full_path), datetime.datetime.now()):
+            return read_cached_csv(full_path)
+        logger.info(f"{filename} 获取于披露截止日前，重新获取")
+
+    negative_cache = get_negative_cache()
+    if not cached and negative_cache.is_empty('fina_indicator_vip', quarter_str):
+        return None
 
     # 存储ts_code所有财务数据的列表
     all_data = []
 
-    # 重试3次
-    for _ in range(3):
-        try:
-            logger.info(f"开始获取 {quarter_str} 的数据...")
-            df = dc.pro.fina_indicator_vip(ts_code='', period=quarter_str,
-                                           fields='ts_code,ann_date,end_date,eps,dt_eps,total_revenue_ps,revenue_ps,'
-                                                  'capital_rese_ps,surplus_rese_ps,undist_profit_ps,extra_item,'
-                                                  'profit_dedt,gross_margin,current_ratio,quick_ratio,cash_ratio,'
-                                                  'invturn_days,arturn_days,inv_turn,ar_turn,ca_turn,fa_turn,'
-                                                  'assets_turn,op_income,valuechange_income,interst_income,daa,'
-                                                  'ebit,ebitda,fcff,fcfe,current_exint,noncurrent_exint,interestdebt,'
-                                                  'netdebt,tangible_asset,working_capital,networking_capital,'
-                                                  'invest_capital,retained_earnings,diluted2_eps,bps,ocfps,'
-                                                  'retainedps,cfps,ebit_ps,fcff_ps,fcfe_ps,netprofit_margin,'
-                                                  'grossprofit_margin,cogs_of_sales,expense_of_sales,profit_to_gr,'
-                                                  'saleexp_to_gr,adminexp_of_gr,finaexp_of_gr,impai_ttm,gc_of_gr,'
-                                                  'op_of_gr,ebit_of_gr,roe,roe_waa,roe_dt,roa,npta,roic,roe_yearly,'
-                                                  'roa2_yearly,roe_avg,opincome_of_ebt,investincome_of_ebt,'
-                                                  'n_op_profit_of_ebt,tax_to_ebt,dtprofit_to_profit,salescash_to_or,'
-                                                  'ocf_to_or,ocf_to_opincome,capitalized_to_da,debt_to_assets,'
-                                                  'assets_to_eqt,dp_assets_to_eqt,ca_to_assets,nca_to_assets,'
-                                                  'tbassets_to_totalassets,int_to_talcap,eqt_to_talcapital,'
-                                                  'currentdebt_to_debt,longdeb_to_debt,ocf_to_shortdebt,'
-                                                  'debt_to_eqt,eqt_to_debt,eqt_to_interestdebt,tangibleasset_to_debt,'
-                                                  'tangasset_to_intdebt,tangibleasset_to_netdebt,ocf_to_debt,'
-                                                  'ocf_to_interestdebt,ocf_to_netdebt,ebit_to_interest,'
-                                                  'longdebt_to_workingcapital,ebitda_to_debt,turn_days,'
-                                                  'roa_yearly,roa_dp,fixed_assets,profit_prefin_exp,non_op_profit,'
-                                                  'op_to_ebt,nop_to_ebt,ocf_to_profit,cash_to_liqdebt,'
-                                                  'cash_to_liqdebt_withinterest,op_to_liqdebt,op_to_debt,roic_yearly,'
-                                                  'total_fa_trun,profit_to_op,q_opincome,q_investincome,q_dtprofit,'
-                                                  'q_eps,q_netprofit_margin,q_gsprofit_margin,q_exp_to_sales,'
-                                                  'q_profit_to_gr,q_saleexp_to_gr,q_adminexp_to_gr,q_finaexp_to_gr,'
-                                                  'q_impair_to_gr_ttm,q_gc_to_gr,q_op_to_gr,q_roe,q_dt_roe,q_npta,'
-                                                  'q_opincome_to_ebt,q_investincome_to_ebt,q_dtprofit_to_profit,'
-                                                  'q_salescash_to_or,q_ocf_to_sales,q_ocf_to_or,basic_eps_yoy,'
-                                                  'dt_eps_yoy,cfps_yoy,op_yoy,ebt_yoy,netprofit_yoy,dt_netprofit_yoy,'
-                                                  'ocf_yoy,roe_yoy,bps_yoy,assets_yoy,eqt_yoy,tr_yoy,or_yoy,'
-                                                  'q_gr_yoy,q_gr_qoq,q_sales_yoy,q_sales_qoq,q_op_yoy,q_op_qoq,'
-                                                  'q_profit_yoy,q_profit_qoq,q_netprofit_yoy,q_netprofit_qoq,'
-                                                  'equity_yoy,rd_exp,update_flag',
-                                           update_flag='1')
-            if not df.empty:
-                all_data.append(df)
-                logger.info(f"成功获取 {quarter_str} 的数据。")
-                break
-            else:
-                logger.warning(f"未获取到 {quarter_str} 的数据，继续重试...")
-
-        except Exception as e:
-            # 获取数据失败，重试
-            logger.error(f"获取 {quarter_str} 财务指标失败，重试中: {str(e)}")
-            time.sleep(5)
+    # 接口正常返回空结果说明尚未披露，记入空结果缓存
+    try:
+        logger.info(f"开始获取 {quarter_str} 的数据...")
+        df = dc.query_all('fina_indicator_vip', ts_code='', period=quarter_str,
+                          fields='ts_code,ann_date,end_date,eps,dt_eps,total_revenue_ps,revenue_ps,'
+                                 'capital_rese_ps,surplus_rese_ps,undist_profit_ps,extra_item,'
+                                 'profit_dedt,gross_margin,current_ratio,quick_ratio,cash_ratio,'
+                                 'invturn_days,arturn_days,inv_turn,ar_turn,ca_turn,fa_turn,'
+                                 'assets_turn,op_income,valuechange_income,interst_income,daa,'
+                                 'ebit,ebitda,fcff,fcfe,current_exint,noncurrent_exint,interestdebt,'
+                                 'netdebt,tangible_asset,working_capital,networking_capital,'
+                                 'invest_capital,retained_earnings,diluted2_eps,bps,ocfps,'
+                                 'retainedps,cfps,ebit_ps,fcff_ps,fcfe_ps,netprofit_margin,'
+                                 'grossprofit_margin,cogs_of_sales,expense_of_sales,profit_to_gr,'
+                                 'saleexp_to_gr,adminexp_of_gr,finaexp_of_gr,impai_ttm,gc_of_gr,'
+                                 'op_of_gr,ebit_of_gr,roe,roe_waa,roe_dt,roa,npta,roic,roe_yearly,'
+                                 'roa2_yearly,roe_avg,opincome_of_ebt,investincome_of_ebt,'
+                                 'n_op_profit_of_ebt,tax_to_ebt,dtprofit_to_profit,salescash_to_or,'
+                                 'ocf_to_or,ocf_to_opincome,capitalized_to_da,debt_to_assets,'
+                                 'assets_to_eqt,dp_assets_to_eqt,ca_to_assets,nca_to_assets,'
+                                 'tbassets_to_totalassets,int_to_talcap,eqt_to_talcapital,'
+                                 'currentdebt_to_debt,longdeb_to_debt,ocf_to_shortdebt,'
+                                 'debt_to_eqt,eqt_to_debt,eqt_to_interestdebt,tangibleasset_to_debt,'
+                                 'tangasset_to_intdebt,tangibleasset_to_netdebt,ocf_to_debt,'
+                                 'ocf_to_interestdebt,ocf_to_netdebt,ebit_to_interest,'
+                                 'longdebt_to_workingcapital,ebitda_to_debt,turn_days,'
+                                 'roa_yearly,roa_dp,fixed_assets,profit_prefin_exp,non_op_profit,'
+                                 'op_to_ebt,nop_to_ebt,ocf_to_profit,cash_to_liqdebt,'
+                                 'cash_to_liqdebt_withinterest,op_to_liqdebt,op_to_debt,roic_yearly,'
+                                 'total_fa_trun,profit_to_op,q_opincome,q_investincome,q_dtprofit,'
+                                 'q_eps,q_netprofit_margin,q_gsprofit_margin,q_exp_to_sales,'
+                                 'q_profit_to_gr,q_saleexp_to_gr,q_adminexp_to_gr,q_finaexp_to_gr,'
+                                 'q_impair_to_gr_ttm,q_gc_to_gr,q_op_to_gr,q_roe,q_dt_roe,q_npta,'
+                                 'q_opincome_to_ebt,q_investincome_to_ebt,q_dtprofit_to_profit,'
+                                 'q_salescash_to_or,q_ocf_to_sales,q_ocf_to_or,basic_eps_yoy,'
+                                 'dt_eps_yoy,cfps_yoy,op_yoy,ebt_yoy,netprofit_yoy,dt_netprofit_yoy,'
+                                 'ocf_yoy,roe_yoy,bps_yoy,assets_yoy,eqt_yoy,tr_yoy,or_yoy,'
+                                 'q_gr_yoy,q_gr_qoq,q_sales_yoy,q_sales_qoq,q_op_yoy,q_op_qoq,'
+                                 'q_profit_yoy,q_profit_qoq,q_netprofit_yoy,q_netprofit_qoq,'
+                                 'equity_yoy,rd_exp,update_flag',
+                          update_flag='1')
+        if not df.empty:
+            all_data.append(df)
+            logger.info(f"成功获取 {quarter_str} 的数据。")
+        elif not cached:
+            negative_cache.mark_empty('fina_indicator_vip', quarter_str)
+    except Exception as e:
+        # 重试、熔断已由 dc.pro 处理，这里的异常说明多次尝试均失败
+        logger.error(f"获取 {quarter_str} 财务指标失败: {str(e)}")
 
     # 如果没有获取到任何数据，提前返回
     if not all_data:
+        if cached:
+            logger.warning(f"{quarter_str} 重新获取失败，使用已有的财务数据")
+            return read_cached_csv(full_path)
         logger.warning("未获取到任何数据，无法合并。")
         return None
 
     # 在拼接前去除所有空列（全是NaN的列）
     all_data = [df.dropna(axis=1, how='all') for df in all_data]
 
-    # 合并所有数据
-    final_data = pd.concat(all_data, ignore_index=True)
+    # 合并所有数据，按证券 ID 排序保存
+    from security_master import attach_ids
+    final_data = attach_ids(pd.concat(all_data, ignore_index=True))
 
     if is_save_csv:
-        final_data.to_csv(full_path, index=False, encoding='utf-8-sig')
+        save_csv(final_data, full_path, index=False, encoding='utf-8-sig')
         logger.info(f"{quarter_str} 的财务数据已保存至 {full_path}")
 
     # logger.info(final_data)
@@ -546,16 +844,78 @@ def fetch_fina_indicator_vip_by_quarter_str(quarter_str, is_save_csv=True):
     return final_data
 
 
+# 时点财务数据保留的字段（含全部历史版本）
+FINA_HISTORY_FIELDS = ['ts_code', 'ann_date', 'end_date', 'update_flag', 'roe', 'q_netprofit_yoy', 'debt_to_assets',
+                       'netprofit_yoy', 'grossprofit_margin', 'fcff', 'equity_yoy', 'eps', 'bps']
+
+
+def fetch_fina_indicator_vip_history(quarter_str, is_save_csv=True):
+    """
+    获取某报告期全市场财务指标的所有版本（不传 update_flag，包含更正前的记录）
+
+    用于按公告日期（ann_date）还原历史上每一天可见的财务数据。
+    披露截止日前保存的文件可能缺少之后的公告及更正，过了下一个入库时间后重新获取（失败时仍使用已有文件）。
+    """
+    from negative_cache import get_negative_cache, period_refresh_due
+
+    filename = f"tushare_fina_indicator_vip_history_{quarter_str}.csv"
+    full_path = os.path.join(dc.csv_dir, filename)
+    dtype = {'ann_date': str, 'end_date': str, 'update_flag': str}
+    cached = cached_exists(full_path)
+    if cached:
+        if not os.path.exists(full_path) or not period_refresh_due(
+                quarter_str, datetime.datetime.fromtimestamp(os.path.getmtime(full_path)), datetime.datetime.now()):
+            return read_cached_csv(full_path, dtype=dtype)
+        logger.info(f"{filename} 获取于披露截止日前，重新获取")
+
+    negative_cache = get_negative_cache()
+    if not cached and negative_cache.is_empty('fina_indicator_vip_history', quarter_str):
+        return None
+
+    final_data = None
+    # 空结果记入空结果缓存（与只取最新版本的 fina_indicator_vip 使用不同的键）
+    try:
+        logger.info(f"开始获取 {quarter_str} 的全部版本财务数据...")
+        df = dc.query_all('fina_indicator_vip', ts_code='', period=quarter_str,
+                          fields=','.join(FINA_HISTORY_FIELDS))
+        if not df.empty:
+            final_data = df
+        elif not cached:
+            negative_cache.mark_empty('fina_indicator_vip_history', quarter_str)
+    except Exception as e:
+        # 重试、熔断已由 dc.pro 处理，这里的异常说明多次尝试均失败
+        logger.error(f"获取 {quarter_str} 财务指标失败: {str(e)}")
+
+    if final_data is None:
+        if cached:
+            logger.warning(f"{quarter_str} 重新获取失败，使用已有的全部版本财务数据")
+            return read_cached_csv(full_path, dtype=dtype)
+        logger.warning(f"{quarter_str} 未获取到任何数据。")
+        return None
+
+    from security_master import attach_ids
+    final_data = attach_ids(final_data)
+
+    if is_save_csv:
+        save_csv(final_data, full_path, index=False, encoding='utf-8-sig')
+        logger.info(f"{quarter_str} 的全部版本财务数据已保存至 {full_path}")
+
+    return final_data
+
+
 def load_csv(file_name, fetch_function, trade_date):
     """加载指定交易日的 CSV 文件"""
     if 'filter' in file_name:
         file_path = os.path.join(dc.filter_dir, f"{file_name}_{trade_date}.csv")
     else:
         file_path = os.path.join(dc.csv_dir, f"{file_name}_{trade_date}.csv")
-    if not os.path.exists(file_path):
+    if not cached_exists(file_path):
         logger.error(f"加载指定交易日的 CSV 文件不存在: {file_path}, 重新生成...")
         fetch_function(trade_date)
-    return pd.read_csv(file_path)
+        if not cached_exists(file_path):
+            logger.warning(f"{trade_date} 无数据，未生成 {file_path}")
+            return pd.DataFrame()
+    return read_cached_csv(file_path)
 
 
 if __name__ == '__main__':
@@ -586,4 +946,4 @@ if __name__ == '__main__':
     ts_code = '000001.SZ'
     # **筛选 2023 Q4**
     quarter = get_quarter_end_dates(2024)['Q3']
-    logger.info(fetch_fina_indicator_vip_by_tscode_quarter_str('ts_code', quarter))
+    logger.info(fetch_fina_indicator_vip_by_tscode_quarter_str(ts_code, quarter))
@@ -0,0 +1,47 @@
+# filename: conftest.py
+
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """在临时目录中运行（data / result / logs 均为相对路径），并清空进程内的共享缓存"""
+    import negative_cache
+    import query_pager
+    import rank_table
+    import security_master
+    import snapshot_store
+    import stock_utils
+    from data_cache import dc
+    from write_behind import flush_writes
+
+    monkeypatch.chdir(tmp_path)
+    for path in (dc.csv_dir, dc.filter_dir, dc.log_dir):
+        os.makedirs(path, exist_ok=True)
+    monkeypatch.setattr(security_master, "_security_master", None)
+    monkeypatch.setattr(negative_cache, "_negative_cache", None)
+    monkeypatch.setattr(query_pager, "_page_rows", {})
+    monkeypatch.setattr(query_pager, "_server_limits", {})
+    monkeypatch.setattr(snapshot_store, "_stores", {})
+    monkeypatch.setattr(rank_table, "_rank_tables", {})
+    monkeypatch.setattr(stock_utils, "_fina_period_cache", {})
+    yield tmp_path
+    flush_writes()
+
+
+@pytest.fixture
+def fake_pro(workdir, monkeypatch):
+    """安装离线替身客户端 dc.pro，数据为 40 只股票 2025 年一季度的模拟行情"""
+    from data_cache import dc
+    from tushare_stub import FakeProApi, make_sample_market
+
+    fake = FakeProApi(make_sample_market(n_stocks=40))
+    monkeypatch.setattr(dc, "pro", fake)
+    return fake
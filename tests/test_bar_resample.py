@@ -0,0 +1,63 @@
+# filename: test_bar_resample.py
+
+import pandas as pd
+import pytest
+
+from bar_resample import BAR_FIELDS, build_period_bars, get_period_trade_dates, validate_against_api
+from stock_utils import fetch_daily, fetch_weekly
+
+WEEK = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+def api_bars(daily, trade_dates):
+    """按接口口径逐只股票计算周期 K 线，作为 pro.weekly / pro.monthly 的替身数据"""
+    rows = []
+    period = daily[daily["trade_date"].isin(trade_dates)].sort_values("trade_date")
+    for ts_code, bars in period.groupby("ts_code"):
+        close, pre_close = bars["close"].iloc[-1], bars["pre_close"].iloc[0]
+        rows.append({
+            "ts_code": ts_code, "trade_date": trade_dates[-1], "close": close, "open": bars["open"].iloc[0],
+            "high": bars["high"].max(), "low": bars["low"].min(), "pre_close": pre_close,
+            "change": close - pre_close, "pct_chg": round((close - pre_close) / pre_close * 100, 4),
+            "vol": bars["vol"].sum(), "amount": bars["amount"].sum(),
+        })
+    return pd.DataFrame(rows, columns=BAR_FIELDS)
+
+
+def fetch_days(trade_dates):
+    for trade_date in trade_dates:
+        fetch_daily(trade_date)
+
+
+def test_period_trade_dates(fake_pro):
+    assert get_period_trade_dates("20250319", "W") == WEEK
+    march = get_period_trade_dates("20250305", "M")
+    assert march[0] == "20250303" and march[-1] == "20250331" and len(march) == 21
+
+
+@pytest.mark.parametrize("freq, api_name, trade_date", [("W", "weekly", "20250321"), ("M", "monthly", "20250331")])
+def test_local_bars_match_api(fake_pro, freq, api_name, trade_date):
+    trade_dates = get_period_trade_dates(trade_date, freq)
+    fetch_days(trade_dates)
+    fake_pro.register(api_name, api_bars(fake_pro.tables["daily"], trade_dates))
+
+    report = validate_against_api(trade_date, freq=freq, sample=40)
+    assert report is not None
+    assert report["mismatch"].sum() == 0
+    assert report["max_rel_err"].max() < 1e-6
+
+
+def test_missing_daily_or_mid_week_date(fake_pro):
+    fetch_days(WEEK[:-1])
+    assert build_period_bars("20250321") is None
+    # 非周期最后一个交易日没有周线，不能用之后的日线合成
+    mid_week = build_period_bars("20250319")
+    assert mid_week.empty and mid_week.columns.tolist() == BAR_FIELDS
+
+
+def test_fetch_weekly_uses_local_daily(fake_pro):
+    fetch_days(WEEK)
+    weekly = fetch_weekly("20250321")
+    assert fake_pro.call_count("weekly") == 0
+    assert len(weekly) == 40
+    assert set(weekly["trade_date"]) == {"20250321"}
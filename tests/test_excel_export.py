@@ -0,0 +1,45 @@
+# filename: test_excel_export.py
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+from stock_utils import auto_adjust_column_width, get_column_display_widths, write_excel_streaming
+
+
+def make_result(n=25):
+    return pd.DataFrame({
+        "ts_code": [f"{i:06d}.SZ" for i in range(n)],
+        "name": [f"股票{i}" if i % 7 else f"*ST长名称股票{i}" for i in range(n)],
+        "rank": np.arange(n),
+        "pe": [np.nan if i % 4 == 0 else i * 1.25 for i in range(n)],
+        "行业": ["软件服务"] * n,
+    })
+
+
+def read_sheet(path):
+    ws = load_workbook(path).active
+    values = [list(row) for row in ws.iter_rows(values_only=True)]
+    widths = {letter: dim.width for letter, dim in ws.column_dimensions.items()}
+    return values, widths
+
+
+def test_streaming_matches_to_excel_with_adjusted_widths(workdir):
+    df = make_result()
+    write_excel_streaming(df, "streaming.xlsx", chunk_size=10)
+    df.to_excel("baseline.xlsx", index=False)
+    auto_adjust_column_width("baseline.xlsx")
+
+    values, widths = read_sheet("streaming.xlsx")
+    expected_values, expected_widths = read_sheet("baseline.xlsx")
+    assert values == expected_values
+    assert widths == expected_widths
+
+
+def test_column_widths_count_cjk_as_two_and_cap(workdir):
+    df = pd.DataFrame({"a": ["abc", None], "名称": ["x", "y"], "long": ["中" * 40, ""]})
+    assert get_column_display_widths(df) == {"a": 3, "名称": 4, "long": 80}
+
+    write_excel_streaming(df, "widths.xlsx", max_width=30)
+    _, widths = read_sheet("widths.xlsx")
+    assert widths == {"A": 5, "B": 6, "C": 30}
@@ -0,0 +1,65 @@
+# filename: test_fina_period.py
+
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import stock_utils
+from data_cache import dc
+from stock_utils import fetch_fina_indicator_vip_by_quarter_str, get_fina_indicator_vip_period
+from write_behind import flush_writes
+
+# 当前季度的报告期，法定披露截止日一定在今天之后
+OPEN_PERIOD = pd.Timestamp.now().to_period("Q").end_time.strftime("%Y%m%d")
+
+
+@pytest.fixture
+def open_period(fake_pro):
+    """当前报告期只有前一半股票已披露"""
+    fina = fake_pro.tables["fina_indicator_vip"]
+    rows = fina[fina["end_date"] == "20240930"].assign(end_date=OPEN_PERIOD)
+    fake_pro.register("fina_indicator_vip", pd.concat([fina, rows.iloc[:20]], ignore_index=True))
+    return fina, rows
+
+
+def age_period_file(period, days=2):
+    """把报告期文件的获取时间改到 days 天前（早于上一个入库时间）"""
+    flush_writes()
+    path = os.path.join(dc.csv_dir, f"tushare_fina_indicator_vip_{period}.csv")
+    fetched_at = time.time() - days * 86400
+    os.utime(path, (fetched_at, fetched_at))
+
+
+def test_file_fetched_before_deadline_is_refetched(fake_pro, open_period):
+    fina, rows = open_period
+    assert len(fetch_fina_indicator_vip_by_quarter_str(OPEN_PERIOD)) == 20
+
+    # 当天再次读取使用本地文件
+    calls = fake_pro.call_count("fina_indicator_vip")
+    assert len(fetch_fina_indicator_vip_by_quarter_str(OPEN_PERIOD)) == 20
+    assert fake_pro.call_count("fina_indicator_vip") == calls
+
+    # 过了下一个入库时间后重新获取，取到之后披露的公司
+    fake_pro.register("fina_indicator_vip", pd.concat([fina, rows], ignore_index=True))
+    age_period_file(OPEN_PERIOD)
+    assert len(fetch_fina_indicator_vip_by_quarter_str(OPEN_PERIOD)) == 40
+
+
+def test_refetch_failure_keeps_existing_file(fake_pro, open_period):
+    fetch_fina_indicator_vip_by_quarter_str(OPEN_PERIOD)
+    age_period_file(OPEN_PERIOD)
+    fake_pro.inject_errors(*[RuntimeError("boom")] * 10)
+    assert len(fetch_fina_indicator_vip_by_quarter_str(OPEN_PERIOD)) == 20
+
+
+def test_open_period_cache_entry_expires(fake_pro, open_period):
+    _, index = get_fina_indicator_vip_period(OPEN_PERIOD)
+    assert len(index) == 20
+    assert stock_utils._fina_period_cache[OPEN_PERIOD][0] is not None
+
+    # 披露截止日后获取的报告期不过期
+    _, index = get_fina_indicator_vip_period("20240930")
+    assert len(index) == 40
+    assert stock_utils._fina_period_cache["20240930"][0] is None
@@ -0,0 +1,58 @@
+# filename: test_logging.py
+
+import logging
+import queue
+
+import pandas as pd
+import pytest
+
+import stock_utils
+from data_cache import dc
+from stock_utils import _DeferredQueueHandler
+
+NAME = "test_logging"
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    console = logging.StreamHandler()
+    console.setLevel(logging.INFO)
+    monkeypatch.setitem(stock_utils._log_handlers, NAME, [console])
+    return _DeferredQueueHandler(queue.SimpleQueue())
+
+
+def make_record(level, msg, *args):
+    return logging.getLogger(NAME).makeRecord(NAME, level, __file__, 0, msg, args, None)
+
+
+def test_frame_logged_as_it_was_at_call_time(handler):
+    df = pd.DataFrame({"ts_code": ["A", "B"], "close": [1.5, 2.5]})
+    records = [handler.prepare(make_record(logging.INFO, df)),
+               handler.prepare(make_record(logging.INFO, "结果：%s", df))]
+    df.loc[0, "close"] = 99.0
+    for record in records:
+        assert "1.5" in record.getMessage()
+        assert "99.0" not in record.getMessage()
+
+
+def test_plain_record_is_not_formatted(handler):
+    record = make_record(logging.INFO, "%s 行", 3)
+    assert handler.prepare(record) is record
+    assert record.args == (3,)
+
+
+def test_summary_mode_logs_shape_and_columns(handler, monkeypatch):
+    monkeypatch.setattr(dc, "log_summary_mode", True)
+    df = pd.DataFrame({"ts_code": ["A", "B", "C"], "close": [1.0, 2.0, 3.0]})
+    record = handler.prepare(make_record(logging.INFO, df))
+    assert record.getMessage().startswith("DataFrame[3x2] columns=['ts_code', 'close']")
+
+
+def test_record_below_handler_level_is_not_rendered(handler):
+    class Frame(pd.DataFrame):
+        def __repr__(self):
+            raise AssertionError("不应渲染")
+
+    frame = Frame({"a": [1]})
+    record = handler.prepare(make_record(logging.DEBUG, frame))
+    assert record.msg is frame
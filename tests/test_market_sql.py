@@ -0,0 +1,86 @@
+# filename: test_market_sql.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from data_cache import dc
+from stock_utils import fetch_daily, fetch_daily_basic, load_stock_basic
+
+pytest.importorskip("duckdb")
+
+from market_sql import CIRC_MV_HISTORY_SQL, TURNOVER_DAYS_SQL, MarketSQL  # noqa: E402
+
+DATES = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+@pytest.fixture
+def sql(fake_pro):
+    for trade_date in DATES:
+        fetch_daily(trade_date)
+        fetch_daily_basic(trade_date)
+    market = MarketSQL(threads=2)
+    yield market
+    market.close()
+
+
+def daily_basic_frame(fake_pro, start, end):
+    df = fake_pro.tables["daily_basic"]
+    return df[(df["trade_date"] >= start) & (df["trade_date"] <= end)]
+
+
+def test_views_and_partitions(sql):
+    assert {"daily", "daily_basic", "trade_cal"} <= set(sql.tables())
+    assert sql.dates("daily_basic") == DATES
+    assert sql.dates("daily_basic", 2) == DATES[-2:]
+    counts = sql.query("SELECT _date, count(*) AS n FROM daily GROUP BY _date ORDER BY _date")
+    assert counts["_date"].tolist() == DATES
+    assert counts["n"].tolist() == [40] * len(DATES)
+    # 股票代码及日期列按字符串读取
+    row = sql.query("SELECT ts_code, trade_date FROM daily WHERE _date = ? LIMIT 1", [DATES[0]])
+    assert row["trade_date"][0] == DATES[0] and row["ts_code"][0].endswith((".SZ", ".SH"))
+
+
+def test_turnover_days_matches_pandas(fake_pro, sql):
+    result = sql.query(TURNOVER_DAYS_SQL, [DATES[1], 5, 3])
+    df = daily_basic_frame(fake_pro, DATES[1], DATES[-1])
+    df = df[df["turnover_rate"] > 5]
+    days = df.groupby("ts_code")["turnover_rate"].agg(["count", "max"])
+    days = days[days["count"] >= 3]
+    assert len(result) > 0
+    assert sorted(result["ts_code"]) == sorted(days.index)
+    for row in result.itertuples():
+        assert row.days == days.loc[row.ts_code, "count"]
+        assert row.max_turnover_rate == pytest.approx(days.loc[row.ts_code, "max"])
+
+
+def test_circ_mv_history_with_stock_basic(fake_pro, sql):
+    load_stock_basic(DATES[-1])  # 写入快照存储
+    assert sql.register_stock_basic(DATES[-1]) == 40
+    result = sql.query(CIRC_MV_HISTORY_SQL, [DATES[0], DATES[2], dc.circ_mv])
+    df = daily_basic_frame(fake_pro, DATES[0], DATES[2])
+    expected = df[df["circ_mv"] <= dc.circ_mv]
+    assert len(result) == len(expected)
+    assert set(zip(result["trade_date"], result["ts_code"])) == set(zip(expected["trade_date"], expected["ts_code"]))
+
+
+@pytest.mark.parametrize("trade_date, with_sid", [("20250314", False), ("20250324", True)])
+def test_empty_column_keeps_numeric_type(fake_pro, sql, trade_date, with_sid):
+    # 某天整列为空（无论是否为最新文件、表头是否含 sid 列）时仍按数值类型读取
+    df = daily_basic_frame(fake_pro, trade_date, trade_date).assign(pe=None)
+    if with_sid:
+        df.insert(0, "sid", range(len(df)))
+    df.to_csv(os.path.join(dc.csv_dir, f"tushare_daily_basic_{trade_date}.csv"), index=False)
+    sql.refresh()
+    result = sql.query("SELECT _date, avg(pe) AS pe, avg(circ_mv) AS circ_mv FROM daily_basic GROUP BY _date")
+    result = result.set_index("_date")
+    assert pd.isna(result.loc[trade_date, "pe"])
+    assert result.loc[DATES, "pe"].notna().all() and result["circ_mv"].notna().all()
+
+
+def test_refresh_picks_up_new_files(fake_pro, sql):
+    fetch_daily("20250324")
+    sql.refresh()
+    assert sql.dates("daily")[-1] == "20250324"
+    assert sql.query("SELECT count(*) AS n FROM daily WHERE _date = '20250324'")["n"][0] == 40
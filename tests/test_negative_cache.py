@@ -0,0 +1,100 @@
+# filename: test_negative_cache.py
+
+import datetime
+
+import pytest
+
+import negative_cache
+from negative_cache import NegativeCache, expected_publish_time
+from stock_utils import fetch_daily
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def at(text):
+    return datetime.datetime.strptime(text, "%Y%m%d %H:%M")
+
+
+@pytest.fixture
+def clock():
+    return FakeClock(at("20250321 14:00"))
+
+
+@pytest.fixture
+def cache(fake_pro, clock):
+    return NegativeCache(clock=clock)
+
+
+@pytest.mark.parametrize("api_name, key, now, expires, reason", [
+    ("daily", "20250321", "20250321 14:00", "20250321 14:10", "当日数据尚未入库"),
+    ("daily", "20250321", "20250321 16:55", "20250321 17:00", "当日数据尚未入库"),
+    ("daily", "20250321", "20250320 10:00", "20250321 17:00", "数据尚未入库"),
+    ("daily", "20250321", "20250321 18:00", "20250321 19:00", "已过入库时间仍无数据"),
+    ("fina_indicator_vip", "20250331", "20250315 10:00", "20250401 00:00", "报告期尚未结束"),
+    ("fina_indicator_vip", "20250331", "20250410 10:00", "20250410 17:00", "报告期尚未披露"),
+    ("fina_indicator_vip", "20250331", "20250410 18:00", "20250411 17:00", "报告期尚未披露"),
+    ("fina_indicator_vip", "20250331", "20250502 10:00", "20250509 10:00", "已过披露截止日仍无数据"),
+])
+def test_expected_publish_time(fake_pro, api_name, key, now, expires, reason):
+    assert expected_publish_time(api_name, key, at(now)) == (at(expires), reason)
+
+
+def test_non_trade_day_is_permanent(cache, clock):
+    assert cache.is_empty("daily", "20250322")
+    assert cache.get("daily", "20250322")["expires"] is None
+    clock.now = at("20300101 00:00")
+    assert cache.is_empty("daily", "20250322")
+    assert not cache.is_empty("daily", "20250324")
+
+
+def test_entry_expires_with_injected_clock(cache, clock):
+    cache.mark_empty("daily", "20250321")
+    clock.now = at("20250321 14:09")
+    assert cache.is_empty("daily", "20250321")
+    # 其他进程读取同一文件
+    assert NegativeCache(clock=clock).is_empty("daily", "20250321")
+
+    clock.now = at("20250321 14:10")
+    assert not cache.is_empty("daily", "20250321")
+    # 过期记录已从文件中删除
+    assert NegativeCache(clock=lambda: at("20250321 14:00")).get("daily", "20250321") is None
+
+
+def test_discard_and_clear(cache):
+    cache.mark_empty("daily", "20250321")
+    cache.mark_empty("daily_basic", "20250321")
+    cache.mark_empty("fina_indicator_vip", "20250331")
+    cache.discard("daily", "20250321")
+    assert cache.get("daily", "20250321") is None
+    cache.clear("daily_basic")
+    assert cache.get("daily_basic", "20250321") is None
+    assert cache.get("fina_indicator_vip", "20250331") is not None
+    cache.clear()
+    assert NegativeCache().get("fina_indicator_vip", "20250331") is None
+
+
+def test_fetch_skips_api_until_entry_expires(fake_pro, cache, clock, monkeypatch):
+    monkeypatch.setattr(negative_cache, "_negative_cache", cache)
+    fake_pro.clock = clock
+    fake_pro.set_available_at("daily", "20250321", at("20250321 15:30"))
+
+    assert fetch_daily("20250321").empty
+    assert fake_pro.call_count("daily") == 1
+    clock.now = at("20250321 14:05")
+    assert fetch_daily("20250321").empty
+    assert fake_pro.call_count("daily") == 1  # 未到期，不请求接口
+
+    clock.now = at("20250321 15:40")
+    assert len(fetch_daily("20250321")) == 40
+    assert fake_pro.call_count("daily") >= 2
+
+    # 非交易日不请求接口
+    calls = fake_pro.call_count("daily")
+    assert fetch_daily("20250322").empty
+    assert fake_pro.call_count("daily") == calls
@@ -0,0 +1,66 @@
+# filename: test_panel_store.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from panel_store import PanelStore, _count_small_caps, run_in_pool
+from stock_utils import fetch_daily, fetch_daily_basic
+
+DATES = ["20250317", "20250318", "20250319"]
+FIELDS = {"daily": ["close", "vol"], "daily_basic": ["pe", "circ_mv"]}
+
+
+@pytest.fixture
+def panel(fake_pro):
+    for trade_date in DATES:
+        fetch_daily(trade_date)
+        fetch_daily_basic(trade_date)
+    # 最后一个交易日少一只股票，面板中对应位置为 NaN
+    daily = fake_pro.tables["daily"]
+    missing = daily["ts_code"].iloc[0]
+    fake_pro.register("daily", daily[(daily["trade_date"] != "20250320") | (daily["ts_code"] != missing)])
+    fetch_daily("20250320")
+    fetch_daily_basic("20250320")
+    return PanelStore.build("test", DATES + ["20250320"], fields=FIELDS), missing
+
+
+def expected_frame(fake_pro, date):
+    daily = fake_pro.tables["daily"]
+    daily_basic = fake_pro.tables["daily_basic"]
+    df = daily_basic[daily_basic["trade_date"] == date][["ts_code", "pe", "circ_mv"]].merge(
+        daily[daily["trade_date"] == date][["ts_code", "close", "vol"]], on="ts_code", how="left")
+    return df.set_index("ts_code").sort_index()[["close", "vol", "pe", "circ_mv"]]
+
+
+def test_build_and_attach_match_csv(fake_pro, panel):
+    store, missing = panel
+    assert store.data.shape == (4, 4, 40)
+    attached = PanelStore.attach("test")
+    assert isinstance(attached.data, np.memmap) and not attached.data.flags.writeable
+    for date in DATES + ["20250320"]:
+        pd.testing.assert_frame_equal(attached.frame(date), expected_frame(fake_pro, date), check_names=False)
+    assert np.isnan(attached.cross_section("close", "20250320")[attached.code_index([missing])[0]])
+    assert attached.code_index(["000000.XX"]).tolist() == [-1]
+    # 截面是连续内存的视图
+    assert attached.cross_section("pe", "20250318").flags.c_contiguous
+    assert np.shares_memory(attached.field("pe"), attached.data)
+
+
+def test_shared_memory_round_trip(panel):
+    store, _ = panel
+    shm_name = store.share()
+    try:
+        attached = PanelStore.attach_shared(shm_name, store.meta())
+        np.testing.assert_array_equal(attached.data, store.data)
+        assert attached.frame("20250319").equals(store.frame("20250319"))
+        attached.close()
+    finally:
+        store.close(unlink=True)
+
+
+def test_run_in_pool_matches_in_process(panel):
+    store, _ = panel
+    tasks = [(date, 1e7) for date in DATES]
+    expected = [(date, int(np.count_nonzero(store.cross_section("circ_mv", date) <= 1e7))) for date in DATES]
+    assert run_in_pool("test", _count_small_caps, tasks, processes=2) == expected
@@ -0,0 +1,62 @@
+# filename: test_param_sweep.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from data_cache import dc
+from param_sweep import SWEEP_PARAMS, expand_grid, load_sweep_inputs, run_sweep
+from stock_utils import fetch_daily, get_quarter_end_dates
+from tushare_stub import make_sample_market
+
+TRADE_DATE = "20250321"
+WEEK = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+@pytest.fixture
+def market(fake_pro):
+    """400 只股票的模拟行情，并缓存整周日线用于合成周线"""
+    for api_name, df in make_sample_market(n_stocks=400).items():
+        fake_pro.register(api_name, df)
+    for trade_date in WEEK:
+        fetch_daily(trade_date)
+    return fake_pro
+
+
+def run_pipeline(monkeypatch, params):
+    """按给定阈值运行文件流水线 filter2 ~ filter4，返回各阶段数量及最终入选股票"""
+    import tushare_test4
+
+    for name, value in params.items():
+        monkeypatch.setattr(dc, name, value)
+    quarter = get_quarter_end_dates(dc.period_year)[dc.period_quarter]
+
+    def count(name):
+        path = os.path.join(dc.filter_dir, f"tushare_stock_basic_{name}.csv")
+        return len(pd.read_csv(path)) if os.path.exists(path) else 0
+
+    output_file = tushare_test4.filter_stocks_by_weekly(TRADE_DATE)
+    selected = tuple(sorted(pd.read_csv(output_file)["ts_code"])) if output_file else ()
+    return {"filter2": count(f"filter2_{TRADE_DATE}"), "filter3": count(f"filter3_{TRADE_DATE}_{quarter}"),
+            "count": len(selected), "selected": selected}
+
+
+def test_sweep_matches_pipeline(market, monkeypatch):
+    grid = {"circ_mv": [dc.circ_mv, dc.circ_mv / 2], "roe": [dc.roe, dc.roe + 4], "top_volume": [2, dc.top_volume]}
+    result = run_sweep(load_sweep_inputs(TRADE_DATE), grid)
+    assert len(result) == 8
+    assert result["count"].sum() > 0
+
+    for row in result.to_dict("records"):
+        params = {name: row[name] for name in SWEEP_PARAMS}
+        expected = run_pipeline(monkeypatch, params)
+        assert {key: row[key] for key in expected} == expected, params
+
+
+def test_expand_grid_defaults_and_unknown(workdir):
+    combos = expand_grid({"roe": [2, 6]})
+    assert [combo["roe"] for combo in combos] == [2, 6]
+    assert all(combo["circ_mv"] == dc.circ_mv and combo["top_pct_chg"] == dc.top_pct_chg for combo in combos)
+    with pytest.raises(ValueError):
+        expand_grid({"pb": [1]})
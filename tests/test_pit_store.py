@@ -0,0 +1,49 @@
+# filename: test_pit_store.py
+
+import pandas as pd
+
+from pit_store import FinaPitStore
+
+
+def make_store():
+    records = pd.DataFrame({
+        "ts_code": ["A", "A", "A", "B"],
+        "end_date": ["20240930", "20240930", "20241231", "20240930"],
+        "ann_date": ["20241030", "20241115", "20250320", "20241031"],
+        "roe": [5.0, 4.0, 8.0, 3.0],
+        "update_flag": ["0", "1", "1", "1"],
+    })
+    return FinaPitStore(records)
+
+
+def visible(result, trade_date, ts_code, column="roe"):
+    rows = result[(result["trade_date"] == trade_date) & (result["ts_code"] == ts_code)]
+    return rows[column].tolist()
+
+
+def test_only_announced_versions_are_visible():
+    result = make_store().as_of(["20241031", "20241120", "20250321"])
+    # 更正公告之前使用原始版本，之后使用更正后的版本
+    assert visible(result, "20241031", "A") == [5.0]
+    assert visible(result, "20241120", "A") == [4.0]
+    # 年报公告后最新报告期切换为 20241231
+    assert visible(result, "20250321", "A") == [8.0]
+    assert visible(result, "20250321", "A", "end_date") == ["20241231"]
+
+
+def test_no_row_before_first_announcement():
+    result = make_store().as_of(["20241029"])
+    assert result.empty
+
+
+def test_same_day_announcement():
+    store = make_store()
+    assert visible(store.as_of(["20241031"]), "20241031", "B") == [3.0]
+    assert visible(store.as_of(["20241031"], include_same_day=False), "20241031", "B") == []
+
+
+def test_as_of_fixed_period_and_codes():
+    result = make_store().as_of(["20250321"], end_date="20240930", ts_codes=["A"])
+    assert result["ts_code"].tolist() == ["A"]
+    assert result["roe"].tolist() == [4.0]
+    assert result["end_date"].tolist() == ["20240930"]
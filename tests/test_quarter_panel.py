@@ -0,0 +1,87 @@
+# filename: test_quarter_panel.py
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from quarter_panel import QuarterRule, load_quarter_panel, panel_matrix, screen_quarter_panel
+from tushare_stub import make_sample_market
+
+END_DATES = ["20240331", "20240630", "20240930", "20241231"]
+
+
+def make_panel(values):
+    """values: {ts_code: 按 END_DATES 顺序的 roe，None 表示该季度没有数据}"""
+    rows = [(code, end_date, roe) for code, series in values.items()
+            for end_date, roe in zip(END_DATES, series) if roe is not None]
+    return pd.DataFrame(rows, columns=["ts_code", "end_date", "roe"]).set_index(["ts_code", "end_date"])
+
+
+PANEL = make_panel({
+    "A": [5, 6, 7, 8],
+    "B": [5, 1, 6, 7],
+    "C": [1, 1, 1, 9],
+    "D": [5, None, 6, 7],
+})
+
+
+@pytest.mark.parametrize("rule, expected", [
+    (QuarterRule("roe", ">=", 4, "all"), ["A"]),
+    (QuarterRule("roe", ">=", 9, "any"), ["C"]),
+    (QuarterRule("roe", ">=", 4, "last", 2), ["A", "B", "D"]),
+    (QuarterRule("roe", ">=", 4, "streak", 3), ["A"]),
+    (QuarterRule("roe", ">=", None, "trend"), ["A", "C"]),
+])
+def test_rule_kinds(rule, expected):
+    assert screen_quarter_panel(PANEL, [rule], END_DATES, report=False).tolist() == expected
+
+
+def test_quarter_without_data_fails_all_rule():
+    # 整个报告期没有数据时该季度为 NaN，'all' 规则不通过
+    end_dates = END_DATES + ["20250331"]
+    assert panel_matrix(PANEL, "roe", end_dates).columns.tolist() == end_dates
+    assert screen_quarter_panel(PANEL, [QuarterRule("roe", ">=", 4, "all")], end_dates, report=False).empty
+
+
+def test_sliced_panel_uses_explicit_end_dates():
+    # 切片后的面板不含 20240630 的数据，报告期仍按传入的 end_dates 计算
+    sliced = PANEL[PANEL.index.get_level_values("end_date") != "20240630"]
+    rule = QuarterRule("roe", ">=", 4, "all")
+    assert screen_quarter_panel(sliced, [rule], END_DATES, report=False).empty
+    subset = ["20240331", "20240930", "20241231"]
+    assert screen_quarter_panel(sliced, [rule], subset, report=False).tolist() == ["A", "B", "D"]
+
+
+def test_load_quarter_panel_keeps_last_announcement(fake_pro):
+    fina = fake_pro.tables["fina_indicator_vip"]
+    fake_pro.register("fina_indicator_vip", pd.concat([fina, fina.iloc[:1].assign(roe=99.0)], ignore_index=True))
+    panel = load_quarter_panel(["20240930", "20231231"], fields=["roe"])
+    assert panel.index.get_level_values("end_date").unique().tolist() == ["20231231", "20240930"]
+    code, end_date = fina.iloc[0]["ts_code"], fina.iloc[0]["end_date"]
+    assert panel.loc[(code, end_date), "roe"] == 99.0
+
+
+def test_stage3_matches_per_quarter_screens(fake_pro):
+    import tushare_test3
+
+    for api_name, df in make_sample_market(n_stocks=400).items():
+        fake_pro.register(api_name, df)
+    trade_date = "20250321"
+    output_file = tushare_test3.filter_stocks_by_quarter_panel(trade_date, ["20231231", "20240930"])
+    assert os.path.basename(output_file) == f"tushare_stock_basic_filter3_{trade_date}_merged.csv"
+    result = pd.read_csv(output_file)
+
+    expected = None
+    for end_date in ("20231231", "20240930"):
+        codes = set(pd.read_csv(tushare_test3.filter_stocks_by_financials(trade_date, end_date))["ts_code"])
+        expected = codes if expected is None else expected & codes
+    assert len(result) > 0
+    assert sorted(result["ts_code"]) == sorted(expected)
+    assert np.all(np.diff(result["sid"]) > 0)
+
+    # 输入未变化时复用已有结果
+    mtime = os.path.getmtime(output_file)
+    assert tushare_test3.filter_stocks_by_quarter_panel(trade_date, ["20231231", "20240930"]) == output_file
+    assert os.path.getmtime(output_file) == mtime
@@ -0,0 +1,87 @@
+# filename: test_query_pager.py
+
+import pandas as pd
+import pytest
+
+from query_pager import query_all, query_chunked, split_codes, split_date_range
+
+
+def test_short_first_page_is_confirmed_until_a_longer_page_is_seen(fake_pro):
+    # 首次不满 limit 时按 offset 再请求一次，确认不是服务器单次上限造成的截断
+    df = query_all("daily", trade_date="20250321", limit=100)
+    assert len(df) == 40
+    assert fake_pro.call_count("daily") == 2
+
+    # 返回过 100 行的整页后，更短的首页一定完整，只请求一次
+    query_all("daily", start_date="20250301", end_date="20250331", limit=100, max_workers=1)
+    calls = fake_pro.call_count("daily")
+    assert len(query_all("daily", trade_date="20250320", limit=100)) == 40
+    assert fake_pro.call_count("daily") == calls + 1
+
+
+def test_server_cap_below_limit_is_paged(fake_pro, monkeypatch):
+    expected = fake_pro.daily(trade_date="20250321")
+    original = fake_pro.query
+
+    def capped_query(api_name, fields="", **params):
+        return original(api_name, fields=fields, **{**params, "limit": min(int(params["limit"]), 15)})
+
+    monkeypatch.setattr(fake_pro, "query", capped_query)
+    df = query_all("daily", trade_date="20250321", limit=100, max_workers=2)
+    pd.testing.assert_frame_equal(df, expected)
+
+    # 已确认的上限直接作为页长
+    calls = fake_pro.call_count()
+    assert len(query_all("daily", trade_date="20250320", limit=100, max_workers=1)) == 40
+    assert [params["limit"] for _, params in fake_pro.calls[calls:]] == [15, 15, 15]
+
+
+def test_pages_until_a_short_page(fake_pro):
+    full = fake_pro.daily(start_date="20250301", end_date="20250331")
+    calls = fake_pro.call_count()
+
+    df = query_all("daily", start_date="20250301", end_date="20250331", limit=70, max_workers=3)
+    pd.testing.assert_frame_equal(df, full)
+    pages = len(full) // 70 + 1
+    # 按批并发请求，最后一批可能多请求几页空页
+    assert pages <= fake_pro.call_count() - calls < pages + 3
+    offsets = sorted(params["offset"] for _, params in fake_pro.calls[calls:])
+    assert offsets[:pages] == [i * 70 for i in range(pages)]
+
+
+def test_exact_multiple_of_limit(fake_pro):
+    df = query_all("daily", trade_date="20250321", limit=20, max_workers=1)
+    assert len(df) == 40
+    assert df["ts_code"].is_unique
+
+
+def test_offset_ignored_is_detected(fake_pro, monkeypatch):
+    original = fake_pro.query
+
+    def query_without_offset(api_name, fields="", **params):
+        params.pop("offset", None)
+        return original(api_name, fields=fields, **params)
+
+    monkeypatch.setattr(fake_pro, "query", query_without_offset)
+    with pytest.raises(RuntimeError, match="offset"):
+        query_all("daily", trade_date="20250321", limit=40)
+
+
+def test_query_chunked_concatenates_in_chunk_order(fake_pro):
+    codes = sorted(fake_pro.tables["stock_basic"]["ts_code"])[:5]
+    df = query_chunked("daily", split_date_range("20250101", "20250331", days=30), ts_code=",".join(codes))
+    assert df["trade_date"].is_monotonic_increasing
+    assert len(df) == len(fake_pro.daily(ts_code=",".join(codes)))
+
+    df = query_chunked("daily", split_codes(codes, size=2), trade_date="20250321")
+    assert df["ts_code"].tolist() == [code for code in fake_pro.daily(trade_date="20250321")["ts_code"]
+                                      if code in codes]
+
+
+def test_split_helpers():
+    assert split_codes(["a", "b", "c"], size=2) == [{"ts_code": "a,b"}, {"ts_code": "c"}]
+    assert split_date_range("20250101", "20250110", days=4) == [
+        {"start_date": "20250101", "end_date": "20250104"},
+        {"start_date": "20250105", "end_date": "20250108"},
+        {"start_date": "20250109", "end_date": "20250110"},
+    ]
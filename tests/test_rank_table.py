@@ -0,0 +1,62 @@
+# filename: test_rank_table.py
+
+import pandas as pd
+import pytest
+
+from rank_table import RankTable, compute_rank_table
+
+
+def make_table():
+    df = pd.DataFrame({
+        "ts_code": ["A", "B", "C", "D", "E"],
+        "circ_mv": [50.0, 10.0, 30.0, 30.0, None],
+    })
+    industry = pd.Series({"A": "银行", "B": "银行", "C": "白酒", "D": "白酒"})
+    return RankTable("daily_basic", "20250321", compute_rank_table(df, ["circ_mv", "missing"], industry))
+
+
+def test_dense_rank_and_percentile():
+    table = make_table()
+    top = table.top_k("circ_mv", 10)
+    # 缺失值不参与排名，并列保持原始顺序
+    assert top["ts_code"].tolist() == ["A", "C", "D", "B"]
+    assert top["rank"].tolist() == [1, 2, 2, 3]
+    assert top["pct"].tolist() == [100.0, 75.0, 75.0, 25.0]
+
+
+def test_top_k_and_bottom_k():
+    table = make_table()
+    assert table.top_k("circ_mv", 2)["ts_code"].tolist() == ["A", "C"]
+    assert table.top_k("circ_mv", 2, ascending=True)["ts_code"].tolist() == ["B", "D"]
+    assert table.top_k("circ_mv", 1, industry="白酒")["ts_code"].tolist() == ["C"]
+
+
+def test_range_queries():
+    table = make_table()
+    assert table.value_range("circ_mv", high=30)["ts_code"].tolist() == ["C", "D", "B"]
+    assert table.value_range("circ_mv", low=30, high=40)["ts_code"].tolist() == ["C", "D"]
+    assert table.percentile_range("circ_mv", low=50)["ts_code"].tolist() == ["A", "C", "D"]
+    assert table.industries("circ_mv") == ["白酒", "银行"]
+
+
+def test_lookup_and_unknown_metric():
+    table = make_table()
+    found = table.lookup("circ_mv", ["B", "E"])
+    assert found["ts_code"].tolist() == ["B"]
+    assert table.top_k("circ_mv", 3, industry="汽车").empty
+    with pytest.raises(KeyError):
+        table.top_k("pe", 3)
+
+
+def test_build_and_load_round_trip(fake_pro):
+    from stock_utils import fetch_daily_basic
+    from write_behind import flush_writes
+
+    fetch_daily_basic("20250321")
+    built = RankTable.build("daily_basic", "20250321")
+    flush_writes()
+    loaded = RankTable.load("daily_basic", "20250321")
+    assert loaded is not None
+    assert loaded.metrics() == built.metrics()
+    pd.testing.assert_frame_equal(loaded.top_k("circ_mv", 5).drop(columns="group"),
+                                  built.top_k("circ_mv", 5).drop(columns="group"), check_dtype=False)
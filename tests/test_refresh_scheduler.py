@@ -0,0 +1,82 @@
+# filename: test_refresh_scheduler.py
+
+import datetime
+import os
+
+import pytest
+
+from data_cache import dc
+from refresh_scheduler import RefreshScheduler
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def scheduler(fake_pro):
+    clock = FakeClock(datetime.datetime(2025, 3, 21, 14, 0))
+    fake_pro.clock = clock
+    for api_name in ("daily", "daily_basic"):
+        fake_pro.set_available_at(api_name, "20250321", datetime.datetime(2025, 3, 21, 15, 40))
+    stages = []
+    sched = RefreshScheduler(clock=clock, sleep=lambda seconds: None, poll_interval=300,
+                             stages=[lambda trade_date: stages.append(trade_date)])
+    sched.fake_clock, sched.stage_calls = clock, stages
+    return sched
+
+
+def test_waits_until_start_time(scheduler, fake_pro):
+    assert not scheduler.run_once()
+    assert fake_pro.call_count() == 0
+    assert scheduler.next_wait() == 3600
+
+
+def test_polls_until_data_is_published(scheduler):
+    scheduler.fake_clock.now = datetime.datetime(2025, 3, 21, 15, 10)
+    assert not scheduler.run_once()
+    assert scheduler.next_wait() == 300
+    assert scheduler.stage_calls == []
+
+    scheduler.fake_clock.now = datetime.datetime(2025, 3, 21, 15, 45)
+    assert scheduler.run_once()
+    assert scheduler.stage_calls == ["20250321"]
+    # 周五为周最后一个交易日：补齐整周日线并生成周线及排名表
+    for name in ("tushare_daily_20250317", "tushare_daily_20250321", "tushare_daily_basic_20250321",
+                 "tushare_weekly_20250321", "rank_daily_basic_20250321"):
+        assert os.path.exists(os.path.join(dc.csv_dir, f"{name}.csv")), name
+
+    # 当天已完成，不再重复
+    assert not scheduler.run_once()
+    assert scheduler.stage_calls == ["20250321"]
+
+
+def test_not_completed_when_ingest_produced_no_inputs(scheduler, monkeypatch):
+    scheduler.fake_clock.now = datetime.datetime(2025, 3, 21, 16, 0)
+    monkeypatch.setattr(scheduler, "ingest", lambda trade_date: None)
+    assert not scheduler.run_once()
+    assert scheduler.stage_calls == []
+    assert "20250321" not in scheduler.completed
+
+
+def test_skips_non_trade_day(scheduler, fake_pro):
+    scheduler.fake_clock.now = datetime.datetime(2025, 3, 22, 16, 0)
+    assert not scheduler.run_once()
+    assert fake_pro.call_count("daily") == 0
+
+
+def test_run_forever_survives_errors(scheduler, monkeypatch):
+    scheduler.fake_clock.now = datetime.datetime(2025, 3, 21, 16, 0)
+    calls = []
+
+    def failing():
+        calls.append(1)
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr(scheduler, "run_once", failing)
+    scheduler.run_forever(max_iterations=3)
+    assert len(calls) == 3
@@ -0,0 +1,73 @@
+# filename: test_result_stream.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from result_stream import DEFAULT_KEY, stream_join, stream_merge
+
+
+def write_csv(path, df):
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def test_merge_dedupes_across_files(tmp_path):
+    first = write_csv(tmp_path / "a.csv", pd.DataFrame({"trade_date_x": [20250314, 20250321],
+                                                        "ts_code": ["A", "A"], "rank": [1, 2]}))
+    second = write_csv(tmp_path / "b.csv", pd.DataFrame({"trade_date_x": [20250321, 20250321],
+                                                         "ts_code": ["A", "B"], "rank": [9, 3]}))
+    path, rows = stream_merge([first, second], str(tmp_path / "out.csv"), chunksize=1, dedupe_on=DEFAULT_KEY)
+    result = pd.read_csv(path)
+    assert rows == 3
+    assert result["rank"].tolist() == [1, 2, 3]
+
+
+def test_empty_merge_still_writes_header(tmp_path):
+    empty = write_csv(tmp_path / "a.csv", pd.DataFrame(columns=["trade_date_x", "ts_code", "rank"]))
+    path, rows = stream_merge([empty, str(tmp_path / "missing.csv")], str(tmp_path / "out.csv"),
+                              dedupe_on=DEFAULT_KEY)
+    assert rows == 0
+    assert pd.read_csv(path).columns.tolist() == ["trade_date_x", "ts_code", "rank"]
+
+
+def test_join_without_overlap_writes_header(tmp_path):
+    left = write_csv(tmp_path / "l.csv", pd.DataFrame({"ts_code": ["A"], "v": [1]}))
+    right = write_csv(tmp_path / "r.csv", pd.DataFrame({"ts_code": ["B"], "v": [2]}))
+    path, left_rows, right_rows, rows = stream_join(left, right, str(tmp_path / "j.csv"))
+    assert (left_rows, right_rows, rows) == (1, 1, 0)
+    assert pd.read_csv(path).columns.tolist() == ["ts_code", "v_x", "v_y"]
+
+
+def test_parquet_keeps_integer_columns(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    first = write_csv(tmp_path / "a.csv", pd.DataFrame({"ts_code": ["A", "B"], "rank": [1, 2]}))
+    second = write_csv(tmp_path / "b.csv", pd.DataFrame({"ts_code": ["C", "D"], "rank": [3, None]}))
+    path, rows = stream_merge([first, second], str(tmp_path / "out.parquet"))
+    table = pq.read_table(path)
+    assert rows == 4
+    assert str(table.schema.field("rank").type) == "int64"
+    assert table.column("rank").to_pylist() == [1, 2, 3, None]
+
+
+def test_parquet_widens_integer_column_to_float(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    first = write_csv(tmp_path / "a.csv", pd.DataFrame({"ts_code": ["A", "B"], "pe": [10, 20]}))
+    second = write_csv(tmp_path / "b.csv", pd.DataFrame({"ts_code": ["C"], "pe": [2.5]}))
+    path, rows = stream_merge([first, second], str(tmp_path / "out.parquet"))
+    table = pq.read_table(path)
+    assert rows == 3
+    assert str(table.schema.field("pe").type) == "double"
+    assert table.column("pe").to_pylist() == [10.0, 20.0, 2.5]
+
+
+def test_parquet_empty_column_takes_later_text_type(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    first = write_csv(tmp_path / "a.csv", pd.DataFrame({"ts_code": ["A"], "area": [None]}))
+    second = write_csv(tmp_path / "b.csv", pd.DataFrame({"ts_code": ["B"], "area": ["北京"]}))
+    path, rows = stream_merge([first, second], str(tmp_path / "out.parquet"))
+    table = pq.read_table(path)
+    assert rows == 2
+    assert table.column("area").to_pylist() == [None, "北京"]
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".parts_")]
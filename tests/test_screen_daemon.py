@@ -0,0 +1,73 @@
+# filename: test_screen_daemon.py
+
+import os
+
+import pandas as pd
+import pytest
+
+import screen_daemon
+from data_cache import dc
+from screen_daemon import ScreenCache
+from stock_utils import fetch_daily, get_quarter_end_dates
+from tushare_stub import make_sample_market
+
+TRADE_DATE = "20250321"
+WEEK = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+@pytest.fixture
+def market(fake_pro, monkeypatch):
+    """400 只股票的模拟行情，最近交易日固定为 TRADE_DATE"""
+    for api_name, df in make_sample_market(n_stocks=400).items():
+        fake_pro.register(api_name, df)
+    calendar = fake_pro.tables["trade_cal"]
+    trade_dates = sorted(calendar.loc[(calendar["is_open"] == 1) & (calendar["cal_date"] <= TRADE_DATE), "cal_date"],
+                         reverse=True)
+    monkeypatch.setattr(screen_daemon, "get_last_n_trade_dates", lambda n=20: trade_dates[:n])
+    return fake_pro
+
+
+def filter_path(name):
+    return os.path.join(dc.filter_dir, f"tushare_stock_basic_{name}.csv")
+
+
+def test_run_screen_matches_file_pipeline(market):
+    import tushare_test4
+
+    # 本地合成周线需要整周日线
+    for trade_date in WEEK:
+        fetch_daily(trade_date)
+    expected = pd.read_csv(tushare_test4.filter_stocks_by_weekly(TRADE_DATE))
+    quarter = get_quarter_end_dates(dc.period_year)[dc.period_quarter]
+
+    cache = ScreenCache(history_days=5)
+    assert cache.refresh()
+    result = cache.run_screen({"trade_date": TRADE_DATE})
+    assert result["quarters"] == [quarter]
+    assert result["counts"]["filter1"] == len(pd.read_csv(filter_path(f"filter1_{TRADE_DATE}")))
+    assert result["counts"]["filter2"] == len(pd.read_csv(filter_path(f"filter2_{TRADE_DATE}")))
+    assert result["counts"]["filter3"] == len(pd.read_csv(filter_path(f"filter3_{TRADE_DATE}_{quarter}")))
+    assert len(result["stocks"]) > 0
+    assert sorted(stock["ts_code"] for stock in result["stocks"]) == sorted(set(expected["ts_code"]))
+
+
+def test_empty_weekly_is_not_cached(market, monkeypatch):
+    cache = ScreenCache(history_days=5)
+    monkeypatch.setattr(screen_daemon, "fetch_weekly", lambda trade_date: pd.DataFrame())
+    assert cache.get_weekly(TRADE_DATE).empty
+    assert TRADE_DATE not in cache.weekly
+
+    weekly = pd.DataFrame({"ts_code": ["000001.SZ"]})
+    monkeypatch.setattr(screen_daemon, "fetch_weekly", lambda trade_date: weekly)
+    assert cache.get_weekly(TRADE_DATE) is weekly
+    assert cache.weekly[TRADE_DATE] is weekly
+
+
+def test_refresh_is_incremental(market):
+    cache = ScreenCache(history_days=3)
+    assert cache.refresh()
+    assert cache.trade_dates == ["20250321", "20250320", "20250319"]
+    calls = market.call_count("daily_basic")
+    # 交易日未变化时不再加载
+    assert not cache.refresh()
+    assert market.call_count("daily_basic") == calls
@@ -0,0 +1,105 @@
+# filename: test_screen_rules.py
+
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import screen_rules
+from screen_rules import build_filter_rules, build_selection_rules, evaluate_rules
+from tushare_stub import make_sample_market
+
+TODAY = datetime.date(2025, 3, 21)
+
+ALL_ENABLED = {
+    "years_to_exclude": 2,
+    "exclude_st": True,
+    "exclude_start_8_9": True,
+    "market_type": "主板",
+    "exclude_private_and_foreign": True,
+}
+
+
+class RecordingLogger(object):
+    def __init__(self):
+        self.messages = []
+
+    def info(self, message):
+        self.messages.append(message)
+
+    def debug(self, message):
+        pass
+
+
+@pytest.fixture
+def stock_basic():
+    df = make_sample_market(n_stocks=200)["stock_basic"]
+    extra = pd.DataFrame({"ts_code": ["830001.BJ", "430001.BJ", "920001.BJ"], "name": ["北交所1", "ST北交所", "北交所3"],
+                          "market": "北交所", "list_date": "20100101", "act_ent_type": "地方国企"})
+    df = pd.concat([df, extra], ignore_index=True)
+    # 从 CSV 读取时上市日期为整数
+    df["list_date"] = df["list_date"].astype(int)
+    return df
+
+
+@pytest.fixture
+def recorder(monkeypatch):
+    logger = RecordingLogger()
+    monkeypatch.setattr(screen_rules, "logger", logger)
+    return logger
+
+
+def baseline_steps(df):
+    """原 tushare_test1 / test2 式的逐条过滤，返回 {规则名: 过滤条件}"""
+    return {
+        "exclude_recent_listings": lambda d: d[d["list_date"].astype(str) < "20230321"],
+        "exclude_st_stocks": lambda d: d[~d["name"].str.contains("ST")],
+        "exclude_start_8_9": lambda d: d[~d["ts_code"].str[0].isin(["4", "8", "9"])],
+        "market_type_mainboard": lambda d: d[d["market"] == "主板"],
+        "exclude_private_foreign": lambda d: d[~d["act_ent_type"].isin(["民营企业", "外资企业"])],
+    }
+
+
+def test_counts_match_chained_filters(stock_basic, recorder):
+    rules = build_filter_rules(ALL_ENABLED, today=TODAY)
+    mask = evaluate_rules(stock_basic, rules)
+
+    steps = baseline_steps(stock_basic)
+    expected = stock_basic
+    expected_messages = []
+    for rule in rules:
+        before = len(expected)
+        expected = steps[rule.name](expected)
+        expected_messages.append(f"{rule.description}：剔除 {before - len(expected)} 条，剩余 {len(expected)} 条")
+
+    assert stock_basic[mask]["ts_code"].tolist() == expected["ts_code"].tolist()
+    assert recorder.messages == expected_messages
+
+
+def test_repo_config_matches_baseline_filter1(stock_basic):
+    filter_config = {**ALL_ENABLED, "filter_conditions": [
+        {"name": "exclude_recent_listings", "enabled": False},
+        {"name": "market_type_mainboard", "enabled": False},
+        {"name": "exclude_private_foreign", "enabled": False},
+    ]}
+    mask = evaluate_rules(stock_basic, build_filter_rules(filter_config, today=TODAY), report=False)
+    expected = stock_basic[~stock_basic["name"].str.contains("ST")]
+    expected = expected[~expected["ts_code"].str[0].isin(["4", "8", "9"])]
+    assert stock_basic[mask]["ts_code"].tolist() == expected["ts_code"].tolist()
+
+
+def test_selection_rules_match_pandas_masks():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({"roe": rng.normal(5, 4, 500), "q_netprofit_yoy": rng.normal(5, 30, 500),
+                       "debt_to_assets": rng.random(500) * 100})
+    df.loc[::17, "roe"] = np.nan
+    thresholds = {"roe": 5, "q_netprofit_yoy": 10, "debt_to_assets": 70}
+    mask = evaluate_rules(df, build_selection_rules("fina_indicator", thresholds), report=False)
+    expected = (df["roe"] >= 5) & (df["q_netprofit_yoy"] > 10) & (df["debt_to_assets"] < 70)
+    assert mask.tolist() == expected.tolist()
+
+
+def test_no_rules_and_empty_frame(stock_basic):
+    assert evaluate_rules(stock_basic, []).all()
+    assert len(evaluate_rules(stock_basic.iloc[0:0], build_filter_rules(ALL_ENABLED, today=TODAY))) == 0
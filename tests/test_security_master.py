@@ -0,0 +1,106 @@
+# filename: test_security_master.py
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from security_master import SID_COLUMN, SecurityMaster, SymbolSet, attach_ids, get_security_master, merge_on_sid, \
+    symbol_set
+
+CODES = [f"{i:06d}.SZ" for i in range(1, 31)]
+
+
+@pytest.fixture
+def frames(workdir):
+    rng = np.random.default_rng(0)
+    get_security_master().ids(CODES)
+    left = pd.DataFrame({
+        "ts_code": rng.permutation(CODES[:20]),
+        "name": [f"股票{i}" for i in range(20)],
+        "list_date": rng.integers(20000101, 20240101, 20),
+        "close": rng.random(20),
+    })
+    # 右表缺少左表部分股票，并有左表没有的股票
+    right_codes = rng.permutation(CODES[5:25])
+    right = pd.DataFrame({
+        "ts_code": right_codes,
+        "trade_date": "20250321",
+        "close": rng.random(20),
+        "vol": rng.integers(1000, 100000, 20),
+        "industry": rng.choice(["银行", "白酒"], 20),
+    })
+    return left, right
+
+
+def expected_merge(left, right, how, suffixes=("_x", "_y")):
+    left, right = attach_ids(left), attach_ids(right)
+    return pd.merge(left, right.drop(columns=SID_COLUMN), on="ts_code", how=how, suffixes=suffixes)
+
+
+@pytest.mark.parametrize("how", ["left", "inner"])
+def test_merge_on_sid_matches_pd_merge(frames, how):
+    left, right = frames
+    result = merge_on_sid(left, right, how=how, suffixes=("", "_r"))
+    expected = expected_merge(left, right, how, suffixes=("", "_r"))
+    pd.testing.assert_frame_equal(result, expected)
+    assert result.columns.tolist() == expected.columns.tolist()
+    assert result[SID_COLUMN].is_monotonic_increasing
+
+
+def test_left_join_fills_missing_with_nan(frames):
+    left, right = frames
+    result = merge_on_sid(left, right, how="left")
+    missing = ~result["ts_code"].isin(right["ts_code"])
+    assert missing.sum() == 5
+    assert result.loc[missing, ["close_y", "vol", "industry", "trade_date"]].isna().all().all()
+    # 整数列含缺失值时与 pd.merge 一样提升为浮点数
+    assert result["vol"].dtype == expected_merge(left, right, "left")["vol"].dtype
+
+
+def test_duplicate_right_sids_fall_back_to_merge(frames):
+    left, right = frames
+    right = pd.concat([right, right.iloc[:3].assign(trade_date="20250320")], ignore_index=True)
+    for how in ("left", "inner"):
+        result = merge_on_sid(left, right, how=how)
+        expected = expected_merge(left, right, how)
+        assert len(result) == len(expected)
+        pd.testing.assert_frame_equal(result.reset_index(drop=True), expected.reset_index(drop=True))
+    with pytest.raises(ValueError):
+        merge_on_sid(left, right, how="outer")
+
+
+def test_security_master_ids_are_stable(workdir):
+    master = get_security_master()
+    sids = master.ids(CODES[:10])
+    assert sids.tolist() == list(range(10))
+    # 其他进程（新实例）读取同一文件，已有 ID 不变，新代码追加
+    other = SecurityMaster()
+    assert other.ids(["NEW.SH"] + CODES[:3]).tolist() == [10, 0, 1, 2]
+    # 分配前先读入其他进程追加的记录，不会重复分配
+    assert master.ids(["NEW.SH", "NEXT.SH"]).tolist() == [10, 11]
+    assert master.ids(["NONE.SH"], register=False).tolist() == [-1]
+    assert other.codes([2, 10, 11]).tolist() == [CODES[2], "NEW.SH", "NEXT.SH"]
+
+
+def test_symbol_set_operations_match_python_sets(workdir):
+    rng = np.random.default_rng(1)
+    universe = np.arange(200)
+    for _ in range(20):
+        a = set(rng.choice(universe, rng.integers(0, 80), replace=False).tolist())
+        b = set(rng.choice(universe[:rng.integers(1, 200)], rng.integers(0, 40)).tolist())
+        set_a, set_b = SymbolSet.from_ids(sorted(a)), SymbolSet.from_ids(sorted(b))
+        assert set((set_a & set_b).ids().tolist()) == a & b
+        assert set((set_a | set_b).ids().tolist()) == a | b
+        assert set((set_a - set_b).ids().tolist()) == a - b
+        assert set((set_b - set_a).ids().tolist()) == b - a
+        assert len(set_a) == len(a) and bool(set_a) == bool(a)
+        probe = np.array([-1, 0, 5, 199, 250])
+        assert set_a.contains(probe).tolist() == [int(sid) in a for sid in probe]
+
+
+def test_symbol_set_from_frames(frames):
+    left, right = frames
+    left_codes, right_codes = set(left["ts_code"]), set(right["ts_code"])
+    # 有 sid 列时直接使用，否则按 ts_code 查找
+    assert sorted((symbol_set(attach_ids(left)) & symbol_set(right)).codes()) == sorted(left_codes & right_codes)
+    assert sorted((symbol_set(left) - symbol_set(right)).codes()) == sorted(left_codes - right_codes)
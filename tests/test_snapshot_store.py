@@ -0,0 +1,83 @@
+# filename: test_snapshot_store.py
+
+import io
+
+import pandas as pd
+import pytest
+
+from snapshot_store import KIND_BASE, KIND_DIFF, KIND_SAME, SnapshotStore
+
+
+def make_basic(n=20):
+    return pd.DataFrame({
+        "ts_code": [f"{i:06d}.SZ" for i in range(1, n + 1)],
+        "name": [f"股票{i}" for i in range(1, n + 1)],
+        "list_date": [20100101 + i for i in range(1, n + 1)],
+        "pe": [None if i % 5 == 0 else i * 1.5 for i in range(1, n + 1)],
+    })
+
+
+@pytest.fixture
+def store(workdir):
+    return SnapshotStore("stock_basic", rebase_ratio=0.5)
+
+
+def assert_same(loaded, expected):
+    """与保存为 CSV 后再读取的结果比较"""
+    expected = pd.read_csv(io.StringIO(expected.to_csv(index=False)))
+    pd.testing.assert_frame_equal(loaded.sort_values("ts_code").reset_index(drop=True),
+                                  expected.sort_values("ts_code").reset_index(drop=True), check_dtype=False)
+
+
+def test_base_diff_same_round_trip(store):
+    day1 = make_basic()
+    day2 = day1.copy()
+    day2.loc[1, "name"] = "ST股票2"  # 更名
+    day2 = pd.concat([day2.iloc[1:], make_basic(21).iloc[[-1]]], ignore_index=True)  # 退市一只、新上市一只
+
+    assert store.save("20250317", day1) == KIND_BASE
+    assert store.save("20250318", day2) == KIND_DIFF
+    diff = pd.read_csv(store._path(KIND_DIFF, "20250318"))
+    assert sorted(diff["_op"]) == ["add", "delete", "update"]
+    assert store.save("20250319", day2) == KIND_SAME
+    assert store.dates == ["20250317", "20250318", "20250319"]
+
+    # 新建实例从文件还原，不依赖进程内缓存
+    reopened = SnapshotStore("stock_basic")
+    assert_same(reopened.load("20250317"), day1)
+    assert_same(reopened.load("20250318"), day2)
+    assert_same(reopened.load("20250319"), day2)
+    assert_same(reopened.load("20250320"), day2)  # 未记录的日期使用最近的快照
+    assert reopened.load("20250316") is None
+
+
+def test_large_diff_saves_base(store):
+    day1 = make_basic()
+    day2 = day1.assign(name=day1["name"] + "A")
+    store.save("20250317", day1)
+    assert store.save("20250318", day2) == KIND_BASE
+    assert_same(store.load("20250318"), day2)
+
+
+def test_save_out_of_order_and_seed(store):
+    day1 = make_basic()
+    store.save("20250318", day1)
+    with pytest.raises(ValueError):
+        store.save("20250317", day1)
+
+    earlier = make_basic(10)
+    assert store.seed("20250310", earlier) == KIND_BASE
+    with pytest.raises(ValueError):
+        store.seed("20250320", earlier)
+    assert_same(store.load("20250310"), earlier)
+    assert_same(store.load("20250318"), day1)
+
+
+def test_changed_compares_probe_columns(store):
+    day1 = make_basic()
+    columns = ["ts_code", "name"]
+    assert store.changed(day1[columns], columns)
+    store.save("20250317", day1)
+    assert not store.changed(day1[columns], columns)
+    assert store.changed(day1.iloc[1:][columns], columns)
+    assert store.changed(day1.assign(name="ST")[columns], columns)
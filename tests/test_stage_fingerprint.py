@@ -0,0 +1,104 @@
+# filename: test_stage_fingerprint.py
+
+import importlib
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+from data_cache import dc
+from stage_fingerprint import StageFingerprint, remove_stage_output
+from stock_utils import fetch_daily, get_quarter_end_dates
+from tushare_stub import make_sample_market
+
+TRADE_DATE = "20250321"
+WEEK = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+@pytest.fixture
+def stage_module(workdir, monkeypatch):
+    """临时目录中的阶段代码模块，用于验证代码修改后指纹变化"""
+    monkeypatch.syspath_prepend(str(workdir))
+    with open("fp_stage_code.py", "w", encoding="utf-8") as f:
+        f.write("def screen(df):\n    return df\n")
+    module = importlib.import_module("fp_stage_code")
+    yield module
+    sys.modules.pop("fp_stage_code", None)
+
+
+def make_fingerprint(module, threshold=4):
+    return StageFingerprint("filter_test", "output.csv").add_file("input", "input.csv") \
+        .add_config("threshold", {"roe": threshold}).add_code(module.screen)
+
+
+def write(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def test_is_fresh_tracks_inputs_config_and_code(stage_module):
+    write("input.csv", "ts_code\nA\n")
+    assert not make_fingerprint(stage_module).is_fresh()  # 尚无输出
+    write("output.csv", "ts_code\nA\n")
+    assert not make_fingerprint(stage_module).is_fresh()  # 尚无指纹记录
+    make_fingerprint(stage_module).save()
+    assert make_fingerprint(stage_module).is_fresh()
+
+    # 配置变化
+    assert not make_fingerprint(stage_module, threshold=6).is_fresh()
+
+    # 代码变化
+    write("fp_stage_code.py", "def screen(df):\n    return df.head()\n")
+    assert not make_fingerprint(stage_module).is_fresh()
+    make_fingerprint(stage_module).save()
+    assert make_fingerprint(stage_module).is_fresh()
+
+    # 输入变化
+    write("input.csv", "ts_code\nA\nB\n")
+    assert not make_fingerprint(stage_module).is_fresh()
+
+    remove_stage_output("output.csv")
+    assert not os.path.exists("output.csv") and not os.path.exists("output.csv.fp.json")
+
+
+def test_add_input_prefers_file_digest(workdir):
+    df = pd.DataFrame({"ts_code": ["A"], "trade_date": ["20250321"]})
+    from_frame = StageFingerprint("s", "out.csv").add_input("daily", "daily.csv", df).components["data:daily"]
+    df.to_csv("daily.csv", index=False)
+    # 读取 CSV 后类型可能变化，有文件时以文件内容为准
+    with_file = StageFingerprint("s", "out.csv").add_input("daily", "daily.csv", pd.read_csv("daily.csv"))
+    assert "file:daily" in with_file.components and "data:daily" not in with_file.components
+    assert from_frame != with_file.components["file:daily"]
+    with pytest.raises(FileNotFoundError):
+        StageFingerprint("s", "out.csv").add_file("missing", "missing.csv")
+
+
+def test_only_changed_stage_is_recomputed(fake_pro, monkeypatch):
+    import tushare_test4
+
+    for api_name, df in make_sample_market(n_stocks=400).items():
+        fake_pro.register(api_name, df)
+    for trade_date in WEEK:
+        fetch_daily(trade_date)
+
+    quarter = get_quarter_end_dates(dc.period_year)[dc.period_quarter]
+    outputs = {name: os.path.join(dc.filter_dir, f"tushare_stock_basic_{name}.csv")
+               for name in (f"filter1_{TRADE_DATE}", f"filter2_{TRADE_DATE}", f"filter3_{TRADE_DATE}_{quarter}",
+                            f"filter4_{TRADE_DATE}")}
+
+    def mtimes():
+        return {name: os.stat(path).st_mtime_ns for name, path in outputs.items()}
+
+    assert tushare_test4.filter_stocks_by_weekly(TRADE_DATE)
+    first = mtimes()
+    assert tushare_test4.filter_stocks_by_weekly(TRADE_DATE)
+    assert mtimes() == first
+
+    # 只修改排名参数时 filter1 ~ filter3 直接复用（修改时间变化而内容不变的文件不算变化）
+    monkeypatch.setattr(dc, "top_volume", dc.top_volume - 3)
+    for path in outputs.values():
+        os.utime(path, ns=(0, 0))
+    assert tushare_test4.filter_stocks_by_weekly(TRADE_DATE)
+    changed = {name for name, mtime in mtimes().items() if mtime != 0}
+    assert changed == {f"filter4_{TRADE_DATE}"}
@@ -0,0 +1,107 @@
+# filename: test_token_pool.py
+
+import datetime
+
+import pytest
+
+from token_pool import NoTokenAvailable, QuotaTracker, TokenPool, TokenSlot
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+        self.day = datetime.date(2025, 3, 21)
+
+    def __call__(self):
+        return self.now
+
+    def today(self):
+        return self.day
+
+
+def test_minute_window_slides():
+    clock = FakeClock()
+    tracker = QuotaTracker(per_minute=2, clock=clock, today=clock.today)
+    tracker.acquire()
+    clock.now = 10
+    tracker.acquire()
+    assert tracker.remaining() == 0
+    assert tracker.wait_time() == pytest.approx(50)
+    clock.now = 60
+    assert tracker.remaining() == 1
+
+
+def test_exhaust_minute_blocks_for_sixty_seconds():
+    clock = FakeClock()
+    tracker = QuotaTracker(per_minute=100, clock=clock, today=clock.today)
+    tracker.exhaust()
+    assert tracker.remaining() == 0
+    assert tracker.wait_time() == pytest.approx(60)
+    clock.now = 60
+    assert tracker.remaining() == 100
+
+
+def test_exhaust_day_recovers_next_day_without_changing_per_day():
+    clock = FakeClock()
+    tracker = QuotaTracker(per_minute=10, clock=clock, today=clock.today)
+    tracker.acquire()
+    tracker.exhaust(day=True)
+    assert tracker.remaining() == 0
+    assert tracker.wait_time() is None
+    assert tracker.per_day is None
+
+    clock.day += datetime.timedelta(days=1)
+    clock.now = 120
+    assert tracker.remaining() == 10
+    assert tracker.wait_time() == 0
+
+
+def test_per_day_limit():
+    clock = FakeClock()
+    tracker = QuotaTracker(per_day=2, clock=clock, today=clock.today)
+    tracker.acquire()
+    tracker.acquire()
+    assert tracker.remaining() == 0
+    assert tracker.wait_time() is None
+    clock.day += datetime.timedelta(days=1)
+    assert tracker.remaining() == 2
+
+
+def test_pool_fails_over_on_rate_limit(fake_pro):
+    clock = FakeClock()
+    limited = fake_pro.for_token("t1", per_minute=1, clock=clock)
+    normal = fake_pro.for_token("t2", clock=clock)
+    pool = TokenPool([
+        TokenSlot("limited", "t1", limited, points=120, per_minute=100, clock=clock),
+        TokenSlot("normal", "t2", normal, points=120, per_minute=100, clock=clock),
+    ], sleep=lambda seconds: None)
+
+    for _ in range(4):
+        assert len(pool.daily(trade_date="20250321")) == 40
+    # limited 实际每分钟只能访问 1 次，被限流后不再分配，其余请求都由 normal 完成
+    assert limited.calls["daily"] == 1
+    assert normal.calls["daily"] == 3
+    assert pool.stats()["limited"]["rate_limited"] == limited.rejected["daily"] <= 1
+
+
+def test_pool_fails_over_on_permission(fake_pro):
+    basic = fake_pro.for_token("t1", apis=["daily"])
+    vip = fake_pro.for_token("t2")
+    pool = TokenPool([
+        TokenSlot("basic", "t1", basic, points=5000),
+        TokenSlot("vip", "t2", vip, points=5000),
+    ])
+
+    for _ in range(3):
+        assert len(pool.fina_indicator_vip(period="20240930")) == 40
+    # 提示无权限后记录下来，不再分配给 basic
+    assert basic.rejected["fina_indicator_vip"] <= 1
+    assert vip.calls["fina_indicator_vip"] == 3
+    if basic.rejected["fina_indicator_vip"]:
+        assert pool.stats()["basic"]["denied"] == ["fina_indicator_vip"]
+
+
+def test_pool_respects_points():
+    pool = TokenPool([TokenSlot("basic", "t", client=None, points=120)])
+    with pytest.raises(NoTokenAvailable, match="权限"):
+        pool.query("fina_indicator_vip", period="20240930")
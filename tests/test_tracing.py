@@ -0,0 +1,100 @@
+# filename: test_tracing.py
+
+import cProfile
+import pstats
+import threading
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import tracing
+from tracing import format_span_tree, pstats_to_collapsed, span, traced
+
+
+@pytest.fixture
+def trace(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_ENABLED", True)
+    monkeypatch.setattr(tracing, "TRACE_MEMORY", True)
+    monkeypatch.setattr(tracing._local, "stack", [], raising=False)
+    was_tracing = tracemalloc.is_tracing()
+    yield
+    # span 会启动 tracemalloc，用例结束后停止，避免拖慢后续用例
+    if not was_tracing:
+        tracemalloc.stop()
+
+
+def test_disabled_span_records_nothing(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_ENABLED", False)
+    with span("load") as current:
+        assert current is None
+
+
+def test_nested_spans_form_tree(trace):
+    @traced("filter")
+    def run_filter():
+        with span("merge"):
+            pass
+
+    with span("stage", trade_date="20250321") as root:
+        with span("load", source="daily"):
+            pass
+        run_filter()
+
+    assert [child.name for child in root.children] == ["load", "filter"]
+    assert root.children[0].attrs == {"source": "daily"}
+    assert [child.name for child in root.children[1].children] == ["merge"]
+    assert root.wall >= root.children[1].wall >= 0
+    assert tracing._stack() == []
+
+    lines = format_span_tree(root).splitlines()
+    assert lines[0].startswith("stage (trade_date=20250321)")
+    assert lines[1].startswith("├─ load (source=daily)")
+    assert lines[2].startswith("└─ filter")
+    assert lines[3].startswith("   └─ merge")
+
+
+def test_peak_memory_is_attributed_to_enclosing_spans(trace):
+    with span("stage") as root:
+        with span("small"):
+            np.ones(1000)
+        with span("large") as large:
+            data = np.ones(4 * 1024 * 1024)  # 32 MB
+            del data
+    assert large.peak >= 32 * 1024 * 1024
+    assert root.peak >= large.peak
+    assert root.children[0].peak < 1024 * 1024
+
+
+def test_threads_have_separate_stacks(trace):
+    roots = {}
+
+    def worker(name):
+        with span(name) as current:
+            roots[name] = current
+
+    with span("main") as root:
+        thread = threading.Thread(target=worker, args=("worker",))
+        thread.start()
+        thread.join()
+    assert root.children == []
+    assert roots["worker"].children == []
+
+
+def test_pstats_to_collapsed_keeps_call_paths():
+    def leaf():
+        return sum(i * i for i in range(200000))
+
+    def parent():
+        return leaf()
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    parent()
+    profiler.disable()
+
+    lines = pstats_to_collapsed(pstats.Stats(profiler))
+    stacks = [line.rsplit(" ", 1)[0].split(";") for line in lines]
+    assert any("test_tracing.py:parent" in stack and stack[-1] in ("test_tracing.py:leaf", "test_tracing.py:<genexpr>")
+               for stack in stacks)
+    assert all(int(line.rsplit(" ", 1)[1]) > 0 for line in lines)
@@ -0,0 +1,91 @@
+# filename: test_transport.py
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+import requests
+
+from tushare_stub import FakeProApi, FakeTushareServer, make_sample_market
+from tushare_transport import PooledProApi, create_pro_api
+
+DATES = ["20250317", "20250318", "20250319", "20250320", "20250321"]
+
+
+@pytest.fixture
+def fake():
+    return FakeProApi(make_sample_market(n_stocks=40))
+
+
+def test_query_matches_pro_api(fake):
+    with FakeTushareServer(fake) as server:
+        api = PooledProApi("stub-token", url=server.url)
+        df = api.daily(trade_date="20250321", fields="ts_code,trade_date,close,vol")
+        expected = fake.daily(trade_date="20250321", fields="ts_code,trade_date,close,vol")
+        pd.testing.assert_frame_equal(df, expected, check_dtype=False)
+        # 响应以 gzip 传输
+        assert all(gzipped for _, gzipped in server.responses)
+        api.close()
+
+
+def test_connections_are_reused_and_bounded(fake):
+    with FakeTushareServer(fake, latency=0.02) as server:
+        api = PooledProApi("stub-token", url=server.url, max_concurrency=2)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            frames = list(executor.map(lambda d: api.query("daily", trade_date=d), DATES * 4))
+        assert [len(df) for df in frames] == [40] * 20
+        assert server.connections <= 2
+        stats = api.stats()
+        assert stats["requests"] == 20 and stats["errors"] == 0
+        assert stats["wait_seconds"] > 0  # 超过并发上限的请求排队等待
+
+        connections = server.connections
+        for trade_date in DATES:
+            api.daily(trade_date=trade_date)
+        assert server.connections == connections
+        api.close()
+
+
+def test_api_error_raises_message(fake):
+    with FakeTushareServer(fake) as server:
+        api = PooledProApi("stub-token", url=server.url)
+        with pytest.raises(Exception, match="没有接口"):
+            api.weekly(trade_date="20250321")
+        api.close()
+
+
+class _UnavailableHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(503)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_http_error_status_raises():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _UnavailableHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address[:2]
+        api = PooledProApi("stub-token", url=f"http://{host}:{port}/dataapi")
+        with pytest.raises(requests.HTTPError) as excinfo:
+            api.daily(trade_date="20250321")
+        assert excinfo.value.response.status_code == 503
+        api.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_create_pro_api_options():
+    api = create_pro_api("stub-token", {"transport": "pooled", "max_concurrency": 3, "read_timeout": 10})
+    assert isinstance(api, PooledProApi)
+    assert api.max_concurrency == 3 and api.timeout == (5, 10)
+    with pytest.raises(ValueError):
+        create_pro_api("stub-token", {"transport": "grpc"})
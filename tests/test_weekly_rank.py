@@ -0,0 +1,55 @@
+# filename: test_weekly_rank.py
+
+import pandas as pd
+
+from weekly_rank import rank_weekly_panel, format_rank_labels
+
+
+def make_panel():
+    return pd.DataFrame({
+        "ts_code": ["A", "B", "C", "D", "A", "B", "C", "D"],
+        "trade_date": ["20250314"] * 4 + ["20250321"] * 4,
+        "industry": ["银行", "银行", "白酒", "白酒"] * 2,
+        "amount": [400, 300, 300, 100, 10, 40, 30, 20],
+        "pct_chg": [1.0, -2.0, 5.0, 3.0, 0.5, 0.1, None, 2.0],
+    })
+
+
+def ranks_of(result, rank_type, week):
+    rows = result[(result["rank_type"] == rank_type) & (result["week"] == week)]
+    return dict(zip(rows["ts_code"], rows["rank"]))
+
+
+def test_top_n_per_week_with_min_rank_for_ties():
+    result = rank_weekly_panel(make_panel(), top_n={"amount": 3, "pct_chg": 2})
+    # B、C 并列第 2，keep='first' 只保留前 3 行
+    assert ranks_of(result, "amount", "20250314") == {"A": 1, "B": 2, "C": 2}
+    assert ranks_of(result, "amount", "20250321") == {"B": 1, "C": 2, "D": 3}
+    assert ranks_of(result, "pct_chg", "20250314") == {"C": 1, "D": 2}
+    # 缺失值不参与排名
+    assert ranks_of(result, "pct_chg", "20250321") == {"D": 1, "A": 2}
+    assert list(result.columns) == ["week", "ts_code", "rank_type", "rank"]
+
+
+def test_keep_all_returns_ties_on_the_boundary():
+    result = rank_weekly_panel(make_panel(), top_n={"amount": 2}, keep="all")
+    assert ranks_of(result, "amount", "20250314") == {"A": 1, "B": 2, "C": 2}
+
+
+def test_rank_within_industry():
+    result = rank_weekly_panel(make_panel(), top_n={"amount": 1}, by_industry=True)
+    week = result[result["week"] == "20250314"]
+    assert dict(zip(week["industry"], week["ts_code"])) == {"银行": "A", "白酒": "C"}
+    assert (result["rank"] == 1).all()
+
+
+def test_empty_panel():
+    panel = pd.DataFrame(columns=["ts_code", "trade_date", "amount", "pct_chg"])
+    result = rank_weekly_panel(panel, top_n={"amount": 3, "pct_chg": 3})
+    assert result.empty
+    assert list(result.columns) == ["week", "ts_code", "rank_type", "rank"]
+
+
+def test_format_rank_labels():
+    ranks = pd.DataFrame({"rank_type": ["amount", "pct_chg", "other"], "rank": [1, 2, 3]})
+    assert format_rank_labels(ranks).tolist() == ["周成交额排名 1", "周涨幅排名 2", "other 3"]
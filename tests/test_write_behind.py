@@ -0,0 +1,71 @@
+# filename: test_write_behind.py
+
+import os
+
+import pandas as pd
+import pytest
+
+from write_behind import WriteBehindQueue
+
+
+@pytest.fixture
+def queue():
+    write_queue = WriteBehindQueue(batch_size=4, flush_interval=0.05)
+    yield write_queue
+    write_queue.close()
+
+
+def test_read_before_write_and_flush(tmp_path, queue):
+    path = str(tmp_path / "a.csv")
+    df = pd.DataFrame({"ts_code": ["A", "B"], "close": [1.5, 2.5]})
+    queue.submit(path, df, index=False)
+    assert queue.exists(path)
+    pd.testing.assert_frame_equal(queue.read_csv(path), df)
+
+    assert queue.flush(path, timeout=5)
+    assert queue.pending(path) is None
+    pd.testing.assert_frame_equal(pd.read_csv(path), df)
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def test_pending_read_matches_disk_types(tmp_path, queue):
+    path = str(tmp_path / "a.csv")
+    # 接口返回的日期为字符串，写入 CSV 后读取时推断为整数；缺失值同样按 CSV 读取的结果
+    df = pd.DataFrame({"ts_code": ["000001.SZ", "600000.SH"], "trade_date": ["20250321", "20250321"],
+                       "vol": [100, None], "name": ["平安银行", None]})
+    queue.submit(path, df, index=False, encoding="utf-8-sig")
+    before = queue.read_csv(path)
+    typed = queue.read_csv(path, dtype={"trade_date": str})
+    queue.flush()
+    pd.testing.assert_frame_equal(before, pd.read_csv(path))
+    pd.testing.assert_frame_equal(typed, pd.read_csv(path, dtype={"trade_date": str}))
+    assert before["trade_date"].dtype == "int64"
+
+
+def test_latest_submission_wins(tmp_path, queue):
+    path = str(tmp_path / "a.csv")
+    for i in range(5):
+        queue.submit(path, pd.DataFrame({"v": [i]}), index=False)
+    queue.flush()
+    assert pd.read_csv(path)["v"].tolist() == [4]
+    stats = queue.stats()
+    assert stats["submitted"] == 5
+    assert stats["pending"] == 0
+    assert stats["written"] + stats["coalesced"] >= 5
+
+
+def test_usecols_on_pending_frame(tmp_path, queue):
+    path = str(tmp_path / "a.csv")
+    queue.submit(path, pd.DataFrame({"a": [1], "b": [2]}), index=False)
+    assert queue.read_csv(path, usecols=["b"]).columns.tolist() == ["b"]
+
+
+def test_close_writes_everything(tmp_path):
+    write_queue = WriteBehindQueue(batch_size=2, flush_interval=10)
+    paths = [str(tmp_path / f"{i}.csv") for i in range(5)]
+    for i, path in enumerate(paths):
+        write_queue.submit(path, pd.DataFrame({"v": [i]}), index=False)
+    write_queue.close()
+    assert [pd.read_csv(path)["v"].iloc[0] for path in paths] == list(range(5))
+    with pytest.raises(RuntimeError):
+        write_queue.submit(paths[0], pd.DataFrame({"v": [0]}))
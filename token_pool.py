@@ -0,0 +1,288 @@
+# filename: token_pool.py
+
+import collections
+import datetime
+import functools
+import threading
+import time
+
+_logger = None
+
+
+def _get_logger():
+    # dc 初始化时即创建 token 池，日志在首次使用时再初始化
+    global _logger
+    if _logger is None:
+        from stock_utils import setup_logger
+        _logger = setup_logger("token_pool")
+    return _logger
+
+
+# 接口所需积分（未列出的接口视为基础接口，任何 token 都可调用），可在 config.yaml 的 tushare.api_points 中覆盖
+API_POINTS = {
+    "fina_indicator_vip": 5000,
+    "income_vip": 5000,
+    "balancesheet_vip": 5000,
+    "cashflow_vip": 5000,
+    "stk_factor_pro": 5000,
+}
+
+# Tushare 返回的频率限制提示，例如“抱歉，您每分钟最多访问该接口500次”（提示中同样带有“权限”二字，需先判断）
+MINUTE_LIMIT_MESSAGES = ("每分钟", "每小时", "频率")
+DAY_LIMIT_MESSAGES = ("每天", "每日", "今日")
+PERMISSION_MESSAGES = ("没有接口", "权限", "积分")
+
+MINUTE = 60.0
+
+
+class NoTokenAvailable(Exception):
+    """没有可调用该接口的 token（消息带“权限”或“每分钟”，容错层据此判断是否重试）"""
+
+
+class QuotaTracker(object):
+    """
+    单个 token 单个接口的访问配额：最近 60 秒的请求数及当天请求数
+
+    收到频率限制提示时调用 exhaust()，在配额恢复前不再分配请求。
+    """
+
+    def __init__(self, per_minute=None, per_day=None, clock=time.monotonic, today=datetime.date.today):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.clock = clock
+        self.today = today
+        self._window = collections.deque()
+        self._day = None
+        self._day_count = 0
+        self._day_blocked = None  # 收到每天限制提示的日期，换日后恢复
+        self._blocked_until = 0.0
+
+    def _trim(self, now):
+        while self._window and self._window[0] <= now - MINUTE:
+            self._window.popleft()
+        if self._day != self.today():
+            self._day = self.today()
+            self._day_count = 0
+            self._day_blocked = None
+
+    def remaining(self):
+        """当前还能发出的请求数，不限时为 float('inf')"""
+        now = self.clock()
+        self._trim(now)
+        if now < self._blocked_until or self._day_blocked is not None:
+            return 0
+        minute_left = float("inf") if self.per_minute is None else self.per_minute - len(self._window)
+        day_left = float("inf") if self.per_day is None else self.per_day - self._day_count
+        return max(min(minute_left, day_left), 0)
+
+    def wait_time(self):
+        """距离下一个可用配额的秒数（当天额度已用完时为 None）"""
+        now = self.clock()
+        self._trim(now)
+        if self._day_blocked is not None or (self.per_day is not None and self._day_count >= self.per_day):
+            return None
+        wait = max(self._blocked_until - now, 0)
+        if self.per_minute is not None and len(self._window) >= self.per_minute:
+            wait = max(wait, self._window[len(self._window) - self.per_minute] + MINUTE - now)
+        return wait
+
+    def acquire(self):
+        now = self.clock()
+        self._trim(now)
+        self._window.append(now)
+        self._day_count += 1
+
+    def exhaust(self, day=False):
+        """接口返回频率限制：每分钟限制时 60 秒内不再分配，每天限制时当天不再分配（不修改配置的 per_day）"""
+        now = self.clock()
+        self._trim(now)
+        if day:
+            self._day_blocked = self._day
+        else:
+            self._blocked_until = now + MINUTE
+
+
+class TokenSlot(object):
+    """token 池中的一个账号：客户端、积分及各接口的配额"""
+
+    def __init__(self, name, token, client, points=0, per_minute=None, per_day=None, api_limits=None, apis=None,
+                 clock=time.monotonic):
+        self.name = name
+        self.token = token
+        self.client = client
+        self.points = points
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.api_limits = dict(api_limits or {})  # 接口 -> 每分钟上限，覆盖 per_minute
+        self.apis = set(apis) if apis else None  # 显式允许的接口，为空时按积分判断
+        self.denied = set()  # 调用时提示无权限的接口
+        self.clock = clock
+        self.trackers = {}
+        self.counters = collections.Counter()
+
+    def allows(self, api_name, api_points):
+        if api_name in self.denied:
+            return False
+        if self.apis is not None and api_name in self.apis:
+            return True
+        return self.points >= api_points.get(api_name, 0)
+
+    def tracker(self, api_name):
+        if api_name not in self.trackers:
+            self.trackers[api_name] = QuotaTracker(self.api_limits.get(api_name, self.per_minute), self.per_day,
+                                                   clock=self.clock)
+        return self.trackers[api_name]
+
+
+class TokenPool(object):
+    """
+    多个 Tushare 账号组成的客户端池，接口与 ts.pro_api() 返回的对象一致（pro.daily(...) / pro.query(...)）
+
+    - 只在有权限的 token 之间分配（按积分或显式的 apis 列表判断）
+    - 优先使用该接口剩余配额最多的 token，配额相同时轮流使用
+    - 某个 token 返回频率限制或无权限时记录下来，立即换下一个 token 重发
+    - 所有 token 配额都用完时等待最早恢复的一个，最多等待 max_wait 秒
+    """
+
+    def __init__(self, slots, api_points=None, max_wait=30.0, sleep=time.sleep):
+        """
+        :param slots: TokenSlot 列表
+        :param api_points: 接口 -> 所需积分，默认为 API_POINTS
+        :param max_wait: 全部 token 配额用完时最多等待的秒数
+        """
+        if not slots:
+            raise ValueError("token 池至少需要一个 token")
+        self.slots = list(slots)
+        self.api_points = dict(API_POINTS if api_points is None else api_points)
+        self.max_wait = max_wait
+        self.sleep = sleep
+        self._turn = 0
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.query, name)
+
+    def _acquire(self, api_name, excluded):
+        """
+        选择剩余配额最多的 token 并占用一次配额
+
+        :return: (TokenSlot, None) 或 (None, 需等待的秒数)；没有有权限的 token 时抛出 NoTokenAvailable
+        """
+        with self._lock:
+            candidates = [slot for slot in self.slots
+                          if slot.name not in excluded and slot.allows(api_name, self.api_points)]
+            if not candidates:
+                if any(slot.allows(api_name, self.api_points) for slot in self.slots):
+                    raise NoTokenAvailable(f"所有 token 均已达到接口 {api_name} 的每分钟访问上限")
+                raise NoTokenAvailable(f"没有 token 有接口({api_name})访问权限")
+
+            self._turn += 1
+            best = max(candidates, key=lambda slot: (slot.tracker(api_name).remaining(),
+                                                     -((self.slots.index(slot) - self._turn) % len(self.slots))))
+            if best.tracker(api_name).remaining() > 0:
+                best.tracker(api_name).acquire()
+                best.counters[api_name] += 1
+                return best, None
+
+            waits = [slot.tracker(api_name).wait_time() for slot in candidates]
+            waits = [wait for wait in waits if wait is not None]
+            if not waits:
+                raise NoTokenAvailable(f"所有 token 当天接口 {api_name} 的访问次数已用完（每天最多访问）")
+            return None, min(waits)
+
+    def query(self, api_name, fields="", **kwargs):
+        excluded = set()
+        waited = 0.0
+        while True:
+            slot, wait = self._acquire(api_name, excluded)
+            if slot is None:
+                if waited + wait > self.max_wait:
+                    raise NoTokenAvailable(f"所有 token 接口 {api_name} 的每分钟配额已用完，需等待 {wait:.1f}s")
+                _get_logger().info(f"所有 token 接口 {api_name} 的配额已用完，等待 {wait:.1f}s")
+                self.sleep(wait)
+                waited += wait
+                continue
+
+            try:
+                return slot.client.query(api_name, fields=fields, **kwargs)
+            except Exception as e:
+                if not self._fail_over(slot, api_name, e):
+                    raise
+                excluded.add(slot.name)
+
+    def _fail_over(self, slot, api_name, error):
+        """根据错误更新 token 状态；频率限制或无权限时返回 True，换下一个 token 重发"""
+        message = str(error)
+        with self._lock:
+            if any(word in message for word in MINUTE_LIMIT_MESSAGES):
+                slot.tracker(api_name).exhaust()
+                slot.counters["rate_limited"] += 1
+                _get_logger().warning(f"token {slot.name} 接口 {api_name} 达到每分钟访问上限，切换 token")
+                return True
+            if any(word in message for word in DAY_LIMIT_MESSAGES):
+                slot.tracker(api_name).exhaust(day=True)
+                slot.counters["day_limited"] += 1
+                _get_logger().warning(f"token {slot.name} 接口 {api_name} 当天访问次数已用完，切换 token")
+                return True
+            if any(word in message for word in PERMISSION_MESSAGES):
+                slot.denied.add(api_name)
+                _get_logger().warning(f"token {slot.name} 没有接口 {api_name} 的访问权限，切换 token")
+                return True
+        return False
+
+    def stats(self):
+        """各 token 的请求次数（按接口）、频率限制次数及无权限的接口"""
+        with self._lock:
+            return {slot.name: dict(slot.counters, denied=sorted(slot.denied)) for slot in self.slots}
+
+    def close(self):
+        for slot in self.slots:
+            # 客户端的 __getattr__ 会把任意属性当作接口名，只调用类上定义的 close
+            if callable(getattr(type(slot.client), "close", None)):
+                slot.client.close()
+
+
+def create_token_pool(token, tushare_config, client_factory):
+    """
+    按 config.yaml 中 tushare 配置创建客户端
+
+    :param token: 单个 token（tushare.token 或 tushare.token 文件）
+    :param tushare_config: tushare 配置，tokens 为空时只使用 token，直接返回单个客户端
+    :param client_factory: token -> 客户端
+    """
+    tokens = tushare_config.get("tokens") or []
+    if not tokens:
+        return client_factory(token)
+
+    slots = []
+    for i, item in enumerate(tokens):
+        item = dict(item)
+        name = item.pop("name", f"token{i + 1}")
+        slot_token = item.pop("token")
+        slots.append(TokenSlot(name, slot_token, client_factory(slot_token), **item))
+    api_points = dict(API_POINTS, **(tushare_config.get("api_points") or {}))
+    return TokenPool(slots, api_points=api_points, max_wait=tushare_config.get("max_wait", 30.0))
+
+
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    from tushare_stub import FakeProApi, make_sample_market
+
+    # 三个账号：两个基础账号（每分钟 50 次），一个 5000 积分账号（每分钟 100 次，可调用 fina_indicator_vip）；
+    # basic2 实际每分钟只能访问 30 次，用于演示收到频率限制后切换 token
+    fake = FakeProApi(make_sample_market(n_stocks=100))
+    basic_apis = ["daily", "daily_basic", "trade_cal", "stock_basic"]
+    pool = TokenPool([
+        TokenSlot("basic1", "t1", fake.for_token("t1", per_minute=50, apis=basic_apis), points=120, per_minute=50),
+        TokenSlot("basic2", "t2", fake.for_token("t2", per_minute=30, apis=basic_apis), points=120, per_minute=50),
+        TokenSlot("vip", "t3", fake.for_token("t3", per_minute=100), points=5000, per_minute=100),
+    ])
+    trade_dates = sorted(fake.tables["daily"]["trade_date"].astype(str).unique())
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        rows = sum(len(df) for df in executor.map(lambda d: pool.daily(trade_date=d), trade_dates[:40] * 4))
+    _get_logger().info(f"daily：160 次请求，{rows} 行")
+    _get_logger().info(f"fina_indicator_vip：{len(pool.fina_indicator_vip(period='20240930'))} 行")
+    _get_logger().info(pool.stats())
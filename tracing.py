@@ -0,0 +1,314 @@
+# filename: tracing.py
+
+import argparse
+import atexit
+import cProfile
+import collections
+import contextlib
+import functools
+import os
+import pstats
+import runpy
+import sys
+import threading
+import time
+import tracemalloc
+
+from data_cache import dc
+from stock_utils import setup_logger, get_formatted_time
+
+logger = setup_logger()
+
+# 环境变量开关：
+#   STOCK_TRACE=1                   记录各阶段 span 的墙钟时间、CPU 时间及峰值内存，根 span 结束时输出树状报告
+#   STOCK_TRACE=time                只记录时间（tracemalloc 会使 pandas 密集的阶段明显变慢）
+#   STOCK_PROFILE=cprofile|sample   整个运行期间采集 cProfile 或采样调用栈，退出时写入 logs/
+#   STOCK_PROFILE_INTERVAL=0.005    采样间隔（秒）
+TRACE_ENABLED = os.environ.get("STOCK_TRACE", "") not in ("", "0")
+TRACE_MEMORY = TRACE_ENABLED and os.environ.get("STOCK_TRACE", "").lower() != "time"
+PROFILE_MODE = os.environ.get("STOCK_PROFILE", "").lower()
+PROFILE_INTERVAL = float(os.environ.get("STOCK_PROFILE_INTERVAL", "0.005"))
+
+_local = threading.local()
+
+
+class Span(object):
+    """一个阶段的计时记录，children 为嵌套的子阶段"""
+
+    __slots__ = ("name", "attrs", "children", "wall", "cpu", "peak", "_wall0", "_cpu0", "_mem0", "_mem_max")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.children = []
+        self.wall = self.cpu = 0.0
+        self.peak = 0
+        self._wall0 = self._cpu0 = 0.0
+        self._mem0 = self._mem_max = 0
+
+
+def enable_tracing(enabled=True, memory=True):
+    """在代码中开启或关闭 span 记录（等同于设置 STOCK_TRACE），memory=False 时不统计内存"""
+    global TRACE_ENABLED, TRACE_MEMORY
+    TRACE_ENABLED = enabled
+    TRACE_MEMORY = enabled and memory
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _observe_memory(stack):
+    """把当前的 tracemalloc 峰值记入所有未结束的 span，然后重置峰值"""
+    if not tracemalloc.is_tracing():
+        return
+    _, peak = tracemalloc.get_traced_memory()
+    for item in stack:
+        item._mem_max = max(item._mem_max, peak)
+    tracemalloc.reset_peak()
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    记录一个阶段的墙钟时间、CPU 时间及峰值内存（相对进入时的增量）
+
+    未开启 STOCK_TRACE 时不做任何记录。多线程同时运行的 span 共享进程级的内存峰值，结果为近似值。
+
+    :param name: 阶段名称，例如 'load' / 'merge' / 'filter' / 'write'
+    :param attrs: 附加信息，例如 trade_date=20250321
+    """
+    if not TRACE_ENABLED:
+        yield None
+        return
+
+    if TRACE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    stack = _stack()
+    current = Span(name, attrs)
+    _observe_memory(stack)
+    current._mem0 = current._mem_max = tracemalloc.get_traced_memory()[0]
+    if stack:
+        stack[-1].children.append(current)
+    stack.append(current)
+    current._wall0, current._cpu0 = time.perf_counter(), time.process_time()
+    try:
+        yield current
+    finally:
+        current.wall = time.perf_counter() - current._wall0
+        current.cpu = time.process_time() - current._cpu0
+        _observe_memory(stack)
+        current.peak = current._mem_max - current._mem0
+        stack.pop()
+        if not stack:
+            logger.info("阶段耗时报告：\n" + format_span_tree(current))
+
+
+def traced(name=None):
+    """装饰器：整个函数作为一个 span"""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def format_span_tree(root):
+    """将 span 树格式化为文本，每行一个阶段"""
+    lines = []
+
+    def walk(node, prefix, is_last, depth):
+        branch = "" if depth == 0 else ("└─ " if is_last else "├─ ")
+        attrs = " ".join(f"{key}={value}" for key, value in node.attrs.items())
+        label = f"{prefix}{branch}{node.name}" + (f" ({attrs})" if attrs else "")
+        line = f"{label:<50} wall={node.wall:8.3f}s cpu={node.cpu:8.3f}s"
+        if TRACE_MEMORY:
+            line += f" peak={node.peak / 1024 / 1024:8.2f}MB"
+        lines.append(line)
+        child_prefix = prefix if depth == 0 else prefix + ("   " if is_last else "│  ")
+        for i, child in enumerate(node.children):
+            walk(child, child_prefix, i == len(node.children) - 1, depth + 1)
+
+    walk(root, "", True, 0)
+    return "\n".join(lines)
+
+
+# 线程空闲等待时的栈顶函数，采样时忽略（日志队列监听、线程池空闲 worker 等）
+IDLE_FRAMES = {"threading.py:wait", "handlers.py:dequeue", "thread.py:_worker", "queue.py:get"}
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler(object):
+    """
+    采样调用栈：后台线程每隔 interval 秒记录其他线程的调用栈
+
+    结果为折叠栈格式（每行 'a;b;c 次数'），可直接用于 flamegraph.pl、speedscope 等火焰图工具。
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if names[0] in IDLE_FRAMES:
+                    continue
+                self.samples[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        return [f"{stack} {count}" for stack, count in self.samples.most_common()]
+
+
+def _func_label(func):
+    filename, _, name = func
+    return f"{os.path.basename(filename)}:{name}"
+
+
+def pstats_to_collapsed(stats, max_depth=64, min_fraction=1e-3):
+    """
+    将 cProfile 结果转换为折叠栈格式（单位：微秒）
+
+    cProfile 只记录调用方 -> 被调用方的边，这里从没有调用方的根函数出发，
+    按各调用方占被调用方累计时间的比例分摊耗时，得到近似的完整调用栈。
+    分摊后累计时间小于总耗时 min_fraction 的分支不再展开，避免调用图路径数量爆炸。
+    """
+    raw = stats.stats  # func -> (cc, nc, tt, ct, callers)
+    children = collections.defaultdict(list)
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, caller_stats in callers.items():
+            children[caller].append((func, caller_stats[3]))  # 经由该调用方的累计时间
+
+    roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+    min_time = sum(raw[func][3] for func in roots) * min_fraction
+    lines = collections.Counter()
+
+    def walk(func, path, weight):
+        _, _, tt, ct, _ = raw[func]
+        path = path + [func]
+        if tt * weight > 0:
+            lines[";".join(_func_label(item) for item in path)] += tt * weight
+        if len(path) >= max_depth:
+            return
+        for child, edge_ct in children.get(func, ()):
+            child_ct = raw[child][3]
+            if child_ct <= 0 or child in path:
+                continue
+            child_weight = weight * min(edge_ct / child_ct, 1.0)
+            if child_ct * child_weight >= min_time:
+                walk(child, path, child_weight)
+
+    for func in roots:
+        if raw[func][3] >= min_time:
+            walk(func, [], 1.0)
+    return [f"{stack} {int(value * 1e6)}" for stack, value in lines.most_common() if int(value * 1e6) > 0]
+
+
+class _RunProfiler(object):
+    """整个运行期间的 cProfile / 采样器，退出时写入 logs/profile_{名称}_{时间}.*"""
+
+    def __init__(self, mode, name):
+        if mode not in ("cprofile", "sample"):
+            raise ValueError(f"不支持的 STOCK_PROFILE: {mode}，可选 cprofile / sample")
+        self.mode = mode
+        self.base = os.path.join(dc.log_dir, f"profile_{name}_{get_formatted_time()}")
+        self._profiler = cProfile.Profile() if mode == "cprofile" else SamplingProfiler()
+
+    def start(self):
+        if self.mode == "cprofile":
+            self._profiler.enable()
+        else:
+            self._profiler.start()
+
+    def stop(self):
+        if self.mode == "cprofile":
+            self._profiler.disable()
+            self._profiler.dump_stats(f"{self.base}.prof")
+            collapsed = pstats_to_collapsed(pstats.Stats(self._profiler))
+        else:
+            self._profiler.stop()
+            collapsed = self._profiler.collapsed()
+        with open(f"{self.base}.collapsed", "w", encoding="utf-8") as f:
+            f.write("\n".join(collapsed) + "\n")
+        logger.info(f"性能剖析结果已保存至 {self.base}.*（折叠栈格式可用于 flamegraph.pl / speedscope）")
+
+
+_run_profiler = None
+
+
+def start_profiling(mode=None, name=None):
+    """开始整个运行期间的性能剖析，进程退出时自动写出结果"""
+    global _run_profiler
+    mode = (mode or PROFILE_MODE).lower()
+    if not mode or _run_profiler is not None:
+        return
+    if name is None:
+        name = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+    _run_profiler = _RunProfiler(mode, name)
+    _run_profiler.start()
+    atexit.register(stop_profiling)
+
+
+def stop_profiling():
+    global _run_profiler
+    if _run_profiler is not None:
+        profiler, _run_profiler = _run_profiler, None
+        profiler.stop()
+
+
+if PROFILE_MODE and __name__ != "__main__":
+    start_profiling()
+
+
+if __name__ == "__main__":
+    # 用法：python tracing.py [--trace [--no-memory]] [--profile cprofile|sample] tushare_test4.py [参数...]
+    parser = argparse.ArgumentParser(description="带阶段追踪/性能剖析运行脚本")
+    parser.add_argument("--trace", action="store_true", help="记录各阶段耗时及峰值内存")
+    parser.add_argument("--no-memory", action="store_true", help="只记录耗时，不启用 tracemalloc")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="采集 cProfile 或采样调用栈")
+    parser.add_argument("script", help="要运行的脚本")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="脚本参数")
+    cli = parser.parse_args()
+
+    # 被运行的脚本导入的是 tracing 模块而不是 __main__，开关需设置在该模块上
+    import tracing
+
+    if cli.trace:
+        tracing.enable_tracing(memory=not cli.no_memory)
+    sys.argv = [cli.script] + cli.args
+    sys.path.insert(0, os.path.dirname(os.path.abspath(cli.script)))
+    if cli.profile or PROFILE_MODE:
+        tracing.start_profiling(cli.profile, os.path.splitext(os.path.basename(cli.script))[0])
+    runpy.run_path(cli.script, run_name="__main__")
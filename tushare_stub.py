@@ -0,0 +1,373 @@
+# filename: tushare_stub.py
+
+import collections
+import datetime
+import functools
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+
+# 各接口用于按日期过滤的字段
+DATE_FIELDS = {
+    "trade_cal": "cal_date",
+    "stock_basic": "list_date",
+    "fina_indicator_vip": "end_date",
+    "fina_indicator": "end_date",
+}
+
+# Tushare 权限/频率限制提示中附带的说明链接
+PERMISSION_DOC = "https://tushare.pro/document/1?doc_id=108"
+
+
+class FakeProApi(object):
+    """
+    Tushare Pro 客户端的离线替身，接口与 ts.pro_api() 返回的对象一致
+
+    数据通过 register() 以整表形式注册，查询时按参数过滤；
+    set_available_at() 可模拟数据在某个时刻之后才入库（配合可注入的 clock 使用）；
+    inject_latency() / inject_errors() 可模拟公网接口的长尾耗时及偶发错误。
+    """
+
+    def __init__(self, tables=None, clock=None):
+        self.tables = dict(tables or {})
+        self.clock = clock or datetime.datetime.now
+        self.calls = []  # 调用记录：(api_name, params)
+        self._available_at = {}  # (api_name, 日期) -> 入库时间
+        self._latency = None  # (基础耗时, 慢请求耗时, 慢请求比例)
+        self._errors = []  # 待抛出的异常，按调用顺序依次抛出
+        self._random = np.random.default_rng()
+        self._lock = threading.Lock()
+
+    def register(self, api_name, df):
+        """注册接口的整表数据"""
+        self.tables[api_name] = df.reset_index(drop=True)
+
+    def set_available_at(self, api_name, date, when):
+        """设置某接口某日期的数据在 when 之后才可查询"""
+        self._available_at[(api_name, str(date))] = when
+
+    def inject_latency(self, base=0.0, slow_delay=0.0, slow_ratio=0.0, seed=None):
+        """
+        每次查询先等待 base 秒，其中 slow_ratio 比例的查询再额外等待 slow_delay 秒
+
+        :param seed: 随机种子，固定后慢请求的分布可复现
+        """
+        self._latency = (base, slow_delay, slow_ratio)
+        self._random = np.random.default_rng(seed)
+
+    def inject_errors(self, *errors):
+        """接下来的查询依次抛出给定异常（每个异常一次），用于模拟超时、频率超限等错误"""
+        with self._lock:
+            self._errors.extend(errors)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.query, name)
+
+    def query(self, api_name, fields="", **params):
+        with self._lock:
+            self.calls.append((api_name, dict(params)))
+            error = self._errors.pop(0) if self._errors else None
+            slow = self._latency is not None and self._random.random() < self._latency[2]
+        if self._latency is not None:
+            time.sleep(self._latency[0] + (self._latency[1] if slow else 0))
+        if error is not None:
+            raise error
+
+        df = self.tables.get(api_name)
+        if df is None:
+            raise Exception(f"抱歉，您没有接口({api_name})访问权限")
+
+        date = params.get("trade_date") or params.get("period")
+        when = self._available_at.get((api_name, str(date)))
+        if when is not None and self.clock() < when:
+            return df.iloc[0:0]
+
+        df = self._filter(api_name, df, params)
+        if fields:
+            columns = [col for col in str(fields).split(",") if col in df.columns]
+            df = df[columns]
+        return df.reset_index(drop=True)
+
+    @staticmethod
+    def _filter(api_name, df, params):
+        date_field = DATE_FIELDS.get(api_name, "trade_date")
+        mask = np.ones(len(df), dtype=bool)
+        for key, value in params.items():
+            if value in (None, "") or key in ("offset", "limit", "update_flag", "exchange"):
+                continue
+            if key == "period":
+                key = "end_date"
+            if key == "start_date":
+                mask &= (df[date_field].astype(str) >= str(value)).to_numpy()
+            elif key == "end_date" and "end_date" not in df.columns:
+                mask &= (df[date_field].astype(str) <= str(value)).to_numpy()
+            elif key in df.columns:
+                values = str(value).split(",") if key == "ts_code" else [str(value)]
+                mask &= df[key].astype(str).isin(values).to_numpy()
+        df = df[mask]
+
+        offset = int(params.get("offset") or 0)
+        limit = params.get("limit")
+        if offset or limit:
+            df = df.iloc[offset:offset + int(limit) if limit else None]
+        return df
+
+    def call_count(self, api_name=None):
+        """统计调用次数"""
+        return sum(1 for name, _ in self.calls if api_name is None or name == api_name)
+
+    def for_token(self, token, per_minute=None, per_day=None, apis=None, clock=time.monotonic):
+        """共用本替身数据、按 token 模拟访问次数限制及接口权限的客户端，见 FakeTokenApi"""
+        return FakeTokenApi(self, token, per_minute, per_day, apis, clock)
+
+
+class FakeTokenApi(object):
+    """
+    单个 token 的离线客户端：数据来自共用的 FakeProApi，按接口模拟每分钟/每天访问次数上限及接口权限
+
+    超限或无权限时抛出与 Tushare 相同措辞的异常，用于测试 token 池的调度与切换。
+    """
+
+    def __init__(self, pro, token, per_minute=None, per_day=None, apis=None, clock=time.monotonic):
+        """
+        :param per_minute: 每个接口每分钟最多访问次数，None 表示不限
+        :param per_day: 每个接口每天最多访问次数，None 表示不限
+        :param apis: 有权限的接口，None 表示全部
+        """
+        self.pro = pro
+        self.token = token
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self.apis = set(apis) if apis is not None else None
+        self.clock = clock
+        self.calls = collections.Counter()  # 接口 -> 成功调用次数
+        self.rejected = collections.Counter()  # 接口 -> 被拒绝次数
+        self._windows = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.query, name)
+
+    def query(self, api_name, fields="", **params):
+        with self._lock:
+            if self.apis is not None and api_name not in self.apis:
+                self.rejected[api_name] += 1
+                raise Exception(f"抱歉，您没有接口({api_name})访问权限，权限的具体详情访问：{PERMISSION_DOC}。")
+            now = self.clock()
+            window = self._windows[api_name]
+            while window and window[0] <= now - 60:
+                window.popleft()
+            if self.per_minute is not None and len(window) >= self.per_minute:
+                self.rejected[api_name] += 1
+                raise Exception(f"抱歉，您每分钟最多访问该接口{self.per_minute}次，权限的具体详情访问：{PERMISSION_DOC}。")
+            if self.per_day is not None and self.calls[api_name] >= self.per_day:
+                self.rejected[api_name] += 1
+                raise Exception(f"抱歉，您每天最多访问该接口{self.per_day}次，权限的具体详情访问：{PERMISSION_DOC}。")
+            window.append(now)
+            self.calls[api_name] += 1
+        return self.pro.query(api_name, fields=fields, **params)
+
+
+class _TushareHandler(BaseHTTPRequestHandler):
+    """按 Tushare HTTP 协议应答：POST /dataapi/{api_name}，返回 {code, msg, data: {fields, items}}"""
+
+    protocol_version = "HTTP/1.1"  # 支持 keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.stub.connections += 1
+        if self.server.stub.handshake_delay:
+            time.sleep(self.server.stub.handshake_delay)  # 模拟新连接的建连开销（TCP/TLS 握手）
+
+    def do_POST(self):
+        stub = self.server.stub
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if stub.latency:
+            time.sleep(stub.latency)
+
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        payload = stub.responses.get((raw, gzipped))
+        if payload is None:
+            payload = self._render(stub, json.loads(raw or b"{}"), gzipped)
+            stub.responses[(raw, gzipped)] = payload  # 相同请求直接返回，避免替身本身成为瓶颈
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    @staticmethod
+    def _render(stub, body, gzipped):
+        params = dict(body.get("params") or {})
+        params.pop("ts_type_name", None)
+        try:
+            df = stub.pro.query(body.get("api_name"), fields=body.get("fields", ""), **params)
+            items = df.astype(object).where(df.notna(), None).to_numpy().tolist()
+            result = {"code": 0, "msg": "", "data": {"fields": list(df.columns), "items": items}}
+        except Exception as e:
+            result = {"code": 40203, "msg": str(e), "data": None}
+
+        payload = json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")
+        return gzip.compress(payload, compresslevel=1) if gzipped else payload
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # 默认 5，几十个线程同时建连时会被重置
+
+
+class FakeTushareServer(object):
+    """
+    本地 HTTP 替身服务，数据来自 FakeProApi，用于测试/对比 HTTP 传输层（tushare_transport.py）
+
+    用法：
+        with FakeTushareServer(FakeProApi(make_sample_market())) as server:
+            api = PooledProApi("token", url=server.url)
+    """
+
+    def __init__(self, pro, host="127.0.0.1", port=0, handshake_delay=0.0, latency=0.0):
+        """
+        :param pro: FakeProApi
+        :param port: 0 表示随机端口
+        :param handshake_delay: 每个新连接的额外延迟（秒）
+        :param latency: 每次请求的额外延迟（秒）
+        """
+        self.pro = pro
+        self.handshake_delay = handshake_delay
+        self.latency = latency
+        self.connections = 0  # 已建立的连接数
+        self.responses = {}  # (请求体, 是否 gzip) -> 响应体
+        self._server = _ThreadingServer((host, port), _TushareHandler)
+        self._server.stub = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/dataapi"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-tushare", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def make_sample_market(n_stocks=300, start_date="20250101", end_date="20250331", quarters=None, seed=0):
+    """
+    生成一份可复现的模拟行情/财务数据
+
+    :return: {api_name: DataFrame}，可直接传给 FakeProApi
+    """
+    rng = np.random.default_rng(seed)
+    ts_codes = [f"{600000 + i:06d}.SH" if i % 2 else f"{i + 1:06d}.SZ" for i in range(n_stocks)]
+
+    calendar = pd.date_range(f"{start_date[:4]}0101", f"{end_date[:4]}1231")
+    trade_cal = pd.DataFrame({
+        "exchange": "SSE",
+        "cal_date": calendar.strftime("%Y%m%d"),
+        "is_open": (calendar.weekday < 5).astype(int),
+    })
+    trade_dates = [d for d, o in zip(trade_cal["cal_date"], trade_cal["is_open"])
+                   if o == 1 and start_date <= d <= end_date]
+
+    stock_basic = pd.DataFrame({
+        "ts_code": ts_codes,
+        "symbol": [code[:6] for code in ts_codes],
+        "name": [f"ST股票{i}" if i % 50 == 0 else f"股票{i}" for i in range(n_stocks)],
+        "area": rng.choice(["北京", "上海", "深圳"], n_stocks),
+        "industry": rng.choice(["银行", "软件服务", "汽车配件", "白酒"], n_stocks),
+        "market": rng.choice(["主板", "创业板"], n_stocks, p=[0.7, 0.3]),
+        "list_status": "L",
+        "list_date": rng.choice(["20000101", "20150601", "20240101"], n_stocks),
+        "act_ent_type": rng.choice(["地方国企", "民营企业", "中央国企"], n_stocks),
+    })
+
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, (len(trade_dates), n_stocks)), axis=0))
+    pre_close = np.vstack([close[:1] / (1 + rng.normal(0, 0.02, n_stocks)), close[:-1]])
+    daily = pd.DataFrame({
+        "ts_code": np.tile(ts_codes, len(trade_dates)),
+        "trade_date": np.repeat(trade_dates, n_stocks),
+        "open": (pre_close * (1 + rng.normal(0, 0.005, close.shape))).ravel().round(2),
+        "high": (np.maximum(close, pre_close) * 1.01).ravel().round(2),
+        "low": (np.minimum(close, pre_close) * 0.99).ravel().round(2),
+        "close": close.ravel().round(2),
+        "pre_close": pre_close.ravel().round(2),
+        "vol": rng.integers(1000, 100000, close.size).astype(float),
+        "amount": rng.random(close.size) * 1e6,
+    })
+    daily["change"] = (daily["close"] - daily["pre_close"]).round(2)
+    daily["pct_chg"] = (daily["change"] / daily["pre_close"] * 100).round(4)
+
+    daily_basic = pd.DataFrame({
+        "ts_code": daily["ts_code"],
+        "trade_date": daily["trade_date"],
+        "close": daily["close"],
+        "turnover_rate": rng.random(len(daily)) * 10,
+        "volume_ratio": rng.random(len(daily)) * 3,
+        "pe": rng.random(len(daily)) * 60,
+        "pb": rng.random(len(daily)) * 8,
+        "total_mv": rng.random(len(daily)) * 2e7,
+        "circ_mv": rng.random(len(daily)) * 2e7,
+    })
+
+    if quarters is None:
+        quarters = ["20231231", "20240331", "20240630", "20240930"]
+    fina = pd.DataFrame({
+        "ts_code": np.tile(ts_codes, len(quarters)),
+        "end_date": np.repeat(quarters, n_stocks),
+        "roe": rng.normal(5, 4, n_stocks * len(quarters)).round(4),
+        "q_netprofit_yoy": rng.normal(5, 30, n_stocks * len(quarters)).round(4),
+        "debt_to_assets": (rng.random(n_stocks * len(quarters)) * 100).round(4),
+        "update_flag": "1",
+    })
+    # 公告日期：报告期后约一个月
+    fina["ann_date"] = (pd.to_datetime(fina["end_date"]) + pd.Timedelta(days=30)).dt.strftime("%Y%m%d")
+
+    return {
+        "trade_cal": trade_cal,
+        "stock_basic": stock_basic,
+        "daily": daily,
+        "daily_basic": daily_basic,
+        "fina_indicator_vip": fina,
+    }
+
+
+def install_fake_pro(fake):
+    """用离线替身替换全局客户端 dc.pro，返回原客户端以便恢复"""
+    previous = dc.pro
+    dc.pro = fake
+    return previous
+
+
+if __name__ == "__main__":
+    fake_pro = FakeProApi(make_sample_market())
+    print(fake_pro.daily(trade_date="20250321").head())
+    print(fake_pro.trade_cal(start_date="20250301", end_date="20250310"))
+    print(fake_pro.call_count())
@@ -6,22 +6,27 @@ import sys
 import pandas as pd
 
 from data_cache import dc
-from stock_utils import setup_logger, get_last_trade_date, fetch_daily_basic, load_csv
+from screen_rules import build_selection_rules, apply_rules
+from security_master import merge_on_sid, symbol_set
+from stage_fingerprint import StageFingerprint, remove_stage_output
+from stock_utils import setup_logger, get_last_trade_date, fetch_daily_basic, load_csv, log_stage_summary
+from tracing import span, traced
 from tushare_test1 import test1
 
 logger = setup_logger()
 
 
+@traced("filter2")
 def test2(last_trade_date):
     try:
         # 保存结果
         output_path = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter2_{last_trade_date}.csv")
-        if os.path.exists(output_path):
-            logger.error(f"筛选结果 CSV 文件已存在，将无法写入: {output_path}")
-            sys.exit(0)
 
-        # 加载基础筛选结果（csv1）
-        df_basic = load_csv("tushare_stock_basic_filter1", test1, last_trade_date)
+        # 加载基础筛选结果（csv1），filter1 未变化时直接复用
+        filter1_path = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter1_{last_trade_date}.csv")
+        with span("load", source="filter1"):
+            test1(last_trade_date)
+            df_basic = pd.read_csv(filter1_path)
         logger.info(f"基础筛选结果（csv1）股票数量：{len(df_basic)}")
 
         # 加载日线行情数据（csv2）
@@ -29,17 +34,30 @@ def test2(last_trade_date):
         # logger.info(f"日线行情数据（csv2）股票数量：{len(df_daily)}")
 
         # 加载每日指标数据（csv3）
-        df_daily_basic = load_csv("tushare_daily_basic", fetch_daily_basic, last_trade_date)
+        with span("load", source="daily_basic"):
+            df_daily_basic = load_csv("tushare_daily_basic", fetch_daily_basic, last_trade_date)
         logger.info(f"每日指标数据（csv3）股票数量：{len(df_daily_basic)}")
+        if df_daily_basic.empty:
+            logger.error(f"{last_trade_date} 没有每日指标数据，不生成 filter2 结果")
+            remove_stage_output(output_path)
+            return
+
+        # filter1 结果、每日指标、流通市值阈值及代码均未变化时复用已有结果
+        fingerprint = StageFingerprint("filter2", output_path).add_file("filter1", filter1_path) \
+            .add_input("daily_basic", os.path.join(dc.csv_dir, f"tushare_daily_basic_{last_trade_date}.csv"),
+                       df_daily_basic) \
+            .add_config("circ_mv", dc.circ_mv).add_code(test2, apply_rules, merge_on_sid)
+        if fingerprint.is_fresh():
+            return
 
         # 检查 csv2 和 csv3 是否包含 csv1 的所有股票
         # missing_in_csv2 = set(df_basic["ts_code"]) - set(df_daily["ts_code"])
         # if missing_in_csv2:
         #     logger.warning(f"csv2 中缺少以下股票 [今天可能停牌] ：{missing_in_csv2}")
 
-        missing_in_csv3 = set(df_basic["ts_code"]) - set(df_daily_basic["ts_code"])
+        missing_in_csv3 = symbol_set(df_basic) - symbol_set(df_daily_basic)
         if missing_in_csv3:
-            logger.warning(f"csv3 中缺少以下股票 [可能今天停牌] ：{missing_in_csv3}")
+            logger.warning(f"csv3 中缺少以下股票 [可能今天停牌] ：{set(missing_in_csv3.codes())}")
 
         # 仅合并 csv1 中包含的股票
         # 如果 csv2 或 csv3 中没有 csv1 中某些股票的数据，pd.merge 的 how="inner" 会将这些股票从结果中排除。
@@ -48,18 +66,22 @@ def test2(last_trade_date):
         # df_merged = pd.merge(df_merged, df_daily_basic, on="ts_code", how="left")
         # logger.info(f"合并后（csv1 + csv2 + csv3）股票数量：{len(df_merged)}")
 
-        df_merged = pd.merge(df_basic, df_daily_basic, on="ts_code", how="left")
+        # 两表均按证券 ID 排序，按 sid 二分对齐，不做字符串连接
+        with span("merge"):
+            df_merged = merge_on_sid(df_basic, df_daily_basic, how="left")
         logger.info(f"合并后（csv1 + csv3）股票数量：{len(df_merged)}")
 
         # 筛选条件：流通市值（单位：万元） <= 10,000,000万元（即1000亿元）
-        df_filtered = df_merged[
-            (df_merged["circ_mv"] <= dc.circ_mv)  # 流通市值（单位：万元） <= 1000 亿
-            # & (df_merged["pe"].between(5, 50))  # 市盈率在 5 到 50 之间
-        ]
+        with span("filter"):
+            df_filtered = apply_rules(df_merged, build_selection_rules("daily_basic"))
         logger.info(f"筛选后股票数量：{len(df_filtered)}")
 
-        df_filtered.to_csv(output_path, index=False, encoding="utf-8_sig")
+        with span("write"):
+            df_filtered.to_csv(output_path, index=False, encoding="utf-8_sig")
+        fingerprint.save()
         logger.info(f"筛选结果已保存至：{output_path}")
+        log_stage_summary(logger, "filter2", trade_date=last_trade_date, rows_in=len(df_basic),
+                          rows_out=len(df_filtered))
 
     except Exception as e:
         logger.error(f"程序运行异常：{str(e)}", exc_info=True)
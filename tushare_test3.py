@@ -2,149 +2,177 @@
 
 import os
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
+import numpy as np
 import pandas as pd
-from tqdm import tqdm
 
 from data_cache import dc
+from quarter_panel import load_quarter_panel, screen_quarter_panel, build_quarter_rules
+from security_master import SID_COLUMN, align_positions, attach_ids
+from stage_fingerprint import StageFingerprint, remove_stage_output
 from stock_utils import setup_logger, get_last_trade_date, get_quarter_end_dates, \
-    fetch_fina_indicator_vip_by_quarter_str
+    fetch_fina_indicator_vip_by_quarter_str, log_stage_summary
+from tracing import span, traced
 from tushare_test2 import test2
 
 logger = setup_logger()
 
-MAX_WORKERS = 28  # 根据实际网络情况和系统资源调整
 
+def align_financials(df, financial_data, fields):
+    """
+    按证券 ID 将财务指标按位置对齐到 df 的每一行（两表均按 sid 排序，只做一次二分查找）
 
-def process_stock(row, financial_dict):
-    """处理单个股票的财务数据筛选"""
-    ts_code = row['ts_code']
-
-    financial_data = financial_dict.get(ts_code)
-    if not financial_data:
-        return None
-
-    try:
-        # 转换为float类型防止类型错误
-        roe = float(financial_data['roe'])  # "净资产收益率"
-        q_netprofit_yoy = float(financial_data['q_netprofit_yoy'])  # "归属母公司股东的净利润同比增长率(%)(单季度)"
-        debt_to_assets = float(financial_data['debt_to_assets'])  # "资产负债率"
-    except (ValueError, KeyError) as e:
-        logger.debug(f"{ts_code} 财务数据异常: {str(e)}")
-        return None
+    :return: {字段: 与 df 行对齐的 float 数组}，没有财务数据或无法转换为数值时为 NaN
+    """
+    financial_data = attach_ids(financial_data.drop_duplicates(subset='ts_code', keep='last'))
+    positions = align_positions(financial_data[SID_COLUMN].to_numpy(), df[SID_COLUMN].to_numpy())
+    found = positions >= 0
+    aligned = {}
+    for field in fields:
+        if field not in financial_data.columns:
+            aligned[field] = np.full(len(df), np.nan)
+            continue
+        values = pd.to_numeric(financial_data[field], errors='coerce').to_numpy(dtype=float)
+        aligned[field] = np.where(found, values[np.where(found, positions, 0)], np.nan)
+    return aligned
+
+
+def screen_financials(df, financial_data):
+    """
+    财务指标筛选：ROE >= dc.roe、单季度净利润同比增长率 > dc.q_netprofit_yoy、资产负债率 < dc.debt_to_assets
 
-    # 筛选条件:ROE＞=4%、净利润增长率（同比）＞0%、资产负债率＜80%
-    if roe >= dc.roe and q_netprofit_yoy > dc.q_netprofit_yoy and debt_to_assets < dc.debt_to_assets:
-        # print(f'roe: {roe}, q_netprofit_yoy: {q_netprofit_yoy}, debt_to_assets: {debt_to_assets}')
-        return row
-    return None
+    没有该报告期财务数据或指标缺失的股票不入选。
+    """
+    aligned = align_financials(df, financial_data, ['roe', 'q_netprofit_yoy', 'debt_to_assets'])
+    # 与 NaN 比较均为 False，缺失数据自然被排除
+    passed = (aligned['roe'] >= dc.roe) & (aligned['q_netprofit_yoy'] > dc.q_netprofit_yoy) & \
+             (aligned['debt_to_assets'] < dc.debt_to_assets)
+    return df[passed]
 
 
 def filter_stocks_by_financials(trade_date, quarter_str):
     """根据财务数据筛选股票（多线程版本）"""
     input_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter2_{trade_date}.csv")
-    if not os.path.exists(input_file):
-        logger.error(f"未找到输入文件: {input_file}，重新生成...")
-        test2(trade_date)
-
-    df = pd.read_csv(input_file)
-    logger.info(f"初始股票总数: {df.shape[0]}")
-
-    # 获取季度财务数据并建立快速索引
-    quarter_financial_data = fetch_fina_indicator_vip_by_quarter_str(quarter_str)
-    financial_dict = quarter_financial_data.set_index('ts_code').to_dict('index')
-
-    filtered_stocks = []
-
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # 创建任务列表
-        tasks = [
-            executor.submit(process_stock, row.to_dict(), financial_dict)
-            for _, row in df.iterrows()
-        ]
-
-        # 使用tqdm显示进度
-        with tqdm(total=len(tasks), desc="处理财务数据") as pbar:
-            for future in as_completed(tasks):
-                result = future.result()
-                if result:
-                    filtered_stocks.append(result)
-                pbar.update(1)
-
-    logger.info(f"符合筛选条件的股票数量: {len(filtered_stocks)}")
-
-    if filtered_stocks:
-        result_df = pd.DataFrame(filtered_stocks)
-        output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter3_{trade_date}_{quarter_str}.csv")
-
-        # 保留原始列顺序
-        result_df = result_df[df.columns.to_list()]
-
-        if os.path.exists(output_file):
-            logger.warning(f"筛选结果 CSV 文件已存在： {output_file}")
-        else:
+    output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter3_{trade_date}_{quarter_str}.csv")
+
+    # filter2 未变化时直接复用
+    test2(trade_date)
+
+    with span("load", quarter=quarter_str):
+        quarter_financial_data = fetch_fina_indicator_vip_by_quarter_str(quarter_str)
+        if quarter_financial_data is None:
+            logger.error(f"{quarter_str} 没有财务数据")
+            remove_stage_output(output_file)
+            return None
+        if not os.path.exists(input_file):
+            logger.error(f"filter2 结果不存在：{input_file}")
+            remove_stage_output(output_file)
+            return None
+
+        # filter2 结果、该季度财务数据、财务阈值及代码均未变化时复用已有结果
+        fingerprint = StageFingerprint(f"filter3_{quarter_str}", output_file).add_file("filter2", input_file) \
+            .add_input("fina_indicator_vip", os.path.join(dc.csv_dir, f"tushare_fina_indicator_vip_{quarter_str}.csv"),
+                       quarter_financial_data) \
+            .add_config("fina", {"roe": dc.roe, "q_netprofit_yoy": dc.q_netprofit_yoy,
+                                 "debt_to_assets": dc.debt_to_assets}) \
+            .add_code(screen_financials, align_financials)
+        if fingerprint.is_fresh():
+            return output_file
+
+        df = attach_ids(pd.read_csv(input_file))
+        logger.info(f"初始股票总数: {df.shape[0]}")
+
+    # 财务数据按证券 ID 与 filter2 结果位置对齐后一次性筛选，结果保持 sid 顺序
+    with span("filter", quarter=quarter_str):
+        result_df = screen_financials(df, quarter_financial_data)
+
+    logger.info(f"符合筛选条件的股票数量: {len(result_df)}")
+    log_stage_summary(logger, "filter3", trade_date=trade_date, quarter=quarter_str, rows_in=df.shape[0],
+                      rows_out=len(result_df))
+
+    if not result_df.empty:
+        with span("write", quarter=quarter_str):
             result_df.to_csv(output_file, index=False, encoding="utf-8_sig")
-            logger.info(f"筛选结果已保存至 {output_file}")
+        fingerprint.save()
+        logger.info(f"筛选结果已保存至 {output_file}")
         return output_file
     else:
         logger.error("未找到符合条件的股票")
+        remove_stage_output(output_file)
         return None
 
 
-def merge_csv_files(file1, file2, output_file):
-    """
-    合并两个CSV文件，保留两个文件中都有的记录
-    """
-    # 读取两个 CSV 文件
-    df1 = pd.read_csv(file1)
-    df2 = pd.read_csv(file2)
-
-    # 打印合并前的记录数量
-    logger.info(f"文件 {file1} 的记录数量: {df1.shape[0]}")
-    logger.info(f"文件 {file2} 的记录数量: {df2.shape[0]}")
-
-    # 合并两个 CSV 文件，保留两个文件中都有的记录
-    merged_df = pd.merge(df1, df2, on='ts_code', how='inner')  # 根据 'ts_code' 列合并
-
-    # 打印合并后的记录数量
-    logger.info(f"合并后的记录数量: {merged_df.shape[0]}")
+# 跨季度筛选的报告期：每个报告期均需满足财务阈值
+QUARTER_KEYS = ((2023, 'Q4'), (2024, 'Q3'))
 
-    # 保存合并后的结果
-    merged_df.to_csv(output_file, index=False, encoding="utf-8_sig")
-    logger.info(f"合并结果已保存至 {output_file}")
 
+def filter_stocks_by_quarter_panel(trade_date, end_dates, rules=None):
+    """
+    在多季度财务面板上一次完成跨季度筛选，不再逐季写出结果后再按文件合并
 
-def process_quarterly_data(year, quarter_key, last_trade_date):
-    """ 处理特定季度的股票筛选逻辑 """
-    quarter = get_quarter_end_dates(year)[quarter_key]
-    logger.info(f"最近交易日: {last_trade_date}, 财报时间: {quarter}")
-
-    output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter3_{last_trade_date}_{quarter}.csv")
-    if os.path.exists(output_file):
-        logger.warning(f"csv文件: {output_file} 存在，系统退出！")
-        sys.exit(0)
-
-    filter_stocks_by_financials(last_trade_date, quarter)
-    return output_file
+    :param trade_date: 交易日期
+    :param end_dates: 报告期列表
+    :param rules: QuarterRule 列表，默认每个报告期均满足 config.yaml 中的阈值
+    :return: 筛选结果文件路径，没有结果时返回 None
+    """
+    input_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter2_{trade_date}.csv")
+    output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter3_{trade_date}_merged.csv")
+    end_dates = sorted(set(str(d) for d in end_dates))
+    if rules is None:
+        rules = build_quarter_rules()
+
+    # filter2 未变化时直接复用
+    test2(trade_date)
+
+    with span("load", quarter=",".join(end_dates)):
+        if not os.path.exists(input_file):
+            logger.error(f"filter2 结果不存在：{input_file}")
+            remove_stage_output(output_file)
+            return None
+        panel = load_quarter_panel(end_dates, fields=sorted({rule.field for rule in rules}))
+
+        # filter2 结果、各季度财务数据、规则及代码均未变化时复用已有结果
+        fingerprint = StageFingerprint("filter3_merged", output_file).add_file("filter2", input_file)
+        quarter_index = panel.index.get_level_values("end_date")
+        for end_date in end_dates:
+            fingerprint.add_input(f"fina_indicator_vip_{end_date}",
+                                  os.path.join(dc.csv_dir, f"tushare_fina_indicator_vip_{end_date}.csv"),
+                                  panel[quarter_index == end_date])
+        fingerprint.add_config("rules", [list(rule) for rule in rules]) \
+            .add_code(filter_stocks_by_quarter_panel, screen_quarter_panel)
+        if fingerprint.is_fresh():
+            return output_file
+
+        df = attach_ids(pd.read_csv(input_file))
+        logger.info(f"初始股票总数: {df.shape[0]}")
+
+    with span("filter", quarter=",".join(end_dates)):
+        passing = screen_quarter_panel(panel, rules, end_dates)
+        result_df = df[df['ts_code'].isin(passing)]
+
+    logger.info(f"符合 {len(end_dates)} 个报告期筛选条件的股票数量: {len(result_df)}")
+    log_stage_summary(logger, "filter3", trade_date=trade_date, quarter=",".join(end_dates), rows_in=df.shape[0],
+                      rows_out=len(result_df))
+
+    if not result_df.empty:
+        with span("write", quarter=",".join(end_dates)):
+            result_df.to_csv(output_file, index=False, encoding="utf-8_sig")
+        fingerprint.save()
+        logger.info(f"筛选结果已保存至 {output_file}")
+        return output_file
+    else:
+        logger.error("未找到符合条件的股票")
+        remove_stage_output(output_file)
+        return None
 
 
+@traced("filter3")
 def test3(last_trade_date):
     try:
-
-        # 处理 2023 Q4
-        output_file1 = process_quarterly_data(2023, 'Q4', last_trade_date)
-
-        # 处理 2024 Q3
-        output_file2 = process_quarterly_data(2024, 'Q3', last_trade_date)
-
-        # 合并 CSV 文件
-        output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter3_{last_trade_date}_merged.csv")
-        if os.path.exists(output_file):
-            logger.warning(f"csv文件: {output_file} 存在，系统退出！")
-            sys.exit(0)
-
-        merge_csv_files(output_file1, output_file2, output_file)
+        # 2023 Q4 与 2024 Q3 在同一个财务面板上一次筛选
+        end_dates = [get_quarter_end_dates(year)[quarter_key] for year, quarter_key in QUARTER_KEYS]
+        logger.info(f"最近交易日: {last_trade_date}, 财报时间: {', '.join(end_dates)}")
+        return filter_stocks_by_quarter_panel(last_trade_date, end_dates)
 
     except KeyboardInterrupt:
         logger.error("检测到手动终止 (Ctrl + C)，程序已安全退出。")
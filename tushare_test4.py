@@ -6,78 +6,78 @@ import sys
 import pandas as pd
 
 from data_cache import dc
-from stock_utils import setup_logger, fetch_weekly, get_quarter_end_dates, auto_adjust_column_width, get_last_trade_date
-from tushare_test3 import test3
+from stock_utils import setup_logger, fetch_weekly, get_quarter_end_dates, write_excel_streaming, get_last_trade_date, \
+    log_stage_summary
+from result_stream import stream_merge
+from security_master import merge_on_sid
+from stage_fingerprint import StageFingerprint, remove_stage_output
+from tracing import span, traced
+from tushare_test3 import filter_stocks_by_financials
+from weekly_rank import rank_weekly_panel, format_rank_labels
 
 logger = setup_logger()
 
 
+@traced("filter4")
 def filter_stocks_by_weekly(trade_date):
     """根据财务数据筛选股票"""
     try:
         output_file = os.path.join(dc.filter_dir, f"tushare_stock_basic_filter4_{trade_date}.csv")
-        if os.path.exists(output_file):
-            logger.warning(f"筛选结果 CSV 文件已存在： {output_file}, 系统退出！")
-            sys.exit(0)
 
-        # 输入文件 csv1 和周报数据 csv2 文件路径
+        # 输入文件 csv1（指定报告期的 filter3 结果，未变化时直接复用）和周报数据 csv2
         quarter_list = get_quarter_end_dates(dc.period_year)
         quarter_end_date = quarter_list[dc.period_quarter]
-        filename = f"tushare_stock_basic_filter3_{trade_date}_{quarter_end_date}.csv"
-        input_file = os.path.join(dc.filter_dir, filename)
-        if not os.path.exists(input_file):
-            logger.error(f"未找到输入文件: {input_file}，重新生成...")
-            test3(trade_date)
+        input_file = filter_stocks_by_financials(trade_date, quarter_end_date)
+        if input_file is None:
+            logger.error(f"{quarter_end_date} 没有 filter3 筛选结果")
+            remove_stage_output(output_file)
+            return None
 
         # 获取周报数据 csv2
-        weekly_data = fetch_weekly(trade_date)
-        weekly_df = pd.DataFrame(weekly_data)
+        with span("load", source="weekly"):
+            weekly_data = fetch_weekly(trade_date)
+            weekly_df = pd.DataFrame(weekly_data)
         if weekly_df.shape[0] == 0:
             logger.error(f"周报 {trade_date} 数据为 {weekly_df.shape[0]}, 请确认API接口！")
             return None
         logger.info(f"周报 {trade_date} 获取股票总数: {weekly_df.shape[0]}")
 
+        # filter3 结果、周线数据、排名参数及代码均未变化时复用已有结果
+        fingerprint = StageFingerprint("filter4", output_file).add_file("filter3", input_file) \
+            .add_input("weekly", os.path.join(dc.csv_dir, f"tushare_weekly_{trade_date}.csv"), weekly_df) \
+            .add_config("rank", {"top_volume": dc.top_volume, "top_pct_chg": dc.top_pct_chg}) \
+            .add_code(filter_stocks_by_weekly, rank_weekly_panel, merge_on_sid)
+        if fingerprint.is_fresh():
+            return output_file
+
         # 读取输入文件 csv1
-        df = pd.read_csv(input_file)
+        with span("load", source="filter3"):
+            df = pd.read_csv(input_file)
         logger.info(f"初始股票总数: {df.shape[0]}")
 
         # 合并 csv1 和 csv2，基于 ts_code 进行合并
         # 只保留 df 和 weekly_df 中 ts_code 都存在的行。
         # 如果某个 ts_code 在 df 中存在但在 weekly_df 中不存在（或反之），则该行会被丢弃。
-        merged_df = pd.merge(df, weekly_df, on='ts_code', how='inner')
+        with span("merge"):
+            merged_df = merge_on_sid(df, weekly_df, how='inner')
         logger.info(f"合并后的股票数量: {merged_df.shape[0]}")
 
-        # 筛选周成交额前6名的股票
-        merged_df['amount'] = merged_df['amount'].astype(float)
-        sorted_by_vol = merged_df.sort_values(by='amount', ascending=False)
-        sorted_by_vol['volume_rank'] = sorted_by_vol['amount'].rank(method='min', ascending=False).astype(int)  # 正确排名
-        # top_volume = sorted_by_vol.head(6)
-        top_volume = sorted_by_vol.head(dc.top_volume)
-        logger.info(f"筛选后成交额前6名的股票数量: {top_volume.shape[0]}")
-
-        # 打印成交额排名的股票
-        logger.info("按成交额降序排列的前6名股票：")
-        logger.info(top_volume[['ts_code', 'name', 'amount', 'volume_rank']])
-
-        # 筛选周涨幅前3名的股票
-        merged_df['pct_chg'] = merged_df['pct_chg'].astype(float)
-        sorted_by_pct_chg = merged_df.sort_values(by='pct_chg', ascending=False)
-        sorted_by_pct_chg['pct_rank'] = sorted_by_pct_chg['pct_chg'].rank(method='min', ascending=False).astype(
-            int)  # 正确排名
-        # top_pct_chg = sorted_by_pct_chg.head(3)
-        top_pct_chg = sorted_by_pct_chg.head(dc.top_pct_chg)
-        logger.info(f"筛选后涨幅前3名的股票数量: {top_pct_chg.shape[0]}")
-
-        # 打印涨幅排名的股票
-        logger.info("按涨幅降序排列的前3名股票：")
-        logger.info(top_pct_chg[['ts_code', 'name', 'pct_chg', 'pct_rank']])
-
-        # 为成交额排名和涨幅排名分别标注排名类型
-        top_volume = top_volume.copy()
-        top_volume.loc[:, 'rank'] = top_volume['volume_rank'].apply(lambda x: f"周成交额排名 {x}")
-
-        top_pct_chg = top_pct_chg.copy()
-        top_pct_chg.loc[:, 'rank'] = top_pct_chg['pct_rank'].apply(lambda x: f"周涨幅排名 {x}")
+        # 一次分组部分选择得到成交额、涨幅前N名（不做整表排序）
+        with span("filter"):
+            ranks = rank_weekly_panel(merged_df, top_n={'amount': dc.top_volume, 'pct_chg': dc.top_pct_chg},
+                                      week_col='trade_date_y')
+            ranks['rank'] = format_rank_labels(ranks)
+            ranked_df = ranks[['ts_code', 'rank_type', 'rank']].merge(merged_df, on='ts_code', how='left')
+
+        top_volume = ranked_df[ranked_df['rank_type'] == 'amount']
+        logger.info(f"筛选后成交额前{dc.top_volume}名的股票数量: {top_volume.shape[0]}")
+        logger.info(f"按成交额降序排列的前{dc.top_volume}名股票：")
+        logger.info(top_volume[['ts_code', 'name', 'amount', 'rank']])
+
+        top_pct_chg = ranked_df[ranked_df['rank_type'] == 'pct_chg']
+        logger.info(f"筛选后涨幅前{dc.top_pct_chg}名的股票数量: {top_pct_chg.shape[0]}")
+        logger.info(f"按涨幅降序排列的前{dc.top_pct_chg}名股票：")
+        logger.info(top_pct_chg[['ts_code', 'name', 'pct_chg', 'rank']])
 
         # filds = ['ts_code', 'name', 'area', 'industry', 'market', 'list_date', 'act_name',
         #          'act_ent_type', 'pct_chg', 'amount', 'trade_date_x', 'circ_mv', 'pe',
@@ -93,14 +93,19 @@ def filter_stocks_by_weekly(trade_date):
         final_stocks = final_stocks[filds]
 
         logger.info(f"最终筛选后的股票数量: {final_stocks.shape[0]}")
+        log_stage_summary(logger, "filter4", trade_date=trade_date, rows_in=df.shape[0],
+                          rows_merged=merged_df.shape[0], rows_out=final_stocks.shape[0])
 
         # 保存筛选结果
         if final_stocks.shape[0] > 0:
-            final_stocks.to_csv(output_file, index=False, encoding="utf-8_sig")
+            with span("write"):
+                final_stocks.to_csv(output_file, index=False, encoding="utf-8_sig")
+            fingerprint.save()
             logger.info(f"筛选结果已保存至 {output_file}")
             return output_file
         else:
             logger.error("未找到符合条件的股票")
+            remove_stage_output(output_file)
             return None
     except KeyboardInterrupt:
         logger.error("检测到手动终止 (Ctrl + C)，程序已安全退出。")
@@ -116,24 +121,18 @@ def main(last_trade_date):
     return test4(last_trade_date)
 
 
-def merge_csv(files, output_path):
-    # 读取第一个文件，保留表头
-    first_file = pd.read_csv(files[0])
+def merge_csv(files, output_path, dedupe_on=None):
+    """
+    流式合并多个交易日的筛选结果，逐块读取、逐块写出，内存占用不随交易日数量增长
 
-    # 读取其他文件，跳过表头
-    dfs = [first_file]  # 从第一个文件开始
-
-    for file in files[1:]:
-        # 跳过后续文件的表头，header=None
-        dfs.append(pd.read_csv(file, header=0))  # header=0 跳过表头
-
-    # 合并所有文件
-    merged_df = pd.concat(dfs, ignore_index=True)
-
-    # 保存合并后的结果，保留表头（只会有一个表头）
-    merged_df.to_csv(output_path, index=False, header=True, encoding="utf-8_sig")
-
-    return merged_df
+    :param files: 结果 CSV 列表（None 会被跳过）
+    :param output_path: 输出路径，.parquet 为列式输出
+    :param dedupe_on: 去重列，例如 ('trade_date_x', 'ts_code')
+    :return: 实际输出路径
+    """
+    with span("merge_history", files=len(files)):
+        path, _ = stream_merge(files, output_path, dedupe_on=dedupe_on)
+    return path
 
 
 def save_to_excel(df, excel_path, sheet_name="Sheet1"):
@@ -153,11 +152,8 @@ def save_to_excel(df, excel_path, sheet_name="Sheet1"):
     # 替换表头为中文
     df.rename(columns=columns_mapping, inplace=True)
 
-    # 保存到 Excel 文件
-    with pd.ExcelWriter(excel_path, engine="openpyxl") as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
-
-    auto_adjust_column_width(excel_path)
+    # 流式写入 Excel 文件，列宽在写入前计算
+    write_excel_streaming(df, excel_path, sheet_name=sheet_name)
     print(f"数据已成功保存到 Excel 文件: {excel_path}")
 
 
@@ -174,10 +170,11 @@ if __name__ == "__main__":
     #     temp_files.append(result)
     #
     # # 合并所有生成的 CSV 文件
-    # df = merge_csv(temp_files, os.path.join(dc.filter_dir, f'tushare_stock_basic_filter4_merged.csv'))
+    # merged_path = merge_csv(temp_files, os.path.join(dc.filter_dir, f'tushare_stock_basic_filter4_merged.csv'),
+    #                         dedupe_on=('trade_date_x', 'ts_code'))
     #
     # excel_path = os.path.join(dc.filter_dir, f'tushare_stock_basic_filter4_merged.xlsx')
-    # save_to_excel(df, excel_path, sheet_name="Sheet1")
+    # save_to_excel(pd.read_csv(merged_path), excel_path, sheet_name="Sheet1")
 
     # 获取最近交易日
     trade_date = get_last_trade_date()
@@ -0,0 +1,176 @@
+# filename: tushare_transport.py
+
+import functools
+import threading
+import time
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+# 与 tushare.pro.client.DataApi 相同的默认地址
+DEFAULT_URL = "http://api.waditu.com/dataapi"
+
+_logger = None
+
+
+def _get_logger():
+    # dc 初始化时即创建客户端，此时 stock_utils 尚不能导入，日志在首次使用时再初始化
+    global _logger
+    if _logger is None:
+        from stock_utils import setup_logger
+        _logger = setup_logger("tushare_transport")
+    return _logger
+
+
+class PooledProApi(object):
+    """
+    Tushare Pro 客户端的连接池版本，接口与 ts.pro_api() 返回的对象一致（pro.daily(...) / pro.query(...)）
+
+    - 所有线程共用一个 urllib3 连接池，连接保持 keep-alive，不再每次请求重新建立 TCP 连接
+    - 请求头声明接受 gzip，响应由 requests 自动解压
+    - 连接超时与读取超时分开设置
+    - 同时进行的请求数不超过 max_concurrency，多余的线程排队等待，避免几十个线程同时压向接口
+    """
+
+    def __init__(self, token, url=DEFAULT_URL, max_concurrency=8, pool_size=None, connect_timeout=5,
+                 read_timeout=30):
+        """
+        :param token: Tushare token
+        :param url: 接口地址，可指向本地替身服务用于测试
+        :param max_concurrency: 最大并发请求数
+        :param pool_size: 连接池大小，默认与 max_concurrency 相同
+        :param connect_timeout: 建立连接超时（秒）
+        :param read_timeout: 等待响应超时（秒）
+        """
+        self.token = token
+        self.url = url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or max_concurrency,
+                                    pool_block=True, max_retries=0)
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "seconds": 0.0, "wait_seconds": 0.0, "bytes": 0}
+
+    def _session(self):
+        """每个线程一个 Session（Session 本身不保证线程安全），底层共用同一个连接池"""
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            session.headers.update({"Accept-Encoding": "gzip", "Connection": "keep-alive"})
+            self._local.session = session
+        return session
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return functools.partial(self.query, name)
+
+    def query(self, api_name, fields="", **kwargs):
+        kwargs.setdefault("ts_type_name", self.url)  # 与 tushare 客户端请求体一致
+        req_params = {
+            "api_name": api_name,
+            "token": self.token,
+            "params": kwargs,
+            "fields": fields,
+        }
+
+        wait_start = time.perf_counter()
+        with self._slots:
+            start = time.perf_counter()
+            try:
+                res = self._session().post(f"{self.url}/{api_name}", json=req_params, timeout=self.timeout)
+            except requests.RequestException:
+                self._record(wait_start, start, 0, error=True)
+                raise
+            self._record(wait_start, start, len(res.content))
+
+        if not res:
+            # 502/503/429 等不是“无数据”，抛出 HTTPError 由调用方（容错层）按状态码决定是否重试
+            _get_logger().warning(f"接口 {api_name} 返回 HTTP {res.status_code}")
+            raise requests.HTTPError(f"接口 {api_name} 返回 HTTP {res.status_code}", response=res)
+        result = res.json()
+        if result["code"] != 0:
+            raise Exception(result["msg"])
+        data = result["data"]
+        return pd.DataFrame(data["items"], columns=data["fields"])
+
+    def _record(self, wait_start, start, size, error=False):
+        now = time.perf_counter()
+        with self._stats_lock:
+            self._stats["requests"] += 1
+            self._stats["errors"] += error
+            self._stats["seconds"] += now - start
+            self._stats["wait_seconds"] += start - wait_start
+            self._stats["bytes"] += size
+
+    def stats(self):
+        """请求统计：次数、失败数、请求耗时、排队等待时间、响应字节数（解压后）"""
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def close(self):
+        self._adapter.close()
+
+
+def create_pro_api(token, http_config=None):
+    """
+    按 config.yaml 中 http 配置创建 Tushare 客户端
+
+    :param http_config: transport 为 pooled（默认）时使用连接池客户端，default 时使用 tushare 自带客户端
+    """
+    http_config = dict(http_config or {})
+    transport = http_config.pop("transport", "pooled")
+    if transport == "default":
+        import tushare as ts
+        return ts.pro_api(token, timeout=http_config.get("read_timeout", 30))
+    if transport != "pooled":
+        raise ValueError(f"不支持的 transport: {transport}，可选 pooled / default")
+    return PooledProApi(token, **http_config)
+
+
+def benchmark(clients, api_name="daily", dates=(), workers=28, **params):
+    """
+    用多线程对多个客户端发起相同的一组查询，比较耗时
+
+    :param clients: {名称: 客户端}
+    :param dates: 交易日列表，每个日期一次请求
+    :param workers: 线程数
+    :return: {名称: 耗时秒数}
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    result = {}
+    for name, client in clients.items():
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            rows = sum(len(df) for df in executor.map(
+                lambda d: client.query(api_name, trade_date=d, **params), dates))
+        result[name] = time.perf_counter() - start
+        _get_logger().info(f"{name}: {len(dates)} 次请求，{rows} 行，耗时 {result[name]:.3f}s")
+    return result
+
+
+if __name__ == "__main__":
+    import tushare as ts
+
+    from tushare_stub import FakeProApi, FakeTushareServer, make_sample_market
+
+    market = make_sample_market(n_stocks=1000)
+    trade_dates = sorted(market["daily"]["trade_date"].astype(str).unique())
+    # 模拟公网环境：每个新连接 30ms 建连开销，每次请求 5ms 处理时间
+    with FakeTushareServer(FakeProApi(market), handshake_delay=0.03, latency=0.005) as server:
+        default_api = ts.pro_api("stub-token")
+        default_api._DataApi__http_url = server.url
+        pooled_api = PooledProApi("stub-token", url=server.url, max_concurrency=8)
+        benchmark({"warmup": pooled_api}, "daily", trade_dates)  # 预热替身服务的响应缓存
+        for name, client in (("default", default_api), ("pooled", pooled_api)):
+            connections = server.connections
+            benchmark({name: client}, "daily", trade_dates * 4)
+            _get_logger().info(f"{name}: 新建连接 {server.connections - connections} 个")
+        _get_logger().info(pooled_api.stats())
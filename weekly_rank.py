@@ -0,0 +1,108 @@
+# filename: weekly_rank.py
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import dc
+from stock_utils import setup_logger
+from write_behind import cached_exists, read_cached_csv
+
+logger = setup_logger()
+
+# 排名类型 -> 排名标签前缀
+RANK_LABELS = {
+    "amount": "周成交额排名",
+    "pct_chg": "周涨幅排名",
+}
+
+
+def load_weekly_panel(trade_dates):
+    """
+    读取多个周的本地周线数据，拼接为一个周线面板
+
+    :param trade_dates: 周最后一个交易日列表（YYYYMMDD）
+    :return: 包含 trade_date 列的周线面板 DataFrame
+    """
+    frames = []
+    for trade_date in trade_dates:
+        file_path = os.path.join(dc.csv_dir, f"tushare_weekly_{trade_date}.csv")
+        if not cached_exists(file_path):
+            logger.warning(f"周线数据文件不存在，跳过：{file_path}")
+            continue
+        frames.append(read_cached_csv(file_path, dtype={"trade_date": str}))
+
+    if not frames:
+        return pd.DataFrame(columns=["ts_code", "trade_date", "amount", "pct_chg"])
+    return pd.concat(frames, ignore_index=True)
+
+
+def rank_weekly_panel(panel, top_n=None, week_col="trade_date", by_industry=False, keep="first"):
+    """
+    对多周周线面板一次性计算每周成交额、涨幅前N名
+
+    每个指标只做一次分组部分选择（nlargest），不对整张表排序；
+    排名采用 method='min'，与原单周筛选的排名口径一致。
+
+    :param panel: 周线面板，至少包含 ts_code、week_col 以及待排名的指标列
+    :param top_n: {指标列: 前N名}，默认取 config.yaml 中的 top_volume / top_pct_chg
+    :param week_col: 表示周的列名（周最后一个交易日）
+    :param by_industry: 是否在行业内排名（需要 industry 列）
+    :param keep: 并列处理方式，'first' 与 head(n) 一致，'all' 保留边界上的并列
+    :return: 整洁排名表，列为 week, ts_code, [industry,] rank_type, rank
+    """
+    if top_n is None:
+        top_n = {"amount": dc.top_volume, "pct_chg": dc.top_pct_chg}
+
+    # 使用位置索引，方便按位置取回原始行
+    panel = panel.reset_index(drop=True)
+    keys = [week_col] + (["industry"] if by_industry else [])
+    groupers = [panel[key] for key in keys]
+
+    frames = []
+    for rank_type, n in top_n.items():
+        values = pd.to_numeric(panel[rank_type], errors="coerce")
+
+        # 每组部分选择前 n 名，结果已按指标降序排列
+        top = values.groupby(groupers, sort=False).nlargest(n, keep=keep)
+        if top.empty:
+            continue
+
+        # 入选集合包含所有更大的值，因此组内 min 排名即全市场（或全行业）排名
+        ranks = top.groupby(level=list(range(len(keys))), sort=False).rank(method="min", ascending=False)
+        positions = top.index.get_level_values(-1).to_numpy()
+
+        frame = {
+            "week": panel[week_col].to_numpy()[positions],
+            "ts_code": panel["ts_code"].to_numpy()[positions],
+        }
+        if by_industry:
+            frame["industry"] = panel["industry"].to_numpy()[positions]
+        frame["rank_type"] = rank_type
+        frame["rank"] = ranks.to_numpy().astype(np.int32)
+        frames.append(pd.DataFrame(frame))
+
+    columns = ["week", "ts_code"] + (["industry"] if by_industry else []) + ["rank_type", "rank"]
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)[columns]
+
+
+def format_rank_labels(ranks):
+    """将排名表转换为 '周成交额排名 1' 形式的标签（向量化）"""
+    return ranks["rank_type"].map(RANK_LABELS).fillna(ranks["rank_type"]) + " " + ranks["rank"].astype(str)
+
+
+if __name__ == "__main__":
+    from stock_utils import get_friday_trade_dates
+
+    weekly_panel = load_weekly_panel(get_friday_trade_dates(2025, 3))
+    logger.info(f"周线面板记录数：{len(weekly_panel)}")
+
+    rank_table = rank_weekly_panel(weekly_panel)
+    logger.info(rank_table)
+
+    rank_table = rank_weekly_panel(weekly_panel.merge(dc.pro.stock_basic(fields="ts_code,industry"), on="ts_code"),
+                                   by_industry=True)
+    logger.info(rank_table)
@@ -0,0 +1,251 @@
+# filename: write_behind.py
+
+import atexit
+import collections
+import io
+import os
+import threading
+import time
+
+import pandas as pd
+
+from data_cache import dc
+
+_logger = None
+
+
+def _get_logger():
+    # stock_utils 在模块加载时即导入本模块，日志在首次使用时再初始化
+    global _logger
+    if _logger is None:
+        from stock_utils import setup_logger
+        _logger = setup_logger("write_behind")
+    return _logger
+
+
+def _atomic_to_csv(path, df, to_csv_kwargs):
+    """先写临时文件再替换，读取方不会看到写了一半的文件"""
+    tmp_path = f"{path}.tmp"
+    df.to_csv(tmp_path, **to_csv_kwargs)
+    os.replace(tmp_path, path)
+
+
+class WriteBehindQueue(object):
+    """
+    缓存文件的后台写入队列
+
+    抓取函数调用 submit() 交出 DataFrame 后立即返回，由后台线程按批写入 CSV（临时文件 + 替换，保证原子性）；
+    写入完成前 read_csv() / exists() 直接使用队列中的数据，同一路径重复提交时只写最新的一份。
+    flush() 等待全部（或指定路径）写入完成，进程退出时自动 flush。
+    """
+
+    def __init__(self, batch_size=16, flush_interval=0.2, max_pending=256):
+        """
+        :param batch_size: 每批最多写入的文件数
+        :param flush_interval: 队列未满一批时，最多等待多久再写（秒），以便合并同一批的写入
+        :param max_pending: 队列中最多积压的文件数，超过时 submit() 阻塞等待，避免内存无限增长
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = collections.OrderedDict()  # 路径 -> (版本号, DataFrame, to_csv 参数)
+        self._version = 0
+        self._flushing = 0  # 正在等待 flush 的调用数，大于 0 时不再等待凑满一批
+        self._closed = False
+        self._counters = collections.Counter()
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._worker.start()
+
+    @staticmethod
+    def _key(path):
+        return os.path.abspath(path)
+
+    def submit(self, path, df, **to_csv_kwargs):
+        """提交写入，立即返回；调用方之后不应再修改 df"""
+        key = self._key(path)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("写入队列已关闭")
+            while len(self._pending) >= self.max_pending and key not in self._pending:
+                self._counters["blocked"] += 1
+                self._cond.wait()
+            if key in self._pending:
+                self._counters["coalesced"] += 1
+            self._version += 1
+            self._pending[key] = (self._version, df, to_csv_kwargs)
+            self._counters["submitted"] += 1
+            self._cond.notify_all()
+
+    def _pending_item(self, path):
+        with self._cond:
+            return self._pending.get(self._key(path))
+
+    def pending(self, path):
+        """尚未写入的 DataFrame，没有时返回 None"""
+        item = self._pending_item(path)
+        return None if item is None else item[1]
+
+    def exists(self, path):
+        return self.pending(path) is not None or os.path.exists(path)
+
+    def read_csv(self, path, **kwargs):
+        """
+        读取缓存文件，参数同 pd.read_csv
+
+        尚未写入时将队列中的数据按提交时的写入参数转为 CSV 文本再解析，列类型、缺失值与写入后读取磁盘文件一致
+        （抓取时为字符串的日期列同样按 CSV 推断为整数，需要字符串时由调用方传 dtype）。
+        """
+        item = self._pending_item(path)
+        if item is None:
+            return pd.read_csv(path, **kwargs)
+        _, df, to_csv_kwargs = item
+        text = df.to_csv(**{key: value for key, value in to_csv_kwargs.items() if key != "encoding"})
+        kwargs.pop("encoding", None)
+        return pd.read_csv(io.StringIO(text), **kwargs)
+
+    def _take_batch(self):
+        """取出一批待写入的项（调用方持有锁），写入完成前仍保留在队列中供读取"""
+        deadline = time.monotonic() + self.flush_interval
+        while not self._closed and not self._flushing and len(self._pending) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._cond.wait(remaining)
+        return [(key, item) for key, item in list(self._pending.items())[:self.batch_size]]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+                batch = self._take_batch()
+
+            start = time.perf_counter()
+            for key, (version, df, to_csv_kwargs) in batch:
+                try:
+                    _atomic_to_csv(key, df, to_csv_kwargs)
+                    result = "written"
+                except Exception as e:
+                    result = "failed"
+                    _get_logger().error(f"写入 {key} 失败：{e}", exc_info=True)
+                with self._cond:
+                    self._counters[result] += 1
+                    # 写入期间同一路径有新提交时保留新版本，由下一批写入
+                    if self._pending.get(key, (None,))[0] == version:
+                        del self._pending[key]
+                    self._cond.notify_all()
+            with self._cond:
+                self._counters["batches"] += 1
+            _get_logger().debug(f"写入 {len(batch)} 个文件，耗时 {time.perf_counter() - start:.3f}s")
+
+    def flush(self, path=None, timeout=None):
+        """
+        等待写入完成
+
+        :param path: 只等待该路径；为 None 时等待队列清空
+        :return: 是否在超时前完成
+        """
+        key = None if path is None else self._key(path)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._flushing += 1
+            self._cond.notify_all()
+            try:
+                while (self._pending if key is None else key in self._pending):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    self._cond.wait(remaining)
+                return True
+            finally:
+                self._flushing -= 1
+
+    def close(self):
+        """写完队列中的数据后停止后台线程"""
+        self.flush()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def stats(self):
+        with self._cond:
+            return dict(self._counters, pending=len(self._pending))
+
+
+_write_queue = None
+_write_queue_lock = threading.Lock()
+
+
+def get_write_queue():
+    """
+    获取进程内共享的写入队列（config.yaml 中 write_behind.enabled 为 false 时返回 None，即同步写入）
+    """
+    global _write_queue
+    config = dict(dc.write_behind_config)
+    if not config.pop("enabled", True):
+        return None
+    with _write_queue_lock:
+        if _write_queue is None:
+            _write_queue = WriteBehindQueue(**config)
+            atexit.register(_write_queue.close)
+        return _write_queue
+
+
+def save_csv(df, path, **to_csv_kwargs):
+    """保存缓存文件：启用写入队列时交给后台线程，否则同步原子写入"""
+    write_queue = get_write_queue()
+    if write_queue is None:
+        _atomic_to_csv(path, df, to_csv_kwargs)
+    else:
+        write_queue.submit(path, df, **to_csv_kwargs)
+
+
+def cached_exists(path):
+    """缓存文件是否存在（含尚未写入的）"""
+    return (_write_queue is not None and _write_queue.pending(path) is not None) or os.path.exists(path)
+
+
+def read_cached_csv(path, **kwargs):
+    """读取缓存文件（含尚未写入的），参数同 pd.read_csv"""
+    if _write_queue is not None:
+        return _write_queue.read_csv(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def flush_writes(path=None, timeout=None):
+    """
+    等待写入完成；需要直接读取磁盘文件（计算文件哈希、DuckDB 扫描目录等）前调用
+
+    :return: 是否在超时前完成
+    """
+    if _write_queue is None:
+        return True
+    return _write_queue.flush(path, timeout)
+
+
+if __name__ == "__main__":
+    import numpy as np
+
+    frames = {f"write_behind_demo_{i}.csv": pd.DataFrame(np.random.rand(50000, 8)) for i in range(8)}
+    paths = [os.path.join(dc.csv_dir, name) for name in frames]
+
+    start = time.perf_counter()
+    for path, df in zip(paths, frames.values()):
+        _atomic_to_csv(path, df, {"index": False})
+    _get_logger().info(f"同步写入 {len(paths)} 个文件，调用方等待 {time.perf_counter() - start:.3f}s")
+
+    write_queue = WriteBehindQueue()
+    start = time.perf_counter()
+    for path, df in zip(paths, frames.values()):
+        write_queue.submit(path, df, index=False)
+    _get_logger().info(f"写入队列：调用方等待 {time.perf_counter() - start:.3f}s")
+    _get_logger().info(f"写入完成前读取：{len(write_queue.read_csv(paths[-1]))} 行")
+    write_queue.flush()
+    _get_logger().info(f"全部写入完成，共 {time.perf_counter() - start:.3f}s，{write_queue.stats()}")
+    write_queue.close()
+    for path in paths:
+        os.remove(path)